@@ -0,0 +1,221 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, ClassVar, cast
+from uuid import UUID
+
+from fastapi import HTTPException, Request
+from sqladmin import ModelView
+from sqladmin._types import OperationColumnFilter as OperationFilter
+from sqladmin._types import SimpleColumnFilter
+from sqladmin.filters import OperationColumnFilter
+from sqladmin.pagination import PageControl, Pagination
+from sqlalchemy import Select, func, literal, select, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import selectinload
+from starlette.datastructures import URL
+
+from app.settings import settings
+
+
+CURSOR_PARAMS = ("after", "before")
+
+
+class ExactMatchFilter(OperationColumnFilter):
+    # Only equality, which an index can serve; "contains" would cast the
+    # column to text and scan the whole table.
+    def get_operation_options(self, column_obj: Any) -> list[tuple[str, str]]:
+        return [("equals", "Equals")]
+
+    async def get_filtered_query(
+        self, query: Select, operation: str, value: Any, model: Any
+    ) -> Select:
+        return await super().get_filtered_query(query, "equals", value, model)
+
+
+@dataclass
+class KeysetPagination(Pagination):
+    previous_cursor: str | None = None
+    next_cursor: str | None = None
+
+    def __post_init__(self) -> None:
+        # The count may be an estimate, so it must not clamp the page.
+        self.count = max(self.count, (self.page - 1) * self.page_size + len(self.rows))
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def add_pagination_urls(self, base_url: URL) -> None:
+        url = base_url.remove_query_params(CURSOR_PARAMS)
+        if self.previous_cursor is not None:
+            self.page_controls.append(
+                PageControl(
+                    self.page - 1,
+                    str(
+                        url.include_query_params(
+                            before=self.previous_cursor, page=self.page - 1
+                        )
+                    ),
+                )
+            )
+        self.page_controls.append(PageControl(self.page, str(base_url)))
+        if self.next_cursor is not None:
+            self.page_controls.append(
+                PageControl(
+                    self.page + 1,
+                    str(
+                        url.include_query_params(after=self.next_cursor, page=self.page + 1)
+                    ),
+                )
+            )
+
+
+class KeysetModelView(ModelView):
+    # Pages by (keyset_column, id) instead of OFFSET; the model needs an
+    # index on those columns (and on each filter column plus them).
+    # keyset_column names a timestamp column; the primary key is a UUID.
+    keyset_column: ClassVar[str]
+    exact_count_limit: ClassVar[int] = settings.admin_exact_count_limit
+
+    def _encode_cursor(self, row: Any, descending: bool) -> str:
+        key = getattr(row, self.keyset_column)
+        raw = (
+            f"{'desc' if descending else 'asc'}|{key.isoformat()}|"
+            f"{getattr(row, self.pk_columns[0].key)}"
+        )
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def _decode_cursor(
+        self, cursor: str | None, descending: bool
+    ) -> tuple[datetime, UUID] | None:
+        if not cursor:
+            return None
+        try:
+            order, key, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            timestamp = datetime.fromisoformat(key)
+            # Same rules as the API cursor: an offset is required and the
+            # date has to stay in range once moved to UTC.
+            if timestamp.tzinfo is None:
+                raise ValueError("Cursor without a time zone")
+            position = timestamp.astimezone(timezone.utc), UUID(pk)
+        except (ValueError, OverflowError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # The sort links keep the cursor; after a change of order it points
+        # into a different sequence, so start from the first page instead.
+        return position if order == ("desc" if descending else "asc") else None
+
+    async def _apply_filters(self, stmt: Select, request: Request) -> tuple[Select, bool]:
+        filtered = stmt
+        for column_filter in self.get_filters():
+            value = request.query_params.get(column_filter.parameter_name)
+            if not value:
+                continue
+            # Both filter protocols are runtime-checkable on attributes only,
+            # so isinstance cannot tell them apart; sqladmin goes by the flag.
+            if getattr(column_filter, "has_operator", False):
+                operation = request.query_params.get(f"{column_filter.parameter_name}_op")
+                if operation:
+                    filtered = await cast(OperationFilter, column_filter).get_filtered_query(
+                        filtered, operation, value, self.model
+                    )
+            else:
+                filtered = await cast(SimpleColumnFilter, column_filter).get_filtered_query(
+                    filtered, value, self.model
+                )
+        return filtered, filtered is not stmt
+
+    async def _estimate_count(self, stmt: Select) -> int:
+        sql = stmt.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+        async with self.session_maker() as session:
+            connection = await session.connection()
+            plan = (
+                await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")
+            ).scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    async def _count_rows(self, request: Request, stmt: Select, filtered: bool) -> int:
+        # Unfiltered, an exact COUNT(*) reads the whole table: the planner's
+        # estimate is good enough for the page footer. Filtered counts are
+        # exact up to a limit, so a broad filter costs at most that many rows.
+        if filtered:
+            count = await self.count(
+                request,
+                select(func.count()).select_from(
+                    stmt.limit(self.exact_count_limit + 1).subquery()
+                ),
+            )
+            if count <= self.exact_count_limit:
+                return count
+        return await self._estimate_count(stmt)
+
+    async def list(self, request: Request) -> Pagination:
+        page = self.validate_page_number(request.query_params.get("page"), 1)
+        page_size = self.validate_page_number(request.query_params.get("pageSize"), 0)
+        page_size = min(page_size or self.page_size, max(self.page_size_options))
+
+        stmt, filtered = await self._apply_filters(self.list_query(request), request)
+        search = request.query_params.get("search")
+        if search:
+            stmt = self.search_query(stmt=stmt, term=search)
+            filtered = True
+        count = await self._count_rows(request, stmt, filtered)
+
+        order = [getattr(self.model, self.keyset_column), self.pk_columns[0]]
+        key = tuple_(*order)
+        descending = not (
+            request.query_params.get("sortBy") == self.keyset_column
+            and request.query_params.get("sort") == "asc"
+        )
+        after = self._decode_cursor(request.query_params.get("after"), descending)
+        before = self._decode_cursor(request.query_params.get("before"), descending)
+        backwards = before is not None
+        if before is not None:
+            # Walk backwards from the cursor and flip the rows afterwards.
+            cursor = tuple_(*map(literal, before))
+            stmt = stmt.where(key > cursor if descending else key < cursor)
+        elif after is not None:
+            cursor = tuple_(*map(literal, after))
+            stmt = stmt.where(key < cursor if descending else key > cursor)
+        else:
+            page = 1
+
+        if descending != backwards:
+            stmt = stmt.order_by(*(column.desc() for column in order))
+        else:
+            stmt = stmt.order_by(*order)
+        for relation in self._list_relations:
+            stmt = stmt.options(selectinload(relation))
+
+        rows = list(await self._run_query(stmt.limit(page_size + 1)))
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = more, True
+            if not more:
+                page = 1
+        else:
+            has_previous, has_next = after is not None, more
+
+        return KeysetPagination(
+            rows=rows,
+            page=page,
+            page_size=page_size,
+            count=count,
+            previous_cursor=(
+                self._encode_cursor(rows[0], descending) if rows and has_previous else None
+            ),
+            next_cursor=(
+                self._encode_cursor(rows[-1], descending) if rows and has_next else None
+            ),
+        )
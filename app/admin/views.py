@@ -1,10 +1,20 @@
+from uuid import UUID
+
 from fastapi import Request
 from sqladmin import ModelView
 from sqladmin.authentication import AuthenticationBackend
+from sqladmin.filters import AllUniqueStringValuesFilter, StaticValuesFilter
+from sqlalchemy.ext.asyncio import async_object_session
 
+from app.admin.pagination import ExactMatchFilter, KeysetModelView
+from app.db.engine import admin_engine
 from app.deps.auth import auth_client
-from app.models.plan import Plan
+from app.models.plan import Plan, PlanStatus
 from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.subscription_rollup import SubscriptionRollup
+from app.services.entitlements import entitlement_cache
+from app.services.plan_catalog import plan_catalog
+from app.services.rollups import moved, subscription_rollups
 
 
 class AdminAuth(AuthenticationBackend):
@@ -30,7 +40,12 @@ class PlanAdmin(ModelView, model=Plan):
     ]
 
     column_searchable_list = [Plan.name]
-    column_filters = [Plan.currency, Plan.status]
+    column_filters = [
+        AllUniqueStringValuesFilter(Plan.currency),
+        StaticValuesFilter(
+            Plan.status, [(status.value, status.value) for status in PlanStatus]
+        ),
+    ]
 
     form_excluded_columns = [Plan.id]
 
@@ -39,8 +54,12 @@ class PlanAdmin(ModelView, model=Plan):
     can_delete = False
     can_view_details = True
 
+    async def after_model_change(self, data, model, is_created, request):
+        await plan_catalog.notify_changed(model.id)
+        await subscription_rollups.reprice(model.id)
 
-class SubscriptionAdmin(ModelView, model=Subscription):
+
+class SubscriptionAdmin(KeysetModelView, model=Subscription):
     name = "Subscription"
     name_plural = "Subscriptions"
 
@@ -52,12 +71,63 @@ class SubscriptionAdmin(ModelView, model=Subscription):
         Subscription.created_at,
     ]
 
-    column_filters = [Subscription.status, Subscription.plan_id]
+    # Each filter has an index on (column, created_at, id), so filtered
+    # pages are index range scans too.
+    column_filters = [
+        ExactMatchFilter(Subscription.user_id),
+        StaticValuesFilter(
+            Subscription.status,
+            [(status.value, status.value) for status in SubscriptionStatus],
+        ),
+    ]
     column_sortable_list = [Subscription.created_at]
+    keyset_column = "created_at"
 
     can_create = False
     can_delete = False
 
-    async def on_model_change(self, data, model, is_created):
+    async def on_model_change(self, data, model, is_created, request):
         if model.status == SubscriptionStatus.REFUNDED and not model.payment_id:
             raise ValueError("Refunded subscription must have payment")
+
+        # Called before the form data is applied, so the model still holds
+        # the old plan and status.
+        plan_id = UUID(str(data.get("plan_id", model.plan_id)))
+        status = SubscriptionStatus(data.get("status", model.status))
+        if not is_created and (plan_id, status) != (model.plan_id, model.status):
+            changes = moved(plan_id, None, status)
+            changes.update(moved(model.plan_id, None, model.status, -1))
+            session = async_object_session(model)
+            # sqladmin edits a model it loaded in its own session.
+            if session is None:
+                raise RuntimeError("Edited subscription is not attached to a session")
+            await subscription_rollups.record(session, changes)
+
+    async def after_model_change(self, data, model, is_created, request):
+        async with admin_engine.begin() as conn:
+            await entitlement_cache.notify_changed(conn, [model.user_id])
+
+
+class SubscriptionRollupAdmin(ModelView, model=SubscriptionRollup):
+    name = "Subscription rollup"
+    name_plural = "Subscription rollups"
+
+    column_list = [
+        SubscriptionRollup.plan_id,
+        SubscriptionRollup.status,
+        SubscriptionRollup.shard,
+        SubscriptionRollup.currency,
+        SubscriptionRollup.count,
+        SubscriptionRollup.amount,
+        SubscriptionRollup.updated_at,
+    ]
+
+    column_sortable_list = [SubscriptionRollup.count, SubscriptionRollup.amount]
+    column_default_sort = [
+        (SubscriptionRollup.plan_id, False),
+        (SubscriptionRollup.status, False),
+    ]
+
+    can_create = False
+    can_edit = False
+    can_delete = False
@@ -0,0 +1,34 @@
+from alembic import op
+
+
+revision = "0002_subs_user_created_at_idx"
+down_revision = "0001_create_subscription_tables"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE subscriptions "
+        "ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE "
+        "NOT NULL DEFAULT now()"
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscriptions_user_id_created_at_id",
+            "subscriptions",
+            ["user_id", "created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_subscriptions_user_id_created_at_id",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
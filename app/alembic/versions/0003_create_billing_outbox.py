@@ -0,0 +1,64 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0003_create_billing_outbox"
+down_revision = "0002_subs_user_created_at_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "billing_outbox",
+        sa.Column(
+            "id",
+            postgresql.UUID(as_uuid=True),
+            primary_key=True,
+            nullable=False,
+        ),
+        sa.Column(
+            "command",
+            sa.Enum("CREATE_PAYMENT", "CREATE_REFUND", name="outboxcommand"),
+            nullable=False,
+        ),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("PENDING", "SENT", "FAILED", name="outboxstatus"),
+            nullable=False,
+        ),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column(
+            "available_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+    op.create_index(
+        "ix_billing_outbox_pending_available_at",
+        "billing_outbox",
+        ["available_at"],
+        postgresql_where=sa.text("status = 'PENDING'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_billing_outbox_pending_available_at",
+        table_name="billing_outbox",
+    )
+    op.drop_table("billing_outbox")
+    sa.Enum(name="outboxstatus").drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name="outboxcommand").drop(op.get_bind(), checkfirst=True)
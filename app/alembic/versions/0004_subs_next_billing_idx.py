@@ -0,0 +1,35 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004_subs_next_billing_idx"
+down_revision = "0003_create_billing_outbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE subscriptions "
+        "ADD COLUMN IF NOT EXISTS next_billing_at TIMESTAMP WITH TIME ZONE"
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscriptions_active_next_billing_at",
+            "subscriptions",
+            ["next_billing_at"],
+            postgresql_where=sa.text("status = 'ACTIVE'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_subscriptions_active_next_billing_at",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,77 @@
+from datetime import date, datetime, time, timedelta, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005_partition_processed_events"
+down_revision = "0004_subs_next_billing_idx"
+branch_labels = None
+depends_on = None
+
+
+# Partitions for this many days back are created so recent rows of an
+# existing unpartitioned table can be carried over; the retention job
+# drops whatever falls out of its own window later.
+CARRY_OVER_DAYS = 7
+PREMAKE_DAYS = 3
+
+
+def _create_partition(day: date) -> None:
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS processed_events_p{day:%Y%m%d} "
+        f"PARTITION OF processed_events "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def upgrade() -> None:
+    existing = sa.inspect(op.get_bind()).has_table("processed_events")
+    if existing:
+        op.rename_table("processed_events", "processed_events_unpartitioned")
+        op.execute(
+            "ALTER INDEX IF EXISTS processed_events_pkey "
+            "RENAME TO processed_events_unpartitioned_pkey"
+        )
+
+    op.execute(
+        "CREATE TABLE processed_events ("
+        "id UUID NOT NULL, "
+        "processed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(), "
+        "PRIMARY KEY (id, processed_at)"
+        ") PARTITION BY RANGE (processed_at)"
+    )
+
+    today = datetime.now(timezone.utc).date()
+    for offset in range(-CARRY_OVER_DAYS, PREMAKE_DAYS + 1):
+        _create_partition(today + timedelta(days=offset))
+
+    if existing:
+        op.execute(
+            "INSERT INTO processed_events (id, processed_at) "
+            "SELECT id, processed_at FROM processed_events_unpartitioned "
+            f"WHERE processed_at >= '{today - timedelta(days=CARRY_OVER_DAYS)}' "
+            f"AND processed_at < '{today + timedelta(days=PREMAKE_DAYS + 1)}'"
+        )
+        op.drop_table("processed_events_unpartitioned")
+
+
+def downgrade() -> None:
+    op.execute(
+        "CREATE TABLE processed_events_unpartitioned ("
+        "id UUID PRIMARY KEY, "
+        "processed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()"
+        ")"
+    )
+    op.execute(
+        "INSERT INTO processed_events_unpartitioned (id, processed_at) "
+        "SELECT DISTINCT ON (id) id, processed_at FROM processed_events "
+        "ORDER BY id, processed_at"
+    )
+    op.drop_table("processed_events")
+    op.rename_table("processed_events_unpartitioned", "processed_events")
+    op.execute(
+        "ALTER INDEX processed_events_unpartitioned_pkey RENAME TO processed_events_pkey"
+    )
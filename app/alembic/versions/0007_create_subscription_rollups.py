@@ -0,0 +1,47 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "0007_create_subscription_rollups"
+down_revision = "0006_create_idempotency_keys"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "subscription_rollups",
+        sa.Column(
+            "plan_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("plans.id"),
+            nullable=False,
+        ),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("currency", sa.String(length=3), nullable=False),
+        sa.Column("count", sa.BigInteger(), nullable=False),
+        sa.Column("amount", sa.Numeric(20, 2), nullable=False),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("plan_id", "status", "shard"),
+    )
+
+    op.execute(
+        """
+        INSERT INTO subscription_rollups (plan_id, status, shard, currency, count, amount)
+        SELECT s.plan_id, s.status, 0, p.currency, count(*), count(*) * p.amount
+        FROM subscriptions s
+        JOIN plans p ON p.id = s.plan_id
+        GROUP BY s.plan_id, s.status, p.currency, p.amount
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("subscription_rollups")
@@ -0,0 +1,55 @@
+from alembic import op
+
+
+revision = "0008_subs_admin_keyset_idx"
+down_revision = "0007_create_subscription_rollups"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscriptions_created_at_id",
+            "subscriptions",
+            ["created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_subscriptions_status_created_at_id",
+            "subscriptions",
+            ["status", "created_at", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # Covered by the leading column of the index above.
+        op.drop_index(
+            "ix_subscriptions_status",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscriptions_status",
+            "subscriptions",
+            ["status"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_subscriptions_status_created_at_id",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_subscriptions_created_at_id",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,63 @@
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_subs_expires_at"
+down_revision = "0009_create_import_checkpoints"
+branch_labels = None
+depends_on = None
+
+
+BACKFILL_CHUNK_SIZE = 10_000
+
+_CHUNK_END = sa.text(
+    "SELECT id FROM ("
+    "SELECT id FROM subscriptions WHERE id > :after ORDER BY id LIMIT :limit"
+    ") AS chunk ORDER BY id DESC LIMIT 1"
+)
+
+# Active subscriptions are paid up to their next billing date.
+_BACKFILL = sa.text(
+    "UPDATE subscriptions SET expires_at = next_billing_at "
+    "WHERE id > :after AND id <= :until "
+    "AND status = 'ACTIVE' AND expires_at IS NULL"
+)
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE subscriptions "
+        "ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP WITH TIME ZONE"
+    )
+
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        # Walks the primary key in chunks committed one by one, so the
+        # backfill never holds locks on more than a chunk of rows.
+        after = "00000000-0000-0000-0000-000000000000"
+        while True:
+            until = bind.scalar(_CHUNK_END, {"after": after, "limit": BACKFILL_CHUNK_SIZE})
+            if until is None:
+                break
+            bind.execute(_BACKFILL, {"after": after, "until": until})
+            after = until
+
+        op.create_index(
+            "ix_subscriptions_active_expires_at",
+            "subscriptions",
+            ["expires_at"],
+            postgresql_where=sa.text("status = 'ACTIVE'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_subscriptions_active_expires_at",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("subscriptions", "expires_at")
@@ -0,0 +1,20 @@
+from alembic import op
+
+
+revision = "0011_processed_events_default"
+down_revision = "0010_subs_expires_at"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Catches rows for days whose partition has not been created yet, e.g.
+    # while no API worker runs the retention job.
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS processed_events_default "
+        "PARTITION OF processed_events DEFAULT"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS processed_events_default")
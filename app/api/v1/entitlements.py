@@ -0,0 +1,89 @@
+from uuid import UUID
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import get_session
+from app.deps.auth import require_admin
+from app.services.entitlements import entitlement_cache
+from app.settings import settings
+
+
+router = APIRouter(
+    prefix="/entitlements",
+    tags=["entitlements"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+class UserEntitlements(BaseModel):
+    user_id: UUID
+    plan_ids: list[UUID]
+
+
+class EntitlementQuery(BaseModel):
+    user_id: UUID
+    plan_id: UUID
+
+
+class EntitlementCheck(EntitlementQuery):
+    entitled: bool
+
+
+class EntitlementCheckRequest(BaseModel):
+    items: list[EntitlementQuery] = Field(
+        min_length=1, max_length=settings.bulk_max_items
+    )
+
+
+class EntitlementCheckResponse(BaseModel):
+    items: list[EntitlementCheck]
+
+
+@router.get(
+    "/{user_id}",
+    summary="Plans the user currently has an active subscription to",
+)
+async def get_entitlements(
+    user_id: UUID,
+    session: AsyncSession = Depends(get_session),
+) -> UserEntitlements:
+    plan_ids = await entitlement_cache.get(session, user_id)
+    return UserEntitlements(user_id=user_id, plan_ids=list(plan_ids))
+
+
+@router.get(
+    "/{user_id}/{plan_id}",
+    summary="Check whether the user has an active subscription to the plan",
+)
+async def check_entitlement(
+    user_id: UUID,
+    plan_id: UUID,
+    session: AsyncSession = Depends(get_session),
+) -> EntitlementCheck:
+    plan_ids = await entitlement_cache.get(session, user_id)
+    return EntitlementCheck(user_id=user_id, plan_id=plan_id, entitled=plan_id in plan_ids)
+
+
+@router.post(
+    "/check",
+    summary="Check many (user, plan) pairs at once",
+)
+async def check_entitlements(
+    body: EntitlementCheckRequest,
+    session: AsyncSession = Depends(get_session),
+) -> EntitlementCheckResponse:
+    plans = await entitlement_cache.get_many(
+        session, (item.user_id for item in body.items)
+    )
+    return EntitlementCheckResponse(
+        items=[
+            EntitlementCheck(
+                user_id=item.user_id,
+                plan_id=item.plan_id,
+                entitled=item.plan_id in plans[item.user_id],
+            )
+            for item in body.items
+        ]
+    )
@@ -0,0 +1,126 @@
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import get_read_session
+from app.deps.auth import require_admin
+from app.models.subscription import SubscriptionStatus
+from app.services.export import (
+    ExportCompression,
+    ExportFilters,
+    ExportFormat,
+    create_encoder,
+    export_filename,
+    export_subscriptions,
+)
+from app.services.rollups import subscription_rollups
+from app.settings import settings
+
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["reports"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+class PlanTotals(BaseModel):
+    plan_id: UUID
+    status: SubscriptionStatus
+    currency: str
+    count: int
+    amount: Decimal
+
+
+class CurrencyTotals(BaseModel):
+    status: SubscriptionStatus
+    currency: str
+    count: int
+    amount: Decimal
+
+
+class SubscriptionReport(BaseModel):
+    plans: list[PlanTotals]
+    currencies: list[CurrencyTotals]
+
+
+@router.get(
+    "/subscriptions",
+    summary="Subscription counts and amounts per plan, status and currency",
+)
+async def subscription_report(
+    status: SubscriptionStatus | None = None,
+    session: AsyncSession = Depends(get_read_session),
+) -> SubscriptionReport:
+    rows = await subscription_rollups.summary(session, status)
+
+    currencies: dict[tuple[SubscriptionStatus, str], list] = defaultdict(
+        lambda: [0, Decimal(0)]
+    )
+    for _, row_status, currency, count, amount in rows:
+        totals = currencies[(row_status, currency)]
+        totals[0] += count
+        totals[1] += amount
+
+    return SubscriptionReport(
+        plans=[
+            PlanTotals(
+                plan_id=plan_id,
+                status=row_status,
+                currency=currency,
+                count=count,
+                amount=amount,
+            )
+            for plan_id, row_status, currency, count, amount in rows
+        ],
+        currencies=[
+            CurrencyTotals(status=row_status, currency=currency, count=count, amount=amount)
+            for (row_status, currency), (count, amount) in sorted(currencies.items())
+        ],
+    )
+
+
+MEDIA_TYPES = {
+    ("csv", "none"): "text/csv",
+    ("csv", "gzip"): "application/gzip",
+}
+
+
+@router.get(
+    "/subscriptions/export",
+    summary="Stream subscriptions with their plans as CSV or Parquet",
+)
+async def export_subscriptions_report(
+    format: ExportFormat = "csv",
+    compression: ExportCompression = "none",
+    status: SubscriptionStatus | None = None,
+    plan_id: UUID | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+) -> StreamingResponse:
+    try:
+        encoder = create_encoder(format, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    filters = ExportFilters(
+        status=status,
+        plan_id=plan_id,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    return StreamingResponse(
+        export_subscriptions(encoder, filters, chunk_size=settings.export_chunk_size),
+        media_type=MEDIA_TYPES.get((format, compression), "application/vnd.apache.parquet"),
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{export_filename(format, compression)}"'
+            ),
+        },
+    )
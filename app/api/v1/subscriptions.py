@@ -1,17 +1,24 @@
+import base64
+import hashlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, Literal
 from uuid import UUID
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel, HttpUrl
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, HttpUrl
 
-from app.services.subscription import SubscriptionService
-from app.services.billing_client import BillingClient
-from app.db.session import get_session
-from app.deps.auth import get_current_user_id
+from app.services.subscription import NewSubscription, SubscriptionService
+from app.services.billing_client import billing_client
+from app.services.idempotency import idempotency_store
+from app.db.engine import read_session_factory
+from app.db.session import get_read_session, get_session
+from app.deps.auth import get_current_user_id, require_admin
 from app.models.subscription import Subscription, SubscriptionStatus
+from app.settings import settings
 
+from sqlalchemy import Select, literal, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.settings import settings
-
 
 router = APIRouter(prefix="/subscriptions", tags=["subscriptions"])
 
@@ -21,7 +28,7 @@ def get_subscription_service(
 ) -> SubscriptionService:
     return SubscriptionService(
         session=session,
-        billing_client=BillingClient(settings.base_url),
+        billing_client=billing_client,
     )
 
 
@@ -39,28 +46,183 @@ class SubscriptionResponse(BaseModel):
         from_attributes = True
 
 
+class SubscriptionPage(BaseModel):
+    items: list[SubscriptionResponse]
+    next_cursor: str | None = None
+
+
 class RefundRequest(BaseModel):
     handler_url: HttpUrl
 
 
+class BulkCreateItem(BaseModel):
+    user_id: UUID
+    plan_id: UUID
+    return_url: HttpUrl
+
+
+class BulkCreateRequest(BaseModel):
+    items: list[BulkCreateItem] = Field(min_length=1, max_length=settings.bulk_max_items)
+
+
+class BulkCancelRequest(BaseModel):
+    subscription_ids: list[UUID] = Field(
+        min_length=1, max_length=settings.bulk_max_items
+    )
+
+
+class BulkItemResponse(BaseModel):
+    index: int
+    subscription_id: UUID | None
+    status: Literal["created", "cancelled", "failed"]
+    error: str | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class BulkResponse(BaseModel):
+    items: list[BulkItemResponse]
+
+
+STREAM_CHUNK_SIZE = 500
+
+
+def _encode_cursor(subscription: Subscription) -> str:
+    raw = f"{subscription.created_at.isoformat()}|{subscription.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        created_at, subscription_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+        position = datetime.fromisoformat(created_at)
+        # Cursors always carry an offset; normalising to UTC also rejects
+        # dates that only fit the calendar in their own time zone.
+        if position.tzinfo is None:
+            raise ValueError("Cursor without a time zone")
+        return position.astimezone(timezone.utc), UUID(subscription_id)
+    except (ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _list_query(
+    user_id: UUID,
+    status: SubscriptionStatus | None,
+) -> Select:
+    query = (
+        select(Subscription)
+        .where(Subscription.user_id == user_id)
+        .order_by(Subscription.created_at.desc(), Subscription.id.desc())
+    )
+    if status is not None:
+        query = query.where(Subscription.status == status)
+    return query
+
+
 @router.post(
     "",
     summary="Create subscription and start payment",
+    response_model=SubscriptionResponse,
 )
 async def create_subscription(
     body: CreateSubscriptionRequest,
+    idempotency_key: str | None = Header(default=None, max_length=255),
     user_id: UUID = Depends(get_current_user_id),
+    session: AsyncSession = Depends(get_session),
     service: SubscriptionService = Depends(get_subscription_service),
-) -> SubscriptionResponse:
-    subscription = await service.create_subscription(
-        user_id=user_id,
-        plan_id=body.plan_id,
-        return_url=str(body.return_url),
-    )
+) -> SubscriptionResponse | Response:
+    if idempotency_key is None:
+        subscription = await service.create_subscription(
+            user_id=user_id,
+            plan_id=body.plan_id,
+            return_url=str(body.return_url),
+        )
+        return SubscriptionResponse.model_validate(subscription)
+
+    request_hash = hashlib.sha256(body.model_dump_json().encode()).hexdigest()
+    stored = await idempotency_store.begin(user_id, idempotency_key, request_hash)
+    if stored is not None:
+        return JSONResponse(
+            stored.body,
+            status_code=stored.status_code,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    async def store_response(subscription: Subscription) -> None:
+        # Saved in the subscription's own transaction: a retry either sees
+        # the response or finds no subscription was created.
+        await idempotency_store.complete(
+            user_id,
+            idempotency_key,
+            200,
+            SubscriptionResponse.model_validate(subscription).model_dump(mode="json"),
+            session,
+        )
+
+    try:
+        subscription = await service.create_subscription(
+            user_id=user_id,
+            plan_id=body.plan_id,
+            return_url=str(body.return_url),
+            before_commit=store_response,
+        )
+    except HTTPException as e:
+        if e.status_code >= 500:
+            await idempotency_store.release(user_id, idempotency_key)
+        else:
+            await idempotency_store.complete(
+                user_id, idempotency_key, e.status_code, {"detail": e.detail}
+            )
+        raise
+    except BaseException:
+        await idempotency_store.release(user_id, idempotency_key)
+        raise
 
     return SubscriptionResponse.model_validate(subscription)
 
 
+@router.post(
+    "/bulk",
+    summary="Create subscriptions for many users at once",
+    dependencies=[Depends(require_admin)],
+)
+async def bulk_create_subscriptions(
+    body: BulkCreateRequest,
+    service: SubscriptionService = Depends(get_subscription_service),
+) -> BulkResponse:
+    results = await service.create_subscriptions(
+        [
+            NewSubscription(
+                user_id=item.user_id,
+                plan_id=item.plan_id,
+                return_url=str(item.return_url),
+            )
+            for item in body.items
+        ]
+    )
+    return BulkResponse(
+        items=[BulkItemResponse.model_validate(result) for result in results]
+    )
+
+
+@router.post(
+    "/bulk/cancel",
+    summary="Cancel many active subscriptions at once",
+    dependencies=[Depends(require_admin)],
+)
+async def bulk_cancel_subscriptions(
+    body: BulkCancelRequest,
+    service: SubscriptionService = Depends(get_subscription_service),
+) -> BulkResponse:
+    results = await service.cancel_subscriptions(body.subscription_ids)
+    return BulkResponse(
+        items=[BulkItemResponse.model_validate(result) for result in results]
+    )
+
+
 @router.post(
     "/{subscription_id}/cancel",
     summary="Cancel active subscription",
@@ -98,18 +260,60 @@ async def refund_subscription(
     summary="List user's subscriptions",
 )
 async def list_subscriptions(
+    status: SubscriptionStatus | None = None,
+    cursor: str | None = None,
+    limit: int = Query(default=50, ge=1, le=500),
     user_id: UUID = Depends(get_current_user_id),
-    session: AsyncSession = Depends(get_session),
-) -> list[SubscriptionResponse]:
-    from sqlalchemy import select
+    session: AsyncSession = Depends(get_read_session),
+) -> SubscriptionPage:
+    query = _list_query(user_id, status)
+    if cursor is not None:
+        query = query.where(
+            tuple_(Subscription.created_at, Subscription.id)
+            < tuple_(*map(literal, _decode_cursor(cursor)))
+        )
+
+    result = await session.execute(query.limit(limit + 1))
+    subscriptions = result.scalars().all()
+
+    has_more = len(subscriptions) > limit
+    subscriptions = subscriptions[:limit]
 
-    result = await session.execute(
-        select(Subscription).where(Subscription.user_id == user_id)
+    return SubscriptionPage(
+        items=[
+            SubscriptionResponse.model_validate(sub)
+            for sub in subscriptions
+        ],
+        next_cursor=_encode_cursor(subscriptions[-1]) if has_more else None,
     )
 
-    subscriptions = result.scalars().all()
 
-    return [
-        SubscriptionResponse.model_validate(sub)
-        for sub in subscriptions
-    ]
+async def _stream_subscriptions(
+    user_id: UUID,
+    status: SubscriptionStatus | None,
+) -> AsyncIterator[str]:
+    async with read_session_factory() as session:
+        result = await session.stream_scalars(
+            _list_query(user_id, status).execution_options(
+                yield_per=STREAM_CHUNK_SIZE
+            )
+        )
+        async for chunk in result.partitions():
+            yield "".join(
+                SubscriptionResponse.model_validate(sub).model_dump_json() + "\n"
+                for sub in chunk
+            )
+
+
+@router.get(
+    "/stream",
+    summary="Stream user's subscriptions as NDJSON",
+)
+async def stream_subscriptions(
+    status: SubscriptionStatus | None = None,
+    user_id: UUID = Depends(get_current_user_id),
+) -> StreamingResponse:
+    return StreamingResponse(
+        _stream_subscriptions(user_id, status),
+        media_type="application/x-ndjson",
+    )
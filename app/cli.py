@@ -0,0 +1,199 @@
+import asyncio
+import os
+import sys
+from contextlib import nullcontext
+from datetime import datetime
+from typing import cast, get_args
+from uuid import UUID
+
+import typer
+
+from app.kafka.retry import replay_dead_letters
+from app.kafka.runner import ConsumerSupervisor, prepare_metrics_dir
+from app.logging_config import configure_cli_logging
+from app.models.subscription import SubscriptionStatus
+from app.services.bulk_import import (
+    ImportFormat,
+    input_format,
+    open_input,
+    read_records,
+    subscription_importer,
+)
+from app.services.export import (
+    ExportCompression,
+    ExportFilters,
+    ExportFormat,
+    create_encoder,
+    export_subscriptions,
+)
+from app.services.rollups import subscription_rollups
+from app.settings import kafka_settings, settings
+
+
+cli = typer.Typer(no_args_is_help=True)
+dlq = typer.Typer(no_args_is_help=True, help="Dead-letter topic tools.")
+cli.add_typer(dlq, name="dlq")
+
+
+@cli.callback()
+def main() -> None:
+    configure_cli_logging()
+
+
+consumer = typer.Typer(no_args_is_help=True, help="Kafka consumer.")
+cli.add_typer(consumer, name="consumer")
+
+
+@consumer.command("run", help="Run Kafka consumer processes in one consumer group.")
+def run_consumer(
+    processes: int = typer.Option(
+        kafka_settings.consumer_processes, min=1, help="Number of consumer processes."
+    ),
+    health_port: int | None = typer.Option(
+        kafka_settings.consumer_health_port,
+        help="Port for /health, /ready and /metrics.",
+    ),
+    metrics_dir: str | None = typer.Option(
+        os.environ.get("PROMETHEUS_MULTIPROC_DIR"),
+        help="Directory for multiprocess Prometheus metrics.",
+    ),
+) -> None:
+    prepare_metrics_dir(metrics_dir)
+    supervisor = ConsumerSupervisor(
+        processes,
+        shutdown_timeout_seconds=kafka_settings.consumer_shutdown_timeout_seconds,
+        heartbeat_timeout_seconds=kafka_settings.consumer_heartbeat_timeout_seconds,
+    )
+    asyncio.run(supervisor.run(health_port))
+
+
+rollups = typer.Typer(no_args_is_help=True, help="Subscription rollups.")
+cli.add_typer(rollups, name="rollups")
+
+
+@rollups.command("reconcile", help="Compare the rollups with subscriptions and fix drift.")
+def reconcile_rollups(
+    dry_run: bool = typer.Option(False, help="Only report drift, do not fix it."),
+) -> None:
+    drift = asyncio.run(subscription_rollups.reconcile(fix=not dry_run))
+    if drift is None:
+        typer.echo("Another reconciliation is running")
+        raise typer.Exit(1)
+    for item in drift:
+        typer.echo(
+            f"{item.plan_id} {item.status.value}: count {item.stored_count} -> {item.count}, "
+            f"amount {item.stored_amount} -> {item.amount} {item.currency}"
+        )
+    typer.echo(f"{'Found' if dry_run else 'Fixed'} drift in {len(drift)} rows")
+
+
+export = typer.Typer(no_args_is_help=True, help="Data exports.")
+cli.add_typer(export, name="export")
+
+
+async def _write_export(output: str, chunks) -> int:
+    written = 0
+    with open(output, "wb") if output != "-" else sys.stdout.buffer as file:
+        async for data in chunks:
+            file.write(data)
+            written += len(data)
+    return written
+
+
+@export.command("subscriptions", help="Export subscriptions with their plans as CSV or Parquet.")
+def export_subscriptions_command(
+    output: str = typer.Option("-", "--output", "-o", help="Output file, '-' for stdout."),
+    format: str = typer.Option("csv", help="csv or parquet."),
+    compression: str = typer.Option(
+        "none", help="none; gzip for CSV; snappy, gzip or zstd for Parquet."
+    ),
+    status: SubscriptionStatus | None = typer.Option(None, help="Only this status."),
+    plan_id: str | None = typer.Option(None, help="Only this plan."),
+    created_from: datetime | None = typer.Option(None, help="Created at or after (UTC)."),
+    created_to: datetime | None = typer.Option(None, help="Created before (UTC)."),
+    chunk_size: int = typer.Option(
+        settings.export_chunk_size, min=1, help="Rows fetched and encoded at a time."
+    ),
+) -> None:
+    try:
+        # create_encoder rejects formats and compressions it does not know.
+        encoder = create_encoder(
+            cast(ExportFormat, format), cast(ExportCompression, compression)
+        )
+        filters = ExportFilters(
+            status=status,
+            plan_id=UUID(plan_id) if plan_id else None,
+            created_from=created_from,
+            created_to=created_to,
+        )
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+    written = asyncio.run(
+        _write_export(output, export_subscriptions(encoder, filters, chunk_size=chunk_size))
+    )
+    if output != "-":
+        typer.echo(f"Wrote {written} bytes to {output}", err=True)
+
+
+imports = typer.Typer(no_args_is_help=True, help="Data imports.")
+cli.add_typer(imports, name="import")
+
+
+@imports.command("subscriptions", help="Load subscriptions from CSV or NDJSON through COPY.")
+def import_subscriptions_command(
+    source: str = typer.Argument(
+        ..., help="Input file (.csv, .ndjson, optionally .gz), '-' for stdin."
+    ),
+    format: str | None = typer.Option(None, help="csv or ndjson; by default from the file name."),
+    name: str | None = typer.Option(
+        None, help="Checkpoint name to resume by; defaults to the file name."
+    ),
+    rejects: str | None = typer.Option(None, help="Append rejected records to this NDJSON file."),
+    restart: bool = typer.Option(False, help="Forget the checkpoint and start from the beginning."),
+    batch_size: int = typer.Option(
+        settings.import_batch_size, min=1, help="Records validated and copied at a time."
+    ),
+) -> None:
+    format = format or input_format(source)
+    if format not in get_args(ImportFormat):
+        raise typer.BadParameter("Expected csv or ndjson", param_hint="--format")
+    if name is None:
+        if source == "-":
+            raise typer.BadParameter(
+                "Reading from stdin needs a checkpoint name", param_hint="--name"
+            )
+        name = os.path.basename(source)
+
+    with open_input(source) as file, open(rejects, "a") if rejects else nullcontext() as reject_file:
+        progress = asyncio.run(
+            subscription_importer.run(
+                read_records(file, cast(ImportFormat, format)),
+                name=name,
+                source=source,
+                rejects=reject_file,
+                restart=restart,
+                batch_size=batch_size,
+            )
+        )
+    if progress is None:
+        typer.echo(f"Import {name} is already running")
+        raise typer.Exit(1)
+    typer.echo(
+        f"Import {name}: {progress.position} records, {progress.inserted} inserted, "
+        f"{progress.duplicates} duplicates, {progress.rejected} rejected, "
+        f"{progress.events} events marked processed"
+    )
+
+
+@dlq.command("replay", help="Send dead-lettered events back to their original topics.")
+def replay(
+    limit: int | None = typer.Option(None, min=1, help="Replay at most this many messages."),
+    dry_run: bool = typer.Option(False, help="Only list the messages, do not replay them."),
+) -> None:
+    replayed = asyncio.run(replay_dead_letters(limit=limit, dry_run=dry_run))
+    typer.echo(f"{'Found' if dry_run else 'Replayed'} {replayed} messages")
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,21 +1,107 @@
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Delete, Insert, Update
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session, sessionmaker
+from app.metrics import InstrumentedQueuePool, instrument_pool
 from app.settings import pg_settings
 
 
 DATABASE_URL = pg_settings.get_url(driver="asyncpg")
+REPLICA_DATABASE_URL = pg_settings.get_replica_url(driver="asyncpg")
 
 
-async_engine: AsyncEngine = create_async_engine(
-    DATABASE_URL,
-    echo=False,
-    future=True,
-)
+def _create_engine(
+    url: str,
+    *,
+    pool_size: int = pg_settings.pool_size,
+    max_overflow: int = pg_settings.max_overflow,
+    statement_timeout_ms: int | None = pg_settings.statement_timeout_ms,
+) -> AsyncEngine:
+    server_settings = {}
+    if statement_timeout_ms is not None:
+        server_settings["statement_timeout"] = str(statement_timeout_ms)
+
+    return create_async_engine(
+        url,
+        echo=False,
+        future=True,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pg_settings.pool_timeout_seconds,
+        pool_pre_ping=pg_settings.pool_pre_ping,
+        connect_args={
+            # asyncpg's own cache and SQLAlchemy's adapter cache; both must be 0
+            # behind a transaction-pooling pgbouncer.
+            "statement_cache_size": pg_settings.statement_cache_size,
+            "prepared_statement_cache_size": pg_settings.statement_cache_size,
+            "server_settings": server_settings,
+        },
+    )
+
+
+async_engine: AsyncEngine = _create_engine(DATABASE_URL)
+instrument_pool(async_engine)
+
+if REPLICA_DATABASE_URL:
+    replica_engine: AsyncEngine = _create_engine(REPLICA_DATABASE_URL)
+    instrument_pool(replica_engine, "replica")
+else:
+    replica_engine = async_engine
 
 
-async_session_factory = sessionmaker(
+def _create_admin_engine(url: str) -> AsyncEngine:
+    return _create_engine(
+        url,
+        pool_size=pg_settings.admin_pool_size,
+        max_overflow=pg_settings.admin_max_overflow,
+        statement_timeout_ms=pg_settings.admin_statement_timeout_ms,
+    )
+
+
+# The admin panel has its own small pools, so slow list pages cannot take
+# connections away from API requests.
+admin_engine: AsyncEngine = _create_admin_engine(DATABASE_URL)
+instrument_pool(admin_engine, "admin")
+
+if REPLICA_DATABASE_URL:
+    admin_replica_engine: AsyncEngine = _create_admin_engine(REPLICA_DATABASE_URL)
+    instrument_pool(admin_replica_engine, "admin_replica")
+else:
+    admin_replica_engine = admin_engine
+
+
+async_session_factory = async_sessionmaker(
     bind=async_engine,
     class_=AsyncSession,
     expire_on_commit=False,
     autoflush=False,
 )
+
+# Read-only traffic that tolerates replication lag.
+read_session_factory = async_sessionmaker(
+    bind=replica_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False,
+)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            return admin_engine.sync_engine
+        return admin_replica_engine.sync_engine
+
+
+# Reads go to the replica and flushes to the primary, for the admin panel.
+routing_session_factory = sessionmaker(
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
+    autoflush=False,
+)
@@ -0,0 +1,52 @@
+from collections.abc import Callable
+
+import asyncpg
+
+from app.logging_config import logger
+from app.settings import pg_settings
+
+
+Callback = Callable[[str | None], None]
+
+
+class PgListener:
+    def __init__(self, url: str):
+        self.url = url
+        self._callbacks: dict[str, list[Callback]] = {}
+        self._connection: asyncpg.Connection | None = None
+
+    def subscribe(self, channel: str, callback: Callback) -> None:
+        self._callbacks.setdefault(channel, []).append(callback)
+
+    def _dispatch(self, connection, pid, channel: str, payload: str) -> None:
+        for callback in self._callbacks.get(channel, ()):
+            callback(payload or None)
+
+    async def start(self) -> None:
+        channels = ", ".join(self._callbacks)
+        try:
+            self._connection = await asyncpg.connect(self.url)
+            for channel in self._callbacks:
+                await self._connection.add_listener(channel, self._dispatch)
+        except Exception:
+            logger.exception("Failed to subscribe to %s, relying on TTL", channels)
+            await self.stop()
+            return
+
+        # Anything cached before LISTEN started may have missed a notification.
+        for callbacks in self._callbacks.values():
+            for callback in callbacks:
+                callback(None)
+        logger.info("Listening for notifications on %s", channels)
+
+    async def stop(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    @property
+    def listening(self) -> bool:
+        return self._connection is not None and not self._connection.is_closed()
+
+
+pg_listener = PgListener(pg_settings.get_url())
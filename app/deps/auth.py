@@ -1,47 +1,279 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from uuid import UUID
+
 from fastapi import Request, HTTPException
-from aiohttp import ClientSession, ClientTimeout
+from aiohttp import ClientTimeout
 from jose import jwt, JWTError
 
+from app.logging_config import logger
+from app.metrics import CLIENT_LATENCY, timed
+from app.services.http_client import HttpClient, http_client
 from app.settings import settings
 
 
+class TokenCache:
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, claims = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return claims
+
+    def set(self, token: str, claims: dict) -> None:
+        ttl = self.ttl_seconds
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            ttl = min(ttl, exp - time.time())
+        if ttl <= 0:
+            return
+
+        key = self._key(token)
+        self._entries[key] = (time.monotonic() + ttl, claims)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class JWKSCache:
+    def __init__(
+        self,
+        jwks_url: str,
+        http: HttpClient,
+        refresh_seconds: float,
+        min_refresh_seconds: float,
+    ):
+        self.jwks_url = jwks_url
+        self.http = http
+        self.refresh_seconds = refresh_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self._keys: dict[str | None, dict] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._background_refresh: asyncio.Task | None = None
+
+    def _age(self) -> float:
+        return time.monotonic() - self._fetched_at
+
+    @timed(CLIENT_LATENCY, client="auth", operation="fetch_jwks")
+    async def _fetch(self) -> dict:
+        async with self.http.session.get(self.jwks_url) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+    async def refresh(self) -> None:
+        async with self._lock:
+            if self._keys and self._age() < self.min_refresh_seconds:
+                return
+
+            body = await self._fetch()
+            keys = {key.get("kid"): key for key in body.get("keys", [])}
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            logger.info("Loaded %s signing keys from %s", len(keys), self.jwks_url)
+
+    def _refresh_in_background(self) -> None:
+        if self._background_refresh and not self._background_refresh.done():
+            return
+
+        async def _run() -> None:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Background JWKS refresh failed")
+
+        self._background_refresh = asyncio.create_task(_run())
+
+    async def get_key(self, kid: str | None) -> dict | None:
+        if not self._keys:
+            await self.refresh()
+        elif self._age() >= self.refresh_seconds:
+            self._refresh_in_background()
+
+        key = self._lookup(kid)
+        if key is None and self._age() >= self.min_refresh_seconds:
+            # Unknown kid: the auth service has most likely rotated its keys.
+            await self.refresh()
+            key = self._lookup(kid)
+        return key
+
+    def _lookup(self, kid: str | None) -> dict | None:
+        if kid is None and len(self._keys) == 1:
+            return next(iter(self._keys.values()))
+        return self._keys.get(kid)
+
+
 class AuthClient:
-    def __init__(self, auth_path: str):
+    def __init__(
+        self,
+        auth_path: str,
+        http: HttpClient,
+        *,
+        verify_mode: str = "remote",
+        jwks: JWKSCache | None = None,
+        token_cache: TokenCache | None = None,
+        remote_cache: TokenCache | None = None,
+        algorithms: list[str] | None = None,
+    ):
         self.auth_path = auth_path
+        self.http = http
+        self.verify_mode = verify_mode
+        self.jwks = jwks
+        self.token_cache = token_cache
+        self.remote_cache = remote_cache
+        self.algorithms = algorithms or ["RS256"]
+        self._in_flight: dict[str, asyncio.Task[dict]] = {}
 
+    @timed(CLIENT_LATENCY, client="auth", operation="authenticate")
     async def authenticate(self, request: Request) -> dict:
         if not request.cookies:
             raise HTTPException(status_code=401, detail="Not authenticated")
 
-        async with ClientSession() as session:
-            try:
-                response = await session.post(
-                    self.auth_path,
-                    cookies=request.cookies,
-                    timeout=ClientTimeout(total=3),
-                )
-            except Exception:
-                raise HTTPException(status_code=503, detail="Auth service unavailable")
+        if self.verify_mode == "local":
+            return await self._verify_locally(request.cookies.get("access-token"))
 
-        if not response.ok:
+        token = request.cookies.get("access-token")
+        if not token:
+            return await self._verify_remotely(dict(request.cookies))
+
+        if self.remote_cache is not None:
+            cached = self.remote_cache.get(token)
+            if cached is not None:
+                return cached
+
+        # Parallel requests from one page carry the same token: they share
+        # a single check instead of each calling the auth service.
+        key = TokenCache._key(token)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._verify_remotely(dict(request.cookies)))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        # Shielded so a client disconnecting does not fail the others waiting.
+        claims = await asyncio.shield(task)
+        if self.remote_cache is not None:
+            self.remote_cache.set(token, claims)
+        return claims
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        # Every waiter may have gone away; retrieve the error so it is not logged.
+        if not task.cancelled():
+            task.exception()
+
+    @timed(CLIENT_LATENCY, client="auth", operation="check_token")
+    async def _verify_remotely(self, cookies: dict[str, str]) -> dict:
+        try:
+            async with self.http.session.post(
+                self.auth_path,
+                cookies=cookies,
+                timeout=ClientTimeout(total=3),
+            ) as response:
+                ok = response.ok
+        except Exception:
+            raise HTTPException(status_code=503, detail="Auth service unavailable")
+
+        if not ok:
             raise HTTPException(status_code=401, detail="Invalid session")
 
         try:
-            return jwt.get_unverified_claims(
-                request.cookies["access-token"]
-            )
+            return jwt.get_unverified_claims(cookies["access-token"])
         except (JWTError, KeyError, ValueError):
             raise HTTPException(status_code=401, detail="Invalid token")
 
+    async def _verify_locally(self, token: str | None) -> dict:
+        if not token:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+
+        if self.token_cache is not None:
+            claims = self.token_cache.get(token)
+            if claims is not None:
+                return claims
 
-auth_client = AuthClient(settings.auth_api_access_token_check_url)
+        if self.jwks is None:
+            raise HTTPException(status_code=503, detail="Auth keys not configured")
+
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        try:
+            key = await self.jwks.get_key(header.get("kid"))
+        except Exception:
+            logger.exception("Failed to load signing keys from %s", self.jwks.jwks_url)
+            raise HTTPException(status_code=503, detail="Auth service unavailable")
+
+        if key is None:
+            raise HTTPException(status_code=401, detail="Unknown signing key")
+
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=self.algorithms,
+                options={"verify_aud": False, "require_exp": True},
+            )
+        except JWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        if self.token_cache is not None:
+            self.token_cache.set(token, claims)
+        return claims
+
+
+auth_client = AuthClient(
+    settings.auth_api_access_token_check_url,
+    http=http_client,
+    verify_mode=settings.auth_verify_mode,
+    jwks=JWKSCache(
+        settings.auth_jwks_url,
+        http=http_client,
+        refresh_seconds=settings.auth_jwks_refresh_seconds,
+        min_refresh_seconds=settings.auth_jwks_min_refresh_seconds,
+    ),
+    token_cache=TokenCache(
+        maxsize=settings.auth_token_cache_size,
+        ttl_seconds=settings.auth_token_cache_ttl_seconds,
+    ),
+    remote_cache=TokenCache(
+        maxsize=settings.auth_token_cache_size,
+        ttl_seconds=settings.auth_remote_cache_ttl_seconds,
+    ),
+    algorithms=settings.auth_jwt_algorithms,
+)
 
 
 async def get_current_user_id(
     request: Request,
-) -> str:
+) -> UUID:
     payload = await auth_client.authenticate(request)
-    return payload["sub"]
+    try:
+        return UUID(payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid token")
 
 
 async def require_admin(
@@ -0,0 +1,240 @@
+from collections import Counter
+from collections.abc import Iterable
+from uuid import UUID
+
+from sqlalchemy import ColumnElement, case, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.session import get_session
+from app.kafka.decoding import Event, subscription_key
+from app.kafka.dedup import recent_event_ids
+from app.kafka.schemas import PaymentEventSchema, RefundEventSchema
+from app.logging_config import logger
+from app.metrics import (
+    KAFKA_BATCH_SECONDS,
+    KAFKA_BATCH_SIZE,
+    KAFKA_DUPLICATES,
+    record_transition,
+    timed,
+)
+from app.models.plan import Plan
+from app.models.processed_event import ProcessedEvent
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.services.entitlements import entitlement_cache
+from app.services.rollups import moved, subscription_rollups
+
+
+def _split(
+    events: Iterable[Event],
+) -> tuple[dict[UUID, PaymentEventSchema], dict[UUID, RefundEventSchema]]:
+    payments: dict[UUID, PaymentEventSchema] = {}
+    refunds: dict[UUID, RefundEventSchema] = {}
+
+    for event in events:
+        if isinstance(event, PaymentEventSchema):
+            payments.setdefault(event.id, event)
+        else:
+            refunds.setdefault(event.id, event)
+
+    return payments, refunds
+
+
+def _plan_periods(count: int | ColumnElement[int] = 1) -> ColumnElement:
+    return func.make_interval(
+        0, 0, 0,
+        select(Plan.period_days)
+        .where(Plan.id == Subscription.plan_id)
+        .scalar_subquery()
+        * count,
+    )
+
+
+def _subscription_id(event: Event) -> UUID | None:
+    subscription_id = subscription_key(event)
+    if not subscription_id:
+        logger.warning("Event %s has no subscription_id, skipping", event.id)
+        return None
+    try:
+        return UUID(str(subscription_id))
+    except ValueError:
+        logger.warning(
+            "Event %s has invalid subscription_id %r, skipping", event.id, subscription_id
+        )
+        return None
+
+
+@timed(KAFKA_BATCH_SECONDS)
+async def process_batch(events: list[Event]) -> None:
+    KAFKA_BATCH_SIZE.observe(len(events))
+    fresh_events = [event for event in events if event.id not in recent_event_ids]
+    KAFKA_DUPLICATES.labels(source="memory").inc(len(events) - len(fresh_events))
+
+    payments, refunds = _split(fresh_events)
+    event_ids = list(payments) + list(refunds)
+    if not event_ids:
+        return
+
+    async for session in get_session():
+        async with session.begin():
+            processed = set(
+                await session.scalars(
+                    select(ProcessedEvent.id).where(ProcessedEvent.id.in_(event_ids))
+                )
+            )
+
+            activations: dict[UUID, UUID] = {}
+            renewals: dict[UUID, UUID] = {}
+            renewed_periods: Counter = Counter()
+            fresh_ids: list[UUID] = []
+            for event_id, payment in payments.items():
+                if event_id in processed:
+                    continue
+                subscription_id = _subscription_id(payment)
+                if subscription_id is None:
+                    continue
+                if payment.status == "succeeded":
+                    if (payment.extra_data or {}).get("renewal"):
+                        renewals[subscription_id] = event_id
+                        renewed_periods[subscription_id] += 1
+                    else:
+                        activations.setdefault(subscription_id, event_id)
+                fresh_ids.append(event_id)
+
+            refunded: set[UUID] = set()
+            for event_id, refund in refunds.items():
+                if event_id in processed:
+                    continue
+                subscription_id = _subscription_id(refund)
+                if subscription_id is None:
+                    continue
+                if refund.status == "succeeded":
+                    refunded.add(subscription_id)
+                fresh_ids.append(event_id)
+
+            changes: Counter = Counter()
+            activated_users: list[UUID] = []
+            if activations:
+                activated = (
+                    await session.execute(
+                        update(Subscription)
+                        .where(
+                            Subscription.id.in_(list(activations)),
+                            Subscription.status == SubscriptionStatus.PENDING_PAYMENT,
+                        )
+                        .values(
+                            status=SubscriptionStatus.ACTIVE,
+                            payment_id=case(activations, value=Subscription.id),
+                            next_billing_at=func.now() + _plan_periods(),
+                            expires_at=func.now() + _plan_periods(),
+                        )
+                        .returning(Subscription.user_id, Subscription.plan_id)
+                        .execution_options(synchronize_session=False)
+                    )
+                ).all()
+                activated_users = [row.user_id for row in activated]
+                for row in activated:
+                    changes.update(
+                        moved(
+                            row.plan_id,
+                            SubscriptionStatus.PENDING_PAYMENT,
+                            SubscriptionStatus.ACTIVE,
+                        )
+                    )
+
+            extended = 0
+            if renewals:
+                # Renewal charges only move the end of the paid period.
+                extended = (
+                    await session.execute(
+                        update(Subscription)
+                        .where(
+                            Subscription.id.in_(list(renewals)),
+                            Subscription.status == SubscriptionStatus.ACTIVE,
+                        )
+                        .values(
+                            payment_id=case(renewals, value=Subscription.id),
+                            expires_at=func.coalesce(Subscription.expires_at, func.now())
+                            + _plan_periods(case(renewed_periods, value=Subscription.id)),
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                ).rowcount
+
+                # Charged after the expiry processor ran: back to ACTIVE with
+                # the paid periods counted from now, like a first payment.
+                periods = _plan_periods(case(renewed_periods, value=Subscription.id))
+                reactivated = (
+                    await session.execute(
+                        update(Subscription)
+                        .where(
+                            Subscription.id.in_(list(renewals)),
+                            Subscription.status == SubscriptionStatus.EXPIRED,
+                        )
+                        .values(
+                            status=SubscriptionStatus.ACTIVE,
+                            payment_id=case(renewals, value=Subscription.id),
+                            next_billing_at=func.now() + periods,
+                            expires_at=func.now() + periods,
+                        )
+                        .returning(Subscription.user_id, Subscription.plan_id)
+                        .execution_options(synchronize_session=False)
+                    )
+                ).all()
+                activated_users += [row.user_id for row in reactivated]
+                for row in reactivated:
+                    changes.update(
+                        moved(
+                            row.plan_id,
+                            SubscriptionStatus.EXPIRED,
+                            SubscriptionStatus.ACTIVE,
+                        )
+                    )
+
+            refunded_plans: list[UUID] = []
+            if refunded:
+                refunded_plans = list(
+                    await session.scalars(
+                        update(Subscription)
+                        .where(
+                            Subscription.id.in_(list(refunded)),
+                            Subscription.status == SubscriptionStatus.REFUND_REQUESTED,
+                        )
+                        .values(status=SubscriptionStatus.REFUNDED)
+                        .returning(Subscription.plan_id)
+                        .execution_options(synchronize_session=False)
+                    )
+                )
+                for plan_id in refunded_plans:
+                    changes.update(
+                        moved(
+                            plan_id,
+                            SubscriptionStatus.REFUND_REQUESTED,
+                            SubscriptionStatus.REFUNDED,
+                        )
+                    )
+
+            await entitlement_cache.notify_changed(session, set(activated_users))
+
+            if fresh_ids:
+                await session.execute(
+                    insert(ProcessedEvent)
+                    .values([{"id": event_id} for event_id in fresh_ids])
+                    .on_conflict_do_nothing()
+                )
+            await subscription_rollups.record(session, changes)
+
+    recent_event_ids.add(event_ids)
+    KAFKA_DUPLICATES.labels(source="db").inc(len(processed))
+
+    record_transition(SubscriptionStatus.ACTIVE, len(activated_users))
+    record_transition(SubscriptionStatus.REFUNDED, len(refunded_plans))
+    logger.info(
+        "Processed batch of %s events: %s new, %s duplicates, "
+        "%s activated, %s extended, %s refunded",
+        len(events),
+        len(fresh_ids),
+        len(events) - len(fresh_events) + len(processed),
+        len(activated_users),
+        extended,
+        len(refunded_plans),
+    )
@@ -1,44 +1,249 @@
-import json
-from aiokafka import AIOKafkaConsumer
+import asyncio
+from collections.abc import Callable
+
+from aiokafka import AIOKafkaConsumer, ConsumerRebalanceListener, ConsumerRecord, TopicPartition
 
 from app.logging_config import logger
-from app.settings import settings
-from app.kafka.handlers import handle_payment_event, handle_refund_event
+from app.metrics import KAFKA_LAG, record_lag
+from app.settings import kafka_settings
+from app.kafka.batch import process_batch
+from app.kafka.decoding import decode_event
+from app.kafka.retry import RetryRouter, retry_router
+from app.kafka.workers import ConcurrentProcessor, worker_count
 
 
-async def start_kafka_consumer() -> None:
-    consumer = AIOKafkaConsumer(
-        settings.kafka_payment_topic,
-        settings.kafka_refund_topic,
-        bootstrap_servers=settings.kafka_bootstrap_servers,
-        group_id=settings.kafka_group_id,
-        enable_auto_commit=False,
-        value_deserializer=lambda v: json.loads(v.decode("utf-8")),
-    )
+# Only reached when a failed event cannot even be handed to a retry topic.
+REROUTE_FAILURE_BACKOFF_SECONDS = 5
+
+
+def _record_lag(consumer: AIOKafkaConsumer, batches: dict) -> None:
+    for tp, messages in batches.items():
+        if messages:
+            record_lag(tp.topic, tp.partition, consumer.highwater(tp), messages[-1].offset + 1)
+
+
+async def _process_retries(
+    consumer: AIOKafkaConsumer,
+    router: RetryRouter,
+    batches: dict,
+) -> None:
+    for tp, messages in batches.items():
+        if router.is_retry_topic(tp.topic):
+            await router.process_retries(consumer, tp, messages)
+
+
+async def _consume_one_by_one(
+    consumer: AIOKafkaConsumer,
+    router: RetryRouter,
+    stop: asyncio.Event,
+) -> None:
+    while not stop.is_set():
+        batches = await consumer.getmany(
+            timeout_ms=kafka_settings.batch_max_wait_ms,
+            max_records=1,
+        )
+        for tp, messages in batches.items():
+            for msg in messages:
+                await _consume_one(consumer, router, tp, msg)
 
-    logger.info("Starting Kafka consumer for topics: %s, %s",
-                settings.kafka_payment_topic, settings.kafka_refund_topic)
 
-    await consumer.start()
+async def _consume_one(
+    consumer: AIOKafkaConsumer,
+    router: RetryRouter,
+    tp: TopicPartition,
+    msg: ConsumerRecord,
+) -> None:
+    logger.debug("Received message from topic %s, offset %s", msg.topic, msg.offset)
+    record_lag(msg.topic, msg.partition, consumer.highwater(tp), msg.offset + 1)
     try:
-        async for msg in consumer:
-            logger.info("Received message from topic %s: %s", msg.topic, msg.value)
+        if router.is_retry_topic(msg.topic):
+            await router.process_retries(consumer, tp, [msg])
+            return
+
+        await router.handle(msg, decode_event(msg.topic, msg.value))
+        await consumer.commit({tp: msg.offset + 1})
+        logger.debug("Committed offset for message: %s", msg.offset)
+    except Exception:
+        logger.exception(
+            "Failed to process message from topic %s, offset %s. Will retry.",
+            msg.topic, msg.offset
+        )
+        consumer.seek(tp, msg.offset)
+        await asyncio.sleep(REROUTE_FAILURE_BACKOFF_SECONDS)
+
+
+async def _consume_batches(
+    consumer: AIOKafkaConsumer,
+    router: RetryRouter,
+    stop: asyncio.Event,
+) -> None:
+    while not stop.is_set():
+        batches = await consumer.getmany(
+            timeout_ms=kafka_settings.batch_max_wait_ms,
+            max_records=kafka_settings.batch_size,
+        )
+        if not any(batches.values()):
+            continue
+        _record_lag(consumer, batches)
+
+        main = {
+            tp: messages
+            for tp, messages in batches.items()
+            if messages and not router.is_retry_topic(tp.topic)
+        }
+        records = [
+            (msg, decode_event(msg.topic, msg.value))
+            for messages in main.values()
+            for msg in messages
+        ]
+        try:
+            await _process_retries(consumer, router, batches)
+            if not records:
+                continue
+
             try:
-                if msg.topic == settings.kafka_payment_topic:
-                    await handle_payment_event(msg.value)
-                    logger.info("Processed payment event: %s", msg.value.get("id"))
-                elif msg.topic == settings.kafka_refund_topic:
-                    await handle_refund_event(msg.value)
-                    logger.info("Processed refund event: %s", msg.value.get("id"))
-
-                await consumer.commit()
-                logger.debug("Committed offset for message: %s", msg.offset)
-            except Exception as e:
+                await process_batch([event for _, event in records if event is not None])
+            except Exception:
+                # Handle events one by one so only the failing ones are retried.
                 logger.exception(
-                    "Failed to process message from topic %s, offset %s. Will retry.",
-                    msg.topic, msg.offset
+                    "Failed to process batch of %s records, handling them one by one",
+                    len(records),
                 )
+                for msg, event in records:
+                    await router.handle(msg, event)
+            else:
+                for msg, event in records:
+                    if event is None:
+                        await router.handle(msg, event)
+
+            await consumer.commit(
+                {tp: messages[-1].offset + 1 for tp, messages in main.items()}
+            )
+            logger.debug("Committed offsets for batch of %s records", len(records))
+        except Exception:
+            logger.exception(
+                "Failed to process batch of %s records. Will retry.", len(records)
+            )
+            for tp, messages in main.items():
+                consumer.seek(tp, messages[0].offset)
+            await asyncio.sleep(REROUTE_FAILURE_BACKOFF_SECONDS)
+
+
+class _ResetLagOnRevoke(ConsumerRebalanceListener):
+    async def on_partitions_revoked(self, revoked) -> None:
+        # The new owner reports lag for these partitions from now on.
+        for tp in revoked:
+            KAFKA_LAG.labels(topic=tp.topic, partition=str(tp.partition)).set(0)
+
+    async def on_partitions_assigned(self, assigned) -> None:
+        pass
+
+
+class _DrainOnRevoke(_ResetLagOnRevoke):
+    def __init__(self, consumer: AIOKafkaConsumer, processor: ConcurrentProcessor):
+        self.consumer = consumer
+        self.processor = processor
+
+    async def on_partitions_revoked(self, revoked) -> None:
+        await self.processor.drain()
+        offsets = self.processor.tracker.committable()
+        if offsets:
+            await self.consumer.commit(offsets)
+            self.processor.tracker.mark_committed(offsets)
+        self.processor.tracker.forget(revoked)
+        await super().on_partitions_revoked(revoked)
+
+
+async def _consume_concurrently(
+    consumer: AIOKafkaConsumer,
+    router: RetryRouter,
+    processor: ConcurrentProcessor,
+    stop: asyncio.Event,
+) -> None:
+    processor.start()
+    try:
+        while not stop.is_set():
+            batches = await consumer.getmany(
+                timeout_ms=kafka_settings.batch_max_wait_ms,
+                max_records=kafka_settings.batch_size,
+            )
+            _record_lag(consumer, batches)
+            for tp, messages in batches.items():
+                if not router.is_retry_topic(tp.topic):
+                    for msg in messages:
+                        await processor.submit(msg)
+
+            offsets = processor.tracker.committable()
+            if offsets:
+                await consumer.commit(offsets)
+                processor.tracker.mark_committed(offsets)
+                logger.debug("Committed offsets %s", offsets)
+
+            try:
+                await _process_retries(consumer, router, batches)
+            except Exception:
+                logger.exception("Failed to process retried events. Will retry.")
+                for tp, messages in batches.items():
+                    if router.is_retry_topic(tp.topic) and messages:
+                        consumer.seek(tp, messages[0].offset)
+
+        # Graceful stop: finish what the workers already hold and commit it.
+        await processor.drain()
+        offsets = processor.tracker.committable()
+        if offsets:
+            await consumer.commit(offsets)
+            processor.tracker.mark_committed(offsets)
+    finally:
+        await processor.stop()
+
+
+async def start_kafka_consumer(
+    router: RetryRouter = retry_router,
+    *,
+    stop: asyncio.Event | None = None,
+    on_ready: Callable[[], None] | None = None,
+) -> None:
+    stop = stop or asyncio.Event()
+    consumer = AIOKafkaConsumer(
+        bootstrap_servers=kafka_settings.bootstrap_servers,
+        group_id=kafka_settings.group_id,
+        enable_auto_commit=False,
+        max_poll_records=kafka_settings.batch_size,
+    )
+
+    logger.info("Starting Kafka consumer (%s mode) for topics: %s, %s",
+                kafka_settings.processing_mode,
+                kafka_settings.payment_topic, kafka_settings.refund_topic)
+
+    topics = [
+        kafka_settings.payment_topic,
+        kafka_settings.refund_topic,
+        *router.retry_topics,
+    ]
+    processor: ConcurrentProcessor | None = None
+    if kafka_settings.processing_mode == "concurrent":
+        processor = ConcurrentProcessor(
+            concurrency=worker_count(),
+            batch_size=kafka_settings.batch_size,
+            router=router,
+        )
+        consumer.subscribe(topics, listener=_DrainOnRevoke(consumer, processor))
+    else:
+        consumer.subscribe(topics, listener=_ResetLagOnRevoke())
+
+    try:
+        await router.start()
+        await consumer.start()
+        if on_ready is not None:
+            on_ready()
+        if processor is not None:
+            await _consume_concurrently(consumer, router, processor, stop)
+        elif kafka_settings.processing_mode == "batch":
+            await _consume_batches(consumer, router, stop)
+        else:
+            await _consume_one_by_one(consumer, router, stop)
 
     finally:
         await consumer.stop()
+        await router.stop()
         logger.info("Kafka consumer stopped.")
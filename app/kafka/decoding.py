@@ -0,0 +1,32 @@
+from pydantic import ValidationError
+
+from app.kafka.schemas import PaymentEventSchema, RefundEventSchema
+from app.logging_config import logger
+from app.settings import kafka_settings
+
+
+Event = PaymentEventSchema | RefundEventSchema
+
+_payment_validator = PaymentEventSchema.__pydantic_validator__
+_refund_validator = RefundEventSchema.__pydantic_validator__
+
+
+def decode_event(topic: str, value: bytes | None) -> Event | None:
+    if value is None:
+        logger.warning("Skipping message without a value from topic %s", topic)
+        return None
+    try:
+        if topic == kafka_settings.payment_topic:
+            return _payment_validator.validate_json(value)
+        if topic == kafka_settings.refund_topic:
+            return _refund_validator.validate_json(value)
+    except ValidationError:
+        logger.exception("Skipping invalid event from topic %s", topic)
+        return None
+
+    logger.warning("Skipping event from unexpected topic %s", topic)
+    return None
+
+
+def subscription_key(event: Event) -> str | None:
+    return (event.extra_data or {}).get("subscription_id")
@@ -0,0 +1,28 @@
+from collections import OrderedDict
+from collections.abc import Iterable
+from uuid import UUID
+
+from app.settings import kafka_settings
+
+
+class RecentEventIds:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._ids: OrderedDict[UUID, None] = OrderedDict()
+
+    def __contains__(self, event_id: UUID) -> bool:
+        return event_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, event_ids: Iterable[UUID]) -> None:
+        for event_id in event_ids:
+            self._ids[event_id] = None
+            self._ids.move_to_end(event_id)
+        while len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+
+# Only ids whose processing has committed go in here.
+recent_event_ids = RecentEventIds(kafka_settings.dedup_cache_size)
@@ -0,0 +1,223 @@
+import asyncio
+import time
+
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRecord, TopicPartition
+
+from app.kafka.decoding import Event, decode_event
+from app.kafka.handlers import handle_event
+from app.logging_config import logger
+from app.metrics import KAFKA_REROUTED
+from app.settings import kafka_settings
+
+
+ORIGINAL_TOPIC_HEADER = "x-original-topic"
+ATTEMPT_HEADER = "x-attempt"
+RETRY_AT_HEADER = "x-retry-at"
+ERROR_HEADER = "x-error"
+
+
+def _header(msg: ConsumerRecord, name: str) -> str | None:
+    for key, value in msg.headers or ():
+        if key == name:
+            return value.decode()
+    return None
+
+
+def original_topic(msg: ConsumerRecord) -> str:
+    return _header(msg, ORIGINAL_TOPIC_HEADER) or msg.topic
+
+
+def attempt(msg: ConsumerRecord) -> int:
+    return int(_header(msg, ATTEMPT_HEADER) or 0)
+
+
+def retry_at(msg: ConsumerRecord) -> float:
+    return float(_header(msg, RETRY_AT_HEADER) or 0)
+
+
+class RetryRouter:
+    def __init__(
+        self,
+        bootstrap_servers: str,
+        *,
+        retry_topic_prefix: str,
+        delays_seconds: list[int],
+        dead_letter_topic: str,
+    ):
+        self.bootstrap_servers = bootstrap_servers
+        self.delays_seconds = delays_seconds
+        self.retry_topics = [f"{retry_topic_prefix}.{delay}s" for delay in delays_seconds]
+        self.dead_letter_topic = dead_letter_topic
+        self._producer: AIOKafkaProducer | None = None
+
+    def is_retry_topic(self, topic: str) -> bool:
+        return topic in self.retry_topics
+
+    async def start(self) -> None:
+        self._producer = AIOKafkaProducer(
+            bootstrap_servers=self.bootstrap_servers,
+            acks="all",
+            enable_idempotence=True,
+        )
+        await self._producer.start()
+
+    async def stop(self) -> None:
+        if self._producer is not None:
+            await self._producer.stop()
+            self._producer = None
+
+    async def reroute(
+        self,
+        msg: ConsumerRecord,
+        error: str,
+        *,
+        dead_letter: bool = False,
+    ) -> None:
+        if self._producer is None:
+            raise RuntimeError("Retry router is not started")
+        next_attempt = attempt(msg) + 1
+        headers = {
+            ORIGINAL_TOPIC_HEADER: original_topic(msg),
+            ATTEMPT_HEADER: str(next_attempt),
+            ERROR_HEADER: error[:1000],
+        }
+        if dead_letter or next_attempt > len(self.delays_seconds):
+            topic = self.dead_letter_topic
+            destination = "dead_letter"
+            logger.error(
+                "Dead-lettering message from %s (offset %s) after %s attempts: %s",
+                msg.topic, msg.offset, next_attempt, error,
+            )
+        else:
+            topic = self.retry_topics[next_attempt - 1]
+            destination = "retry"
+            headers[RETRY_AT_HEADER] = str(
+                time.time() + self.delays_seconds[next_attempt - 1]
+            )
+
+        await self._producer.send_and_wait(
+            topic,
+            msg.value,
+            key=msg.key,
+            headers=[(key, value.encode()) for key, value in headers.items()],
+        )
+        KAFKA_REROUTED.labels(destination=destination).inc()
+
+    async def handle(self, msg: ConsumerRecord, event: Event | None) -> None:
+        # Only failures to reroute propagate; the caller must not commit then.
+        if event is None:
+            await self.reroute(msg, "Undecodable event", dead_letter=True)
+            return
+        try:
+            await handle_event(event)
+        except Exception as e:
+            logger.exception(
+                "Failed to handle event %s from %s, scheduling a retry",
+                event.id, msg.topic,
+            )
+            await self.reroute(msg, repr(e))
+
+    async def process_retries(
+        self,
+        consumer: AIOKafkaConsumer,
+        tp: TopicPartition,
+        messages: list[ConsumerRecord],
+    ) -> None:
+        # A retry topic has a single delay, so its messages become due in
+        # order: the partition is paused until its first message is due.
+        handled: ConsumerRecord | None = None
+        for msg in messages:
+            wait = retry_at(msg) - time.time()
+            if wait > 0:
+                consumer.seek(tp, msg.offset)
+                consumer.pause(tp)
+                asyncio.get_running_loop().call_later(wait, _resume, consumer, tp)
+                break
+            await self.handle(msg, decode_event(original_topic(msg), msg.value))
+            handled = msg
+
+        if handled is not None:
+            await consumer.commit({tp: handled.offset + 1})
+
+
+def _resume(consumer: AIOKafkaConsumer, tp: TopicPartition) -> None:
+    if tp in consumer.assignment():
+        consumer.resume(tp)
+
+
+async def replay_dead_letters(*, limit: int | None = None, dry_run: bool = False) -> int:
+    consumer = AIOKafkaConsumer(
+        bootstrap_servers=kafka_settings.bootstrap_servers,
+        group_id=f"{kafka_settings.group_id}.dlq-replay",
+        enable_auto_commit=False,
+        auto_offset_reset="earliest",
+    )
+    producer = AIOKafkaProducer(
+        bootstrap_servers=kafka_settings.bootstrap_servers,
+        acks="all",
+        enable_idempotence=True,
+    )
+    await consumer.start()
+    await producer.start()
+    replayed = 0
+    try:
+        await consumer.topics()
+        partitions = [
+            TopicPartition(kafka_settings.dead_letter_topic, partition)
+            for partition in consumer.partitions_for_topic(kafka_settings.dead_letter_topic)
+            or ()
+        ]
+        if not partitions:
+            return 0
+        consumer.assign(partitions)
+        # Only what is in the topic now is replayed, so a message failing
+        # again on the way back is not picked up a second time.
+        end_offsets = await consumer.end_offsets(partitions)
+
+        while limit is None or replayed < limit:
+            remaining = [
+                tp for tp in partitions if await consumer.position(tp) < end_offsets[tp]
+            ]
+            if not remaining:
+                break
+            batches = await consumer.getmany(*remaining, timeout_ms=1000, max_records=500)
+
+            offsets: dict[TopicPartition, int] = {}
+            sends = []
+            for tp, messages in batches.items():
+                for msg in messages:
+                    if msg.offset >= end_offsets[tp] or (
+                        limit is not None and replayed >= limit
+                    ):
+                        break
+                    logger.info(
+                        "%s message %s:%s to %s (attempts: %s, error: %s)",
+                        "Would replay" if dry_run else "Replaying",
+                        tp.partition, msg.offset, original_topic(msg),
+                        attempt(msg), _header(msg, ERROR_HEADER),
+                    )
+                    if not dry_run:
+                        sends.append(
+                            await producer.send(original_topic(msg), msg.value, key=msg.key)
+                        )
+                    offsets[tp] = msg.offset + 1
+                    replayed += 1
+
+            if sends:
+                await asyncio.gather(*sends)
+            if offsets and not dry_run:
+                await consumer.commit(offsets)
+    finally:
+        await producer.stop()
+        await consumer.stop()
+
+    logger.info("%s %s dead-lettered messages", "Found" if dry_run else "Replayed", replayed)
+    return replayed
+
+
+retry_router = RetryRouter(
+    kafka_settings.bootstrap_servers,
+    retry_topic_prefix=kafka_settings.retry_topic_prefix,
+    delays_seconds=kafka_settings.retry_delays_seconds,
+    dead_letter_topic=kafka_settings.dead_letter_topic,
+)
@@ -0,0 +1,215 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import signal
+import time
+from multiprocessing.process import BaseProcess
+
+from aiohttp import web
+
+from app.logging_config import configure_cli_logging, logger
+
+
+HEARTBEAT_INTERVAL_SECONDS = 5
+RESPAWN_DELAY_SECONDS = 5
+
+
+def _consumer_process(index: int, heartbeats, ready) -> None:
+    configure_cli_logging()
+    asyncio.run(_run_consumer(index, heartbeats, ready))
+
+
+async def _run_consumer(index: int, heartbeats, ready) -> None:
+    # Imported here so the settings, engine and metrics are created in the
+    # child, after PROMETHEUS_MULTIPROC_DIR has been set by the supervisor.
+    from app.db.engine import async_engine
+    from app.kafka.consumer import start_kafka_consumer
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    async def beat() -> None:
+        while True:
+            heartbeats[index] = time.time()
+            await asyncio.sleep(HEARTBEAT_INTERVAL_SECONDS)
+
+    def mark_ready() -> None:
+        ready[index] = 1
+
+    heartbeat = asyncio.create_task(beat())
+    try:
+        await start_kafka_consumer(stop=stop, on_ready=mark_ready)
+    finally:
+        ready[index] = 0
+        heartbeat.cancel()
+        await async_engine.dispose()
+        logger.info("Consumer process %s exited", index)
+
+
+class ConsumerSupervisor:
+    def __init__(
+        self,
+        processes: int,
+        *,
+        shutdown_timeout_seconds: float,
+        heartbeat_timeout_seconds: float,
+    ):
+        self.processes = processes
+        self.shutdown_timeout_seconds = shutdown_timeout_seconds
+        self.heartbeat_timeout_seconds = heartbeat_timeout_seconds
+        self._context = multiprocessing.get_context("spawn")
+        self._heartbeats = self._context.Array("d", processes, lock=False)
+        self._ready = self._context.Array("b", processes, lock=False)
+        self._children: list[BaseProcess | None] = [None] * processes
+        self._spawned_at = [0.0] * processes
+        self._stopping_since: list[float | None] = [None] * processes
+        self.restarts = 0
+
+    def _spawn(self, index: int) -> None:
+        self._heartbeats[index] = time.time()
+        self._ready[index] = 0
+        child = self._context.Process(
+            target=_consumer_process,
+            args=(index, self._heartbeats, self._ready),
+            name=f"kafka-consumer-{index}",
+        )
+        child.start()
+        self._children[index] = child
+        self._spawned_at[index] = time.monotonic()
+        self._stopping_since[index] = None
+        logger.info("Started consumer process %s (pid %s)", index, child.pid)
+
+    def _reap(self, index: int, child: BaseProcess) -> None:
+        logger.error(
+            "Consumer process %s (pid %s) exited with code %s",
+            index, child.pid, child.exitcode,
+        )
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            from prometheus_client import multiprocess
+
+            multiprocess.mark_process_dead(child.pid)
+        self._children[index] = None
+
+    def _stop_if_hung(self, index: int, child: BaseProcess) -> None:
+        # A blocked event loop stops beating but keeps the process alive, so
+        # the respawn below would never see it exit. SIGTERM is handled by
+        # that same loop, hence the kill once the shutdown timeout passes.
+        stopping_since = self._stopping_since[index]
+        if stopping_since is None:
+            silent = time.time() - self._heartbeats[index]
+            if silent > self.heartbeat_timeout_seconds:
+                logger.warning(
+                    "Consumer process %s (pid %s) sent no heartbeat for %.0fs, terminating it",
+                    index, child.pid, silent,
+                )
+                child.terminate()
+                self._stopping_since[index] = time.monotonic()
+        elif time.monotonic() - stopping_since >= self.shutdown_timeout_seconds:
+            logger.warning(
+                "Consumer process %s (pid %s) did not stop in %ss, killing it",
+                index, child.pid, self.shutdown_timeout_seconds,
+            )
+            child.kill()
+
+    def status(self) -> list[dict]:
+        now = time.time()
+        return [
+            {
+                "index": index,
+                "pid": child.pid if child is not None else None,
+                "alive": child is not None and child.is_alive()
+                and now - self._heartbeats[index] <= self.heartbeat_timeout_seconds,
+                "ready": child is not None and child.is_alive() and bool(self._ready[index]),
+            }
+            for index, child in enumerate(self._children)
+        ]
+
+    async def _health(self, request: web.Request) -> web.Response:
+        status = self.status()
+        ok = all(process["alive"] for process in status)
+        return web.json_response(
+            {"processes": status, "restarts": self.restarts}, status=200 if ok else 503
+        )
+
+    async def _readiness(self, request: web.Request) -> web.Response:
+        status = self.status()
+        ok = all(process["ready"] for process in status)
+        return web.json_response({"processes": status}, status=200 if ok else 503)
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        from app.metrics import render
+
+        body, content_type = render()
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
+    async def _start_probe(self, port: int) -> web.AppRunner:
+        probe = web.Application()
+        probe.router.add_get("/health", self._health)
+        probe.router.add_get("/ready", self._readiness)
+        probe.router.add_get("/metrics", self._metrics)
+        runner = web.AppRunner(probe, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", port).start()
+        logger.info("Consumer probes listening on :%s", port)
+        return runner
+
+    async def run(self, health_port: int | None) -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        probe = await self._start_probe(health_port) if health_port else None
+        for index in range(self.processes):
+            self._spawn(index)
+
+        try:
+            while not stop.is_set():
+                for index, child in enumerate(self._children):
+                    if child is not None and child.is_alive():
+                        self._stop_if_hung(index, child)
+                    elif child is not None:
+                        self._reap(index, child)
+                    if (
+                        self._children[index] is None
+                        and time.monotonic() - self._spawned_at[index] >= RESPAWN_DELAY_SECONDS
+                    ):
+                        self.restarts += 1
+                        self._spawn(index)
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=1)
+                except TimeoutError:
+                    pass
+        finally:
+            await self._shutdown()
+            if probe is not None:
+                await probe.cleanup()
+
+    async def _shutdown(self) -> None:
+        children = [child for child in self._children if child is not None]
+        logger.info("Stopping %s consumer processes", len(children))
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout_seconds
+        for child in children:
+            await asyncio.to_thread(child.join, max(0.0, deadline - time.monotonic()))
+            if child.is_alive():
+                logger.warning(
+                    "Consumer process %s did not stop in %ss, killing it",
+                    child.pid, self.shutdown_timeout_seconds,
+                )
+                child.kill()
+                await asyncio.to_thread(child.join)
+
+
+def prepare_metrics_dir(directory: str | None) -> None:
+    if not directory:
+        return
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,141 @@
+import asyncio
+import zlib
+from collections.abc import Iterable
+
+from aiokafka import ConsumerRecord, TopicPartition
+
+from app.db.engine import async_engine
+from app.kafka.batch import process_batch
+from app.kafka.decoding import Event, decode_event, subscription_key
+from app.kafka.retry import RetryRouter
+from app.logging_config import logger
+from app.settings import kafka_settings
+
+
+def worker_count() -> int:
+    pool_size = async_engine.pool.size()  # type: ignore[attr-defined]
+    if kafka_settings.workers is None:
+        return pool_size
+    return max(1, min(kafka_settings.workers, pool_size))
+
+
+def routing_key(msg: ConsumerRecord, event: Event | None) -> str:
+    if event is None:
+        return f"{msg.topic}:{msg.partition}"
+    return subscription_key(event) or str(event.id)
+
+
+class OffsetTracker:
+    def __init__(self) -> None:
+        self._pending: dict[TopicPartition, set[int]] = {}
+        self._next: dict[TopicPartition, int] = {}
+        self._committed: dict[TopicPartition, int] = {}
+
+    def add(self, tp: TopicPartition, offset: int) -> None:
+        self._pending.setdefault(tp, set()).add(offset)
+        self._next[tp] = max(self._next.get(tp, 0), offset + 1)
+
+    def done(self, tp: TopicPartition, offset: int) -> None:
+        pending = self._pending.get(tp)
+        if pending is not None:
+            pending.discard(offset)
+
+    def committable(self) -> dict[TopicPartition, int]:
+        offsets = {}
+        for tp, next_offset in self._next.items():
+            pending = self._pending.get(tp)
+            offset = min(pending) if pending else next_offset
+            if offset > self._committed.get(tp, -1):
+                offsets[tp] = offset
+        return offsets
+
+    def mark_committed(self, offsets: dict[TopicPartition, int]) -> None:
+        self._committed.update(offsets)
+
+    def forget(self, partitions: Iterable[TopicPartition]) -> None:
+        for tp in partitions:
+            self._pending.pop(tp, None)
+            self._next.pop(tp, None)
+            self._committed.pop(tp, None)
+
+
+class ConcurrentProcessor:
+    def __init__(self, concurrency: int, batch_size: int, router: RetryRouter):
+        self.batch_size = batch_size
+        self.router = router
+        self.tracker = OffsetTracker()
+        self._queues: list[asyncio.Queue[tuple[ConsumerRecord, Event | None]]] = [
+            asyncio.Queue(maxsize=batch_size) for _ in range(concurrency)
+        ]
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._worker(index, queue))
+            for index, queue in enumerate(self._queues)
+        ]
+        logger.info("Started %s Kafka worker tasks", len(self._tasks))
+
+    async def submit(self, msg: ConsumerRecord) -> None:
+        event = decode_event(msg.topic, msg.value)
+        key = routing_key(msg, event).encode()
+        queue = self._queues[zlib.crc32(key) % len(self._queues)]
+        self.tracker.add(TopicPartition(msg.topic, msg.partition), msg.offset)
+        await queue.put((msg, event))
+
+    async def drain(self) -> None:
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _process(
+        self,
+        index: int,
+        items: list[tuple[ConsumerRecord, Event | None]],
+    ) -> None:
+        try:
+            await process_batch([event for _, event in items if event is not None])
+        except Exception:
+            logger.exception(
+                "Worker %s failed to process %s events, handling them one by one",
+                index, len(items),
+            )
+            for msg, event in items:
+                await self.router.handle(msg, event)
+            return
+
+        for msg, event in items:
+            if event is None:
+                await self.router.handle(msg, event)
+
+    async def _worker(
+        self,
+        index: int,
+        queue: asyncio.Queue[tuple[ConsumerRecord, Event | None]],
+    ) -> None:
+        while True:
+            items = [await queue.get()]
+            while len(items) < self.batch_size and not queue.empty():
+                items.append(queue.get_nowait())
+
+            attempt = 0
+            while True:
+                try:
+                    await self._process(index, items)
+                    break
+                except Exception:
+                    # Failed events could not even be sent to a retry topic.
+                    attempt += 1
+                    logger.exception(
+                        "Worker %s failed to process %s events (attempt %s). Will retry.",
+                        index, len(items), attempt,
+                    )
+                    await asyncio.sleep(min(2 ** attempt, 30))
+
+            for msg, _ in items:
+                self.tracker.done(TopicPartition(msg.topic, msg.partition), msg.offset)
+                queue.task_done()
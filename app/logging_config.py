@@ -3,3 +3,11 @@ import logging
 
 logger = logging.getLogger("subscription_service")
 logger.setLevel(logging.INFO)
+
+
+def configure_cli_logging() -> None:
+    # Outside gunicorn/uvicorn nothing installs a handler for our logger.
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(processName)s %(levelname)s %(message)s",
+    )
@@ -1,15 +1,32 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqladmin import Admin
 from sqladmin.authentication import AuthenticationBackend
 from starlette.requests import Request
 
+from app import metrics
 from app.logging_config import logger
 from app.settings import settings
-from app.db.engine import async_engine
+from app.db.engine import routing_session_factory
+from app.api.v1.entitlements import router as entitlements_router
+from app.api.v1.reports import router as reports_router
 from app.api.v1.subscriptions import router as subscriptions_router
-from app.admin.views import SubscriptionAdmin, PlanAdmin
+from app.admin.views import SubscriptionAdmin, PlanAdmin, SubscriptionRollupAdmin
+from app.db.listener import pg_listener
 from app.deps.auth import require_admin
+from app.services.entitlements import entitlement_cache
+from app.services.expiry import expiry_processor
+from app.services.billing_client import billing_client
+from app.services.http_client import http_client
+from app.services.idempotency import idempotency_store
+from app.services.outbox import outbox_dispatcher
+from app.services.plan_catalog import plan_catalog
+from app.services.processed_events import processed_events_retention
+from app.services.renewal import renewal_scheduler
+from app.services.rollups import subscription_rollups
 
 
 logger.info("Starting Subscription Service")
@@ -25,8 +42,59 @@ class RequireAdminBackend(AuthenticationBackend):
             return False
 
 
+async def _warm_up_entitlements() -> None:
+    try:
+        await entitlement_cache.warm_up()
+    except Exception:
+        logger.exception("Entitlement cache warm-up failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.renewal_enabled and not settings.renewal_return_url:
+        raise RuntimeError(
+            "SUBSCRIPTION_API_RENEWAL_RETURN_URL must be set while renewals are enabled"
+        )
+    # Renewals move next_billing_at forward and leave the charge to the
+    # outbox: without a dispatcher they would be skipped silently.
+    if settings.renewal_enabled and not settings.billing_outbox_dispatcher_enabled:
+        raise RuntimeError(
+            "Renewals need SUBSCRIPTION_API_BILLING_OUTBOX_DISPATCHER_ENABLED in the same worker"
+        )
+
+    await http_client.start()
+    await pg_listener.start()
+
+    background: list[asyncio.Task] = []
+    if settings.billing_outbox_dispatcher_enabled:
+        background.append(asyncio.create_task(outbox_dispatcher.run()))
+    if settings.renewal_enabled:
+        background.append(asyncio.create_task(renewal_scheduler.run()))
+    if settings.expiry_enabled:
+        background.append(asyncio.create_task(expiry_processor.run()))
+    if settings.processed_events_retention_enabled:
+        background.append(asyncio.create_task(processed_events_retention.run()))
+    if settings.idempotency_cleanup_enabled:
+        background.append(asyncio.create_task(idempotency_store.run()))
+    if settings.rollup_reconcile_enabled:
+        background.append(asyncio.create_task(subscription_rollups.run()))
+    if settings.entitlement_warmup_enabled:
+        background.append(asyncio.create_task(_warm_up_entitlements()))
+
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await pg_listener.stop()
+        await http_client.close()
+
+
 app = FastAPI(
     title=settings.project_name,
+    lifespan=lifespan,
     version="1.0.0",
     docs_url="/api/openapi",
     openapi_url="/api/openapi.json",
@@ -44,16 +112,44 @@ app.include_router(
     subscriptions_router,
     prefix="/api/v1",
 )
+app.include_router(
+    entitlements_router,
+    prefix="/api/v1",
+)
+app.include_router(
+    reports_router,
+    prefix="/api/v1",
+)
 
 admin = Admin(
     app=app,
-    engine=async_engine.sync_engine,
+    session_maker=routing_session_factory,
     authentication_backend=RequireAdminBackend(secret_key=settings.secret_key),
 )
 admin.add_view(PlanAdmin)
 admin.add_view(SubscriptionAdmin)
+admin.add_view(SubscriptionRollupAdmin)
 
 @app.get("/health", tags=["health"])
 async def health() -> dict:
-    logger.info("Health check requested")
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/stats", tags=["health"], dependencies=[Depends(require_admin)])
+async def stats() -> dict:
+    return {
+        "http_pool": http_client.stats(),
+        "billing": billing_client.stats(),
+        "billing_outbox": outbox_dispatcher.stats(),
+        "plan_catalog": plan_catalog.stats(),
+        "entitlements": entitlement_cache.stats(),
+        "renewals": renewal_scheduler.stats(),
+        "expiry": expiry_processor.stats(),
+        "rollups": subscription_rollups.stats(),
+    }
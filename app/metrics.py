@@ -0,0 +1,223 @@
+import os
+import time
+from collections.abc import Callable, Coroutine
+from functools import wraps
+from typing import Any, ParamSpec, TypeVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+SERVICE_LATENCY = Histogram(
+    "subscription_service_seconds",
+    "SubscriptionService method latency",
+    ["method", "outcome"],
+)
+CLIENT_LATENCY = Histogram(
+    "external_call_seconds",
+    "Latency of calls to Billing and Auth services",
+    ["client", "operation", "outcome"],
+)
+CIRCUIT_STATE = Gauge(
+    "client_circuit_state",
+    "Circuit breaker state: 0 closed, 1 half-open, 2 open (worst process)",
+    ["client"],
+    multiprocess_mode="livemax",
+)
+CLIENT_REJECTIONS = Counter(
+    "client_rejected_calls_total",
+    "Calls failed fast without reaching the remote service",
+    ["client", "reason"],
+)
+CLIENT_CONCURRENCY_LIMIT = Gauge(
+    "client_concurrency_limit",
+    "Current adaptive in-flight limit for calls to a service",
+    ["client"],
+    multiprocess_mode="livesum",
+)
+CLIENT_IN_FLIGHT = Gauge(
+    "client_in_flight_calls",
+    "Calls to a service currently in flight",
+    ["client"],
+    multiprocess_mode="livesum",
+)
+STATUS_TRANSITIONS = Counter(
+    "subscription_status_transitions_total",
+    "Subscriptions moved into a status",
+    ["status"],
+)
+OUTBOX_FAILED = Counter(
+    "billing_outbox_failed_total",
+    "Billing commands given up on after the last attempt",
+    ["command"],
+)
+RENEWALS = Counter(
+    "subscription_renewals_total",
+    "Due subscriptions moved to their next period with a renewal payment queued",
+)
+RENEWAL_CHUNK_SECONDS = Histogram(
+    "subscription_renewal_chunk_seconds",
+    "Time to renew one chunk of due subscriptions",
+)
+RENEWAL_BACKLOG = Gauge(
+    "subscription_renewal_backlog",
+    "Due subscriptions waiting for renewal at the last backlog refresh",
+    multiprocess_mode="livemax",
+)
+RENEWAL_OLDEST_DUE = Gauge(
+    "subscription_renewal_oldest_due_seconds",
+    "How long the oldest due subscription has been waiting for renewal",
+    multiprocess_mode="livemax",
+)
+ROLLUP_DRIFT = Gauge(
+    "subscription_rollup_drift_keys",
+    "(plan, status) rollup rows that disagreed with subscriptions at the last reconciliation",
+    multiprocess_mode="livemax",
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    ["pool"],
+    buckets=FAST_BUCKETS,
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Connections checked out of the SQLAlchemy pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_connections_max",
+    "pool_size + max_overflow of the SQLAlchemy pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_UTILIZATION = Gauge(
+    "db_pool_utilization_ratio",
+    "Share of the SQLAlchemy pool in use (busiest process)",
+    ["pool"],
+    multiprocess_mode="livemax",
+)
+
+KAFKA_LAG = Gauge(
+    "kafka_consumer_lag",
+    "Messages behind the partition high watermark",
+    ["topic", "partition"],
+    multiprocess_mode="livemax",
+)
+KAFKA_BATCH_SECONDS = Histogram(
+    "kafka_batch_processing_seconds",
+    "Time to process one batch of Kafka events",
+    ["outcome"],
+)
+KAFKA_DUPLICATES = Counter(
+    "kafka_duplicate_events_total",
+    "Redelivered events skipped, by where the duplicate was detected",
+    ["source"],
+)
+KAFKA_REROUTED = Counter(
+    "kafka_rerouted_events_total",
+    "Failed events sent to a retry or the dead-letter topic",
+    ["destination"],
+)
+KAFKA_BATCH_SIZE = Histogram(
+    "kafka_batch_size",
+    "Events per processed Kafka batch",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500),
+)
+
+
+def timed(
+    histogram: Histogram, **labels: str
+) -> Callable[[Callable[P, Coroutine[Any, Any, T]]], Callable[P, Coroutine[Any, Any, T]]]:
+    def decorator(
+        func: Callable[P, Coroutine[Any, Any, T]]
+    ) -> Callable[P, Coroutine[Any, Any, T]]:
+        @wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                histogram.labels(outcome=outcome, **labels).observe(
+                    time.perf_counter() - started
+                )
+
+        return wrapper
+
+    return decorator
+
+
+def record_transition(status, count: int = 1) -> None:
+    if count:
+        STATUS_TRANSITIONS.labels(status=status.value).inc(count)
+
+
+def record_lag(topic: str, partition: int, highwater: int | None, position: int) -> None:
+    if highwater is not None:
+        KAFKA_LAG.labels(topic=topic, partition=str(partition)).set(
+            max(0, highwater - position)
+        )
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    metrics_label = "primary"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels(pool=self.metrics_label).observe(
+                time.perf_counter() - started
+            )
+
+
+def instrument_pool(engine, name: str = "primary") -> None:
+    pool = engine.sync_engine.pool
+    pool.metrics_label = name
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    DB_POOL_CAPACITY.labels(pool=name).set(capacity)
+    in_use_gauge = DB_POOL_IN_USE.labels(pool=name)
+    utilization_gauge = DB_POOL_UTILIZATION.labels(pool=name)
+
+    def _update(in_use: int) -> None:
+        in_use_gauge.set(in_use)
+        utilization_gauge.set(in_use / capacity if capacity else 0.0)
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(*args) -> None:
+        _update(pool.checkedout())
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(*args) -> None:
+        # Fired before the connection is handed back to the pool.
+        _update(max(0, pool.checkedout() - 1))
+
+
+def render() -> tuple[bytes, str]:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,5 +1,17 @@
 from .subscription import Subscription
 from .plan import Plan
 from .processed_event import ProcessedEvent
+from .billing_outbox import BillingOutbox
+from .idempotency_key import IdempotencyKey
+from .subscription_rollup import SubscriptionRollup
+from .import_checkpoint import ImportCheckpoint
 
-__all__ = ["Subscription", "Plan", "ProcessedEvent"]
+__all__ = [
+    "Subscription",
+    "Plan",
+    "ProcessedEvent",
+    "BillingOutbox",
+    "IdempotencyKey",
+    "SubscriptionRollup",
+    "ImportCheckpoint",
+]
@@ -1,4 +1,6 @@
-from sqlalchemy import MetaData
+from datetime import datetime
+
+from sqlalchemy import DateTime, MetaData
 from sqlalchemy.orm import declarative_base
 
 
@@ -13,4 +15,7 @@ metadata = MetaData(
 )
 
 
-Base = declarative_base(metadata=metadata)
+Base = declarative_base(
+    metadata=metadata,
+    type_annotation_map={datetime: DateTime(timezone=True)},
+)
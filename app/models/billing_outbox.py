@@ -0,0 +1,46 @@
+import enum
+from uuid import UUID, uuid4
+from datetime import datetime
+
+from sqlalchemy import Enum, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from app.models.base import Base
+
+
+class OutboxCommand(str, enum.Enum):
+    CREATE_PAYMENT = "CREATE_PAYMENT"
+    CREATE_REFUND = "CREATE_REFUND"
+
+
+class OutboxStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+
+class BillingOutbox(Base):
+    __tablename__ = "billing_outbox"
+    __table_args__ = (
+        Index(
+            "ix_billing_outbox_pending_available_at",
+            "available_at",
+            postgresql_where=text("status = 'PENDING'"),
+        ),
+    )
+
+    id: Mapped[UUID] = mapped_column(primary_key=True, default=uuid4)
+    command: Mapped[OutboxCommand] = mapped_column(Enum(OutboxCommand))
+    payload: Mapped[dict] = mapped_column(JSONB)
+    status: Mapped[OutboxStatus] = mapped_column(
+        Enum(OutboxStatus),
+        default=OutboxStatus.PENDING,
+    )
+    attempts: Mapped[int] = mapped_column(default=0)
+    last_error: Mapped[str | None] = mapped_column(default=None)
+
+    available_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    sent_at: Mapped[datetime | None] = mapped_column(default=None)
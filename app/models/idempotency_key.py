@@ -0,0 +1,26 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import Index, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from app.models.base import Base
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (Index("ix_idempotency_keys_expires_at", "expires_at"),)
+
+    user_id: Mapped[UUID] = mapped_column(primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64))
+
+    # NULL until the first request finishes; until then the key is in flight.
+    response_status: Mapped[int | None] = mapped_column(default=None)
+    response_body: Mapped[dict | None] = mapped_column(JSONB, default=None)
+
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    locked_until: Mapped[datetime]
+    expires_at: Mapped[datetime]
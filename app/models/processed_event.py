@@ -9,10 +9,15 @@ from app.models.base import Base
 
 class ProcessedEvent(Base):
     __tablename__ = "processed_events"
+    # Daily range partitions are created and dropped by ProcessedEventsRetention.
+    # The partition key has to be part of the primary key, so uniqueness of
+    # ``id`` alone is enforced by the dedup lookup, not by a constraint.
+    __table_args__ = {"postgresql_partition_by": "RANGE (processed_at)"}
 
     id: Mapped[UUID] = mapped_column(primary_key=True)
 
     processed_at: Mapped[datetime] = mapped_column(
+        primary_key=True,
         server_default=func.now(),
         nullable=False,
     )
@@ -2,7 +2,7 @@ import enum
 from uuid import UUID, uuid4
 from datetime import datetime, timezone
 
-from sqlalchemy import Enum, ForeignKey
+from sqlalchemy import Enum, ForeignKey, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.models.base import Base
@@ -14,10 +14,31 @@ class SubscriptionStatus(str, enum.Enum):
     CANCELLED = "CANCELLED"
     REFUND_REQUESTED = "REFUND_REQUESTED"
     REFUNDED = "REFUNDED"
+    EXPIRED = "EXPIRED"
 
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        Index(
+            "ix_subscriptions_user_id_created_at_id",
+            "user_id",
+            "created_at",
+            "id",
+        ),
+        Index("ix_subscriptions_created_at_id", "created_at", "id"),
+        Index("ix_subscriptions_status_created_at_id", "status", "created_at", "id"),
+        Index(
+            "ix_subscriptions_active_next_billing_at",
+            "next_billing_at",
+            postgresql_where=text("status = 'ACTIVE'"),
+        ),
+        Index(
+            "ix_subscriptions_active_expires_at",
+            "expires_at",
+            postgresql_where=text("status = 'ACTIVE'"),
+        ),
+    )
 
     id: Mapped[UUID] = mapped_column(primary_key=True, default=uuid4)
     user_id: Mapped[UUID] = mapped_column(index=True)
@@ -26,12 +47,18 @@ class Subscription(Base):
     status: Mapped[SubscriptionStatus] = mapped_column(
         Enum(SubscriptionStatus),
         default=SubscriptionStatus.PENDING_PAYMENT,
-        index=True,
     )
 
     payment_id: Mapped[UUID | None] = mapped_column(default=None)
+    next_billing_at: Mapped[datetime | None] = mapped_column(default=None)
+    # End of the paid period; ExpiryProcessor moves ACTIVE subscriptions
+    # past it (and the grace period) to EXPIRED.
+    expires_at: Mapped[datetime | None] = mapped_column(default=None)
 
-    created_at: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
+    created_at: Mapped[datetime] = mapped_column(
+        default=lambda: datetime.now(timezone.utc)
+    )
     updated_at: Mapped[datetime] = mapped_column(
-        default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc)
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
     )
@@ -0,0 +1,29 @@
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+
+from sqlalchemy import BigInteger, Enum, ForeignKey, Numeric, String
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from app.models.base import Base
+from app.models.subscription import SubscriptionStatus
+
+
+class SubscriptionRollup(Base):
+    __tablename__ = "subscription_rollups"
+
+    plan_id: Mapped[UUID] = mapped_column(ForeignKey("plans.id"), primary_key=True)
+    status: Mapped[SubscriptionStatus] = mapped_column(
+        Enum(SubscriptionStatus, native_enum=False, length=20), primary_key=True
+    )
+    # Writers spread over a few rows per key so concurrent transitions of
+    # the same plan do not queue on one row lock; readers sum the shards.
+    shard: Mapped[int] = mapped_column(primary_key=True)
+
+    currency: Mapped[str] = mapped_column(String(3))
+    count: Mapped[int] = mapped_column(BigInteger, default=0)
+    amount: Mapped[Decimal] = mapped_column(Numeric(20, 2), default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        server_default=func.now(), onupdate=func.now()
+    )
@@ -1,7 +1,9 @@
 from app.services.billing_client import BillingClient
+from app.services.http_client import HttpClient
 from app.services.subscription import SubscriptionService
 
 __all__ = [
     "BillingClient",
+    "HttpClient",
     "SubscriptionService",
 ]
@@ -1,14 +1,96 @@
+import asyncio
 from decimal import Decimal
 from uuid import UUID
-import aiohttp
+
+from aiohttp import ClientError, ClientResponseError
+from fastapi import HTTPException
 
 from app.logging_config import logger
+from app.metrics import CLIENT_LATENCY, timed
+from app.services.http_client import HttpClient, http_client
+from app.services.resilience import AdaptiveLimiter, CircuitBreaker, CircuitOpenError
+from app.settings import settings
 
 
 class BillingClient:
-    def __init__(self, base_url: str):
+    def __init__(
+        self,
+        base_url: str,
+        http: HttpClient,
+        *,
+        timeout_seconds: float,
+        breaker: CircuitBreaker,
+        limiter: AdaptiveLimiter,
+    ):
         self.base_url = base_url.rstrip("/")
+        self.http = http
+        self.timeout_seconds = timeout_seconds
+        self.breaker = breaker
+        self.limiter = limiter
 
+    @staticmethod
+    def _headers(idempotency_key: UUID | None) -> dict[str, str]:
+        if idempotency_key is None:
+            return {}
+        return {"Idempotency-Key": str(idempotency_key)}
+
+    async def _post(
+        self, path: str, payload: dict, idempotency_key: UUID | None
+    ) -> None:
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            raise HTTPException(status_code=503, detail="Billing service unavailable")
+
+        # Waiting for a slot and the request itself are bounded separately,
+        # so only a slow billing response counts against the breaker.
+        try:
+            async with asyncio.timeout(self.timeout_seconds):
+                started = await self.limiter.acquire()
+        except TimeoutError:
+            self.breaker.on_ignored()
+            raise HTTPException(status_code=503, detail="Billing service overloaded")
+        except BaseException:
+            # Cancelled while queued: a half-open probe that never ran has
+            # to be handed back, or every later call is rejected.
+            self.breaker.on_ignored()
+            raise
+
+        try:
+            async with asyncio.timeout(self.timeout_seconds):
+                async with self.http.session.post(
+                    f"{self.base_url}{path}",
+                    json=payload,
+                    headers=self._headers(idempotency_key),
+                ) as resp:
+                    resp.raise_for_status()
+        except TimeoutError:
+            self.breaker.on_failure()
+            raise HTTPException(status_code=504, detail="Billing service timed out")
+        except ClientResponseError as e:
+            if e.status >= 500 or e.status == 429:
+                self.breaker.on_failure()
+            else:
+                self.breaker.on_success()
+            raise
+        except ClientError:
+            self.breaker.on_failure()
+            raise
+        except BaseException:
+            self.breaker.on_ignored()
+            raise
+        finally:
+            self.limiter.release(started)
+        self.breaker.on_success()
+
+    def stats(self) -> dict:
+        return {
+            "timeout_seconds": self.timeout_seconds,
+            "circuit": self.breaker.stats(),
+            "concurrency": self.limiter.stats(),
+        }
+
+    @timed(CLIENT_LATENCY, client="billing", operation="create_payment")
     async def create_payment(
         self,
         *,
@@ -18,6 +100,7 @@ class BillingClient:
         return_url: str,
         extra_data: dict | None = None,
         handler_url: str | None = None,
+        idempotency_key: UUID | None = None,
     ) -> None:
         payload = {
             "user_id": str(user_id),
@@ -31,22 +114,23 @@ class BillingClient:
             payload["handler_url"] = handler_url
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/api/v1/payment",
-                    json=payload,
-                ) as resp:
-                    resp.raise_for_status()
+            await self._post("/api/v1/payment", payload, idempotency_key)
             logger.info(
                 "Created payment for user_id=%s, amount=%s %s, return_url=%s",
                 user_id, amount, currency, return_url
             )
+        except HTTPException as e:
+            logger.warning(
+                "Failed to create payment for user_id=%s: %s", user_id, e.detail
+            )
+            raise
         except Exception as e:
             logger.exception(
                 "Failed to create payment for user_id=%s: %s", user_id, e
             )
             raise
 
+    @timed(CLIENT_LATENCY, client="billing", operation="create_refund")
     async def create_refund(
         self,
         *,
@@ -55,6 +139,7 @@ class BillingClient:
         currency: str,
         extra_data: dict | None = None,
         handler_url: str | None = None,
+        idempotency_key: UUID | None = None,
     ) -> None:
         payload = {
             "amount": str(amount),
@@ -66,18 +151,38 @@ class BillingClient:
             payload["handler_url"] = handler_url
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/api/v1/payment/{payment_id}/refund",
-                    json=payload,
-                ) as resp:
-                    resp.raise_for_status()
+            await self._post(
+                f"/api/v1/payment/{payment_id}/refund", payload, idempotency_key
+            )
             logger.info(
                 "Created refund for payment_id=%s, amount=%s %s",
                 payment_id, amount, currency
             )
+        except HTTPException as e:
+            logger.warning(
+                "Failed to create refund for payment_id=%s: %s", payment_id, e.detail
+            )
+            raise
         except Exception as e:
             logger.exception(
                 "Failed to create refund for payment_id=%s: %s", payment_id, e
             )
             raise
+
+
+billing_client = BillingClient(
+    settings.bill_api_base_url,
+    http=http_client,
+    timeout_seconds=settings.billing_timeout_seconds,
+    breaker=CircuitBreaker(
+        "billing",
+        failure_threshold=settings.billing_breaker_failure_threshold,
+        reset_seconds=settings.billing_breaker_reset_seconds,
+    ),
+    limiter=AdaptiveLimiter(
+        "billing",
+        min_limit=settings.billing_concurrency_min,
+        max_limit=settings.billing_concurrency_max,
+        latency_tolerance=settings.billing_latency_tolerance,
+    ),
+)
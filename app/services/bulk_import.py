@@ -0,0 +1,354 @@
+import csv
+import gzip
+import json
+import sys
+import time
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Literal, TextIO
+from uuid import UUID
+
+from pydantic import BaseModel, ValidationError, model_validator
+from sqlalchemy import column, delete, exists, func, select, table, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.db.engine import async_engine
+from app.logging_config import logger
+from app.models.import_checkpoint import ImportCheckpoint
+from app.models.processed_event import ProcessedEvent
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.services.entitlements import EntitlementCache, entitlement_cache
+from app.services.plan_catalog import PlanCatalog, plan_catalog
+from app.services.rollups import SubscriptionRollups, subscription_rollups
+from app.settings import settings
+
+
+ImportFormat = Literal["csv", "ndjson"]
+
+SUBSCRIPTION_COLUMNS = (
+    "id",
+    "user_id",
+    "plan_id",
+    "status",
+    "payment_id",
+    "next_billing_at",
+    "expires_at",
+    "created_at",
+    "updated_at",
+)
+STAGING_TABLE = "subscription_import"
+
+_staging = table(
+    STAGING_TABLE,
+    *(column(name) for name in SUBSCRIPTION_COLUMNS),
+    column("event_id"),
+)
+
+# Same column types as subscriptions whatever they are in this database;
+# the table lives as long as the import's connection.
+_CREATE_STAGING = text(
+    f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} AS "
+    f"SELECT {', '.join(SUBSCRIPTION_COLUMNS)}, NULL::uuid AS event_id "
+    "FROM subscriptions WITH NO DATA"
+)
+
+_MERGE = (
+    insert(Subscription)
+    .from_select(
+        list(SUBSCRIPTION_COLUMNS),
+        select(*(_staging.c[name] for name in SUBSCRIPTION_COLUMNS)),
+    )
+    .on_conflict_do_nothing(index_elements=[Subscription.id])
+    .returning(Subscription.user_id, Subscription.plan_id, Subscription.status)
+)
+
+# processed_events is partitioned, so ids are only unique through this check.
+_MARK_EVENTS = insert(ProcessedEvent).from_select(
+    ["id"],
+    select(_staging.c.event_id)
+    .distinct()
+    .where(
+        _staging.c.event_id.is_not(None),
+        ~exists().where(ProcessedEvent.id == _staging.c.event_id),
+    ),
+)
+
+_LOCK = text("SELECT pg_try_advisory_lock(hashtext('subscription_import:' || :name))")
+_UNLOCK = text("SELECT pg_advisory_unlock(hashtext('subscription_import:' || :name))")
+
+
+class ImportedSubscription(BaseModel):
+    subscription_id: UUID
+    user_id: UUID
+    plan_id: UUID
+    status: SubscriptionStatus
+    payment_id: UUID | None = None
+    next_billing_at: datetime | None = None
+    expires_at: datetime | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+    # ID of the legacy payment event that led to this subscription; recorded
+    # in processed_events so a replay of that event is recognised.
+    event_id: UUID | None = None
+
+    @model_validator(mode="after")
+    def _billing_dates(self) -> "ImportedSubscription":
+        # An active subscription is paid up to expires_at and charged again
+        # at next_billing_at; without either it would never renew or expire.
+        if self.status == SubscriptionStatus.ACTIVE:
+            if self.next_billing_at is None and self.expires_at is None:
+                raise ValueError("ACTIVE subscription needs next_billing_at or expires_at")
+            self.next_billing_at = self.next_billing_at or self.expires_at
+            self.expires_at = self.expires_at or self.next_billing_at
+        return self
+
+
+@dataclass
+class ImportProgress:
+    position: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    events: int = 0
+    finished: bool = False
+
+
+def input_format(path: str) -> ImportFormat:
+    name = path.removesuffix(".gz")
+    return "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+def open_input(path: str) -> TextIO:
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="")
+    return open(path, newline="")
+
+
+def read_records(file: TextIO, format: ImportFormat) -> Iterator[dict | str]:
+    # The same CSV columns as the export; columns the import does not know
+    # (plan_name, amount, ...) are ignored.
+    if format == "csv":
+        for record in csv.DictReader(file):
+            yield {key: value for key, value in record.items() if key and value}
+    else:
+        for line in file:
+            if line.strip():
+                yield line
+
+
+def _parse(record: dict | str) -> ImportedSubscription:
+    if isinstance(record, str):
+        return ImportedSubscription.model_validate_json(record)
+    return ImportedSubscription.model_validate(record)
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _staging_row(item: ImportedSubscription, now: datetime) -> tuple:
+    created_at = _utc(item.created_at) if item.created_at else now
+    next_billing_at = _utc(item.next_billing_at) if item.next_billing_at else None
+    expires_at = _utc(item.expires_at) if item.expires_at else None
+    return (
+        item.subscription_id,
+        item.user_id,
+        item.plan_id,
+        item.status.value,
+        item.payment_id,
+        next_billing_at,
+        expires_at,
+        created_at,
+        _utc(item.updated_at) if item.updated_at else created_at,
+        item.event_id,
+    )
+
+
+class SubscriptionImporter:
+    def __init__(
+        self,
+        *,
+        batch_size: int,
+        plans: PlanCatalog,
+        rollups: SubscriptionRollups,
+        entitlements: EntitlementCache,
+    ):
+        self.batch_size = batch_size
+        self.plans = plans
+        self.rollups = rollups
+        self.entitlements = entitlements
+
+    async def _load(self, conn: AsyncConnection, name: str, restart: bool) -> ImportProgress:
+        async with conn.begin():
+            if restart:
+                await conn.execute(delete(ImportCheckpoint).where(ImportCheckpoint.name == name))
+                return ImportProgress()
+            row = (
+                await conn.execute(
+                    select(
+                        ImportCheckpoint.position,
+                        ImportCheckpoint.inserted,
+                        ImportCheckpoint.duplicates,
+                        ImportCheckpoint.rejected,
+                        ImportCheckpoint.events,
+                        ImportCheckpoint.finished,
+                    ).where(ImportCheckpoint.name == name)
+                )
+            ).one_or_none()
+        return ImportProgress(*row) if row is not None else ImportProgress()
+
+    async def _save(
+        self,
+        connection: AsyncSession | AsyncConnection,
+        name: str,
+        source: str,
+        progress: ImportProgress,
+    ) -> None:
+        values = {
+            "source": source,
+            "position": progress.position,
+            "inserted": progress.inserted,
+            "duplicates": progress.duplicates,
+            "rejected": progress.rejected,
+            "events": progress.events,
+            "finished": progress.finished,
+        }
+        stmt = insert(ImportCheckpoint).values(name=name, **values)
+        await connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ImportCheckpoint.name],
+                set_={**values, "updated_at": func.now()},
+            )
+        )
+
+    async def _import_batch(
+        self,
+        conn: AsyncConnection,
+        name: str,
+        source: str,
+        progress: ImportProgress,
+        batch: list[tuple[int, dict | str]],
+        rejects: TextIO | None,
+    ) -> None:
+        parsed: list[tuple[int, dict | str, ImportedSubscription]] = []
+        rejected: list[tuple[int, str, dict | str]] = []
+        for position, record in batch:
+            try:
+                parsed.append((position, record, _parse(record)))
+            except ValidationError as e:
+                rejected.append((position, str(e), record))
+
+        async with AsyncSession(bind=conn) as session, session.begin():
+            plans = await self.plans.get_many(
+                session, {item.plan_id for _, _, item in parsed}
+            )
+            known = []
+            for position, record, item in parsed:
+                if item.plan_id in plans:
+                    known.append(item)
+                else:
+                    rejected.append((position, f"Unknown plan {item.plan_id}", record))
+
+            # Goes through SQLAlchemy first so the asyncpg transaction that
+            # the COPY below joins has already been started.
+            await session.execute(text(f"TRUNCATE {STAGING_TABLE}"))
+            now = datetime.now(timezone.utc)
+            driver = (await conn.get_raw_connection()).driver_connection
+            if driver is None:
+                raise RuntimeError("Import connection was invalidated")
+            await driver.copy_records_to_table(
+                STAGING_TABLE,
+                records=[_staging_row(item, now) for item in known],
+                columns=[*SUBSCRIPTION_COLUMNS, "event_id"],
+            )
+
+            inserted = (await session.execute(_MERGE)).all()
+            events = (await session.execute(_MARK_EVENTS)).rowcount
+
+            changes: Counter = Counter()
+            for row in inserted:
+                changes[(row.plan_id, row.status)] += 1
+            await self.rollups.record(session, changes)
+            await self.entitlements.notify_changed(
+                session,
+                {row.user_id for row in inserted if row.status == SubscriptionStatus.ACTIVE},
+            )
+
+            progress.position = batch[-1][0]
+            progress.inserted += len(inserted)
+            progress.duplicates += len(known) - len(inserted)
+            progress.rejected += len(rejected)
+            progress.events += events
+            await self._save(session, name, source, progress)
+
+            # Written before the commit: after a crash the resumed import
+            # may repeat a few rejects, but never loses one.
+            if rejects is not None and rejected:
+                for position, error, record in sorted(rejected, key=lambda reject: reject[0]):
+                    rejects.write(
+                        json.dumps({"record": position, "error": error, "input": record}) + "\n"
+                    )
+                rejects.flush()
+
+    async def run(
+        self,
+        records: Iterable[dict | str],
+        *,
+        name: str,
+        source: str,
+        rejects: TextIO | None = None,
+        restart: bool = False,
+        batch_size: int | None = None,
+    ) -> ImportProgress | None:
+        async with async_engine.connect() as conn:
+            # Two runs of one import would both write its checkpoint.
+            locked = await conn.scalar(_LOCK, {"name": name})
+            await conn.commit()
+            if not locked:
+                return None
+
+            try:
+                await conn.execute(_CREATE_STAGING)
+                await conn.commit()
+                progress = await self._load(conn, name, restart)
+                if progress.finished:
+                    logger.info("Import %s has already finished", name)
+                    return progress
+
+                resumed_at = progress.position
+                if resumed_at:
+                    logger.info("Resuming import %s after record %s", name, resumed_at)
+                numbered = enumerate(islice(records, resumed_at, None), start=resumed_at + 1)
+                started = time.monotonic()
+                while batch := list(islice(numbered, batch_size or self.batch_size)):
+                    await self._import_batch(conn, name, source, progress, batch, rejects)
+                    logger.info(
+                        "Import %s: %s records read, %s inserted, %s duplicates, "
+                        "%s rejected, %s events (%.0f records/s)",
+                        name, progress.position, progress.inserted, progress.duplicates,
+                        progress.rejected, progress.events,
+                        (progress.position - resumed_at) / (time.monotonic() - started),
+                    )
+
+                progress.finished = True
+                async with conn.begin():
+                    await self._save(conn, name, source, progress)
+                return progress
+            finally:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+                await conn.execute(_UNLOCK, {"name": name})
+                await conn.commit()
+
+
+subscription_importer = SubscriptionImporter(
+    batch_size=settings.import_batch_size,
+    plans=plan_catalog,
+    rollups=subscription_rollups,
+    entitlements=entitlement_cache,
+)
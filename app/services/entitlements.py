@@ -0,0 +1,186 @@
+import time
+from collections import OrderedDict
+from collections.abc import Collection, Iterable
+from uuid import UUID
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.db.engine import async_session_factory
+from app.db.listener import PgListener, pg_listener
+from app.logging_config import logger
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.settings import settings
+
+
+ENTITLEMENT_CHANGES_CHANNEL = "entitlement_changes"
+
+_NOTIFY = text(
+    "SELECT pg_notify(:channel, user_id::text) "
+    "FROM unnest(CAST(:user_ids AS uuid[])) AS user_id"
+)
+
+
+class EntitlementCache:
+    def __init__(
+        self,
+        *,
+        maxsize: int,
+        ttl_seconds: float,
+        warmup_chunk_size: int,
+        listener: PgListener,
+    ):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.warmup_chunk_size = warmup_chunk_size
+        self.hits = 0
+        self.misses = 0
+        self.warmed_up = 0
+        self._entries: OrderedDict[UUID, tuple[float, frozenset[UUID]]] = OrderedDict()
+        # Bumped on every invalidation so a load that raced with one is not cached.
+        self._generation = 0
+        self.listener = listener
+        listener.subscribe(ENTITLEMENT_CHANGES_CHANNEL, self._on_notification)
+
+    def _cached(self, user_id: UUID, now: float) -> frozenset[UUID] | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[1]
+
+    def _store(self, plans: dict[UUID, frozenset[UUID]], now: float) -> None:
+        expires_at = now + self.ttl_seconds
+        for user_id, plan_ids in plans.items():
+            self._entries[user_id] = (expires_at, plan_ids)
+            self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get(self, session: AsyncSession, user_id: UUID) -> frozenset[UUID]:
+        plan_ids = self._cached(user_id, time.monotonic())
+        if plan_ids is not None:
+            self.hits += 1
+            return plan_ids
+        return (await self.get_many(session, [user_id]))[user_id]
+
+    async def get_many(
+        self, session: AsyncSession, user_ids: Iterable[UUID]
+    ) -> dict[UUID, frozenset[UUID]]:
+        now = time.monotonic()
+        found: dict[UUID, frozenset[UUID]] = {}
+        missing: list[UUID] = []
+        for user_id in set(user_ids):
+            plan_ids = self._cached(user_id, now)
+            if plan_ids is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = plan_ids
+
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            generation = self._generation
+            loaded: dict[UUID, set[UUID]] = {user_id: set() for user_id in missing}
+            result = await session.execute(
+                select(Subscription.user_id, Subscription.plan_id).where(
+                    Subscription.user_id.in_(missing),
+                    Subscription.status == SubscriptionStatus.ACTIVE,
+                )
+            )
+            for user_id, plan_id in result:
+                loaded[user_id].add(plan_id)
+
+            fresh = {user_id: frozenset(plan_ids) for user_id, plan_ids in loaded.items()}
+            if generation == self._generation:
+                self._store(fresh, now)
+            found.update(fresh)
+        return found
+
+    def invalidate(self, user_id: UUID | None = None) -> None:
+        self._generation += 1
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    async def notify_changed(
+        self,
+        connection: AsyncSession | AsyncConnection,
+        user_ids: Collection[UUID],
+    ) -> None:
+        # NOTIFY is transactional: other workers hear about the change only
+        # once the status update commits.
+        if not user_ids:
+            return
+        for user_id in user_ids:
+            self.invalidate(user_id)
+        await connection.execute(
+            _NOTIFY,
+            {"channel": ENTITLEMENT_CHANGES_CHANNEL, "user_ids": list(user_ids)},
+        )
+
+    def _on_notification(self, payload: str | None) -> None:
+        try:
+            self.invalidate(UUID(payload) if payload else None)
+        except ValueError:
+            self.invalidate()
+
+    async def warm_up(self) -> None:
+        started = time.perf_counter()
+        last_user_id: UUID | None = None
+        async with async_session_factory() as session:
+            while len(self._entries) < self.maxsize:
+                query = (
+                    select(Subscription.user_id, func.array_agg(Subscription.plan_id))
+                    .where(Subscription.status == SubscriptionStatus.ACTIVE)
+                    .group_by(Subscription.user_id)
+                    .order_by(Subscription.user_id)
+                    .limit(self.warmup_chunk_size)
+                )
+                if last_user_id is not None:
+                    query = query.where(Subscription.user_id > last_user_id)
+
+                generation = self._generation
+                rows = (await session.execute(query)).all()
+                if not rows:
+                    break
+                last_user_id = rows[-1][0]
+
+                if generation == self._generation:
+                    now = time.monotonic()
+                    self._store(
+                        {
+                            user_id: frozenset(plan_ids)
+                            for user_id, plan_ids in rows
+                            if user_id not in self._entries
+                        },
+                        now,
+                    )
+                    self.warmed_up += len(rows)
+
+        logger.info(
+            "Warmed up entitlements for %s users in %.3fs",
+            self.warmed_up,
+            time.perf_counter() - started,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "warmed_up": self.warmed_up,
+            "listening": self.listener.listening,
+        }
+
+
+entitlement_cache = EntitlementCache(
+    maxsize=settings.entitlement_cache_size,
+    ttl_seconds=settings.entitlement_cache_ttl_seconds,
+    warmup_chunk_size=settings.entitlement_warmup_chunk_size,
+    listener=pg_listener,
+)
@@ -0,0 +1,151 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import timedelta
+
+from sqlalchemy import func, select, update
+
+from app.db.engine import async_session_factory
+from app.logging_config import logger
+from app.metrics import record_transition
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.services.entitlements import EntitlementCache, entitlement_cache
+from app.services.rollups import SubscriptionRollups, moved, subscription_rollups
+from app.settings import settings
+
+
+class ExpiryProcessor:
+    def __init__(
+        self,
+        *,
+        chunk_size: int,
+        grace_seconds: float,
+        poll_interval_seconds: float,
+        backlog_refresh_seconds: float,
+        rollups: SubscriptionRollups,
+        entitlements: EntitlementCache,
+    ):
+        self.chunk_size = chunk_size
+        self.grace = timedelta(seconds=grace_seconds)
+        self.poll_interval_seconds = poll_interval_seconds
+        self.backlog_refresh_seconds = backlog_refresh_seconds
+        self.rollups = rollups
+        self.entitlements = entitlements
+
+        self.expired_total = 0
+        self.chunks_total = 0
+        self.last_chunk_seconds = 0.0
+        self.last_chunk_rate = 0.0
+        self.backlog = 0
+        self.oldest_due_seconds = 0.0
+        self._backlog_refreshed_at = 0.0
+
+    def _is_due(self):
+        # The grace period leaves time for the renewal payment, charged at
+        # the end of the period, to arrive and extend expires_at.
+        return (
+            Subscription.status == SubscriptionStatus.ACTIVE,
+            Subscription.expires_at <= func.now() - self.grace,
+        )
+
+    async def run_once(self) -> int:
+        started = time.perf_counter()
+
+        due = (
+            select(Subscription.id)
+            .where(*self._is_due())
+            .order_by(Subscription.expires_at)
+            .limit(self.chunk_size)
+            .with_for_update(of=Subscription, skip_locked=True)
+            .scalar_subquery()
+        )
+
+        async with async_session_factory() as session, session.begin():
+            expired = (
+                await session.execute(
+                    update(Subscription)
+                    .where(Subscription.id.in_(due))
+                    .values(status=SubscriptionStatus.EXPIRED, next_billing_at=None)
+                    .returning(Subscription.user_id, Subscription.plan_id)
+                    .execution_options(synchronize_session=False)
+                )
+            ).all()
+
+            if expired:
+                changes: Counter = Counter()
+                for plan_id, count in Counter(row.plan_id for row in expired).items():
+                    changes.update(
+                        moved(
+                            plan_id,
+                            SubscriptionStatus.ACTIVE,
+                            SubscriptionStatus.EXPIRED,
+                            count,
+                        )
+                    )
+                await self.entitlements.notify_changed(
+                    session, {row.user_id for row in expired}
+                )
+                await self.rollups.record(session, changes)
+
+        if expired:
+            elapsed = time.perf_counter() - started
+            record_transition(SubscriptionStatus.EXPIRED, len(expired))
+            self.expired_total += len(expired)
+            self.chunks_total += 1
+            self.last_chunk_seconds = elapsed
+            self.last_chunk_rate = len(expired) / elapsed if elapsed else 0.0
+            logger.info("Expired %s subscriptions in %.3fs", len(expired), elapsed)
+        return len(expired)
+
+    async def refresh_backlog(self) -> None:
+        async with async_session_factory() as session:
+            count, oldest = (
+                await session.execute(
+                    select(func.count(), func.min(Subscription.expires_at)).where(
+                        *self._is_due()
+                    )
+                )
+            ).one()
+
+        self.backlog = count
+        self.oldest_due_seconds = (
+            max(0.0, time.time() - (oldest + self.grace).timestamp()) if oldest else 0.0
+        )
+        self._backlog_refreshed_at = time.monotonic()
+
+    async def run(self) -> None:
+        logger.info("Expiry processor started")
+        while True:
+            try:
+                if time.monotonic() - self._backlog_refreshed_at >= self.backlog_refresh_seconds:
+                    await self.refresh_backlog()
+                expired = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Expiry run failed")
+                expired = 0
+
+            # A full chunk means more are due: keep going without sleeping.
+            if expired < self.chunk_size:
+                await asyncio.sleep(self.poll_interval_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "expired_total": self.expired_total,
+            "chunks_total": self.chunks_total,
+            "last_chunk_seconds": self.last_chunk_seconds,
+            "last_chunk_per_second": self.last_chunk_rate,
+            "backlog": self.backlog,
+            "oldest_due_seconds": self.oldest_due_seconds,
+        }
+
+
+expiry_processor = ExpiryProcessor(
+    chunk_size=settings.expiry_chunk_size,
+    grace_seconds=settings.expiry_grace_seconds,
+    poll_interval_seconds=settings.expiry_poll_interval_seconds,
+    backlog_refresh_seconds=settings.expiry_backlog_refresh_seconds,
+    rollups=subscription_rollups,
+    entitlements=entitlement_cache,
+)
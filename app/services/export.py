@@ -0,0 +1,247 @@
+import csv
+import io
+import zlib
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Literal
+from uuid import UUID
+
+from sqlalchemy import Row, Select, select, text
+
+from app.db.engine import admin_replica_engine
+from app.logging_config import logger
+from app.models.plan import Plan
+from app.models.subscription import Subscription, SubscriptionStatus
+
+
+ExportFormat = Literal["csv", "parquet"]
+ExportCompression = Literal["none", "gzip", "snappy", "zstd"]
+
+COMPRESSIONS: dict[ExportFormat, tuple[ExportCompression, ...]] = {
+    "csv": ("none", "gzip"),
+    "parquet": ("none", "snappy", "gzip", "zstd"),
+}
+
+COLUMNS = (
+    "subscription_id",
+    "user_id",
+    "plan_id",
+    "plan_name",
+    "status",
+    "amount",
+    "currency",
+    "payment_id",
+    "next_billing_at",
+    "expires_at",
+    "created_at",
+    "updated_at",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class ExportFilters:
+    status: SubscriptionStatus | None = None
+    plan_id: UUID | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _export_query(filters: ExportFilters) -> Select:
+    query = select(
+        Subscription.id,
+        Subscription.user_id,
+        Subscription.plan_id,
+        Plan.name,
+        Subscription.status,
+        Plan.amount,
+        Plan.currency,
+        Subscription.payment_id,
+        Subscription.next_billing_at,
+        Subscription.expires_at,
+        Subscription.created_at,
+        Subscription.updated_at,
+    ).join(Plan, Plan.id == Subscription.plan_id)
+    if filters.status is not None:
+        query = query.where(Subscription.status == filters.status)
+    if filters.plan_id is not None:
+        query = query.where(Subscription.plan_id == filters.plan_id)
+    if filters.created_from is not None:
+        query = query.where(Subscription.created_at >= _utc(filters.created_from))
+    if filters.created_to is not None:
+        query = query.where(Subscription.created_at < _utc(filters.created_to))
+    # No ORDER BY: sorting a large range would hold back the first row
+    # until the whole result is sorted.
+    return query
+
+
+def _values(row: Row) -> list[Any]:
+    (id, user_id, plan_id, plan_name, status, amount, currency, payment_id,
+     next_billing_at, expires_at, created_at, updated_at) = row
+    return [
+        str(id),
+        str(user_id),
+        str(plan_id),
+        plan_name,
+        status.value,
+        Decimal(str(amount)),
+        currency,
+        str(payment_id) if payment_id is not None else None,
+        next_billing_at,
+        expires_at,
+        created_at,
+        updated_at,
+    ]
+
+
+class _CsvEncoder:
+    def __init__(self, compression: ExportCompression):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        # wbits=31 writes a gzip header, so the output is a plain .csv.gz.
+        self._compressor = zlib.compressobj(wbits=31) if compression == "gzip" else None
+        self._writer.writerow(COLUMNS)
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return self._compressor.compress(data) if self._compressor else data
+
+    def write(self, rows: Sequence[Row]) -> bytes:
+        self._writer.writerows(
+            [
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in _values(row)
+            ]
+            for row in rows
+        )
+        return self._drain()
+
+    def close(self) -> bytes:
+        data = self._drain()
+        return data + self._compressor.flush() if self._compressor else data
+
+
+class _Sink(io.RawIOBase):
+    # ParquetWriter writes each row group here; the bytes are handed out
+    # right away instead of building the file in memory.
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _ParquetEncoder:
+    def __init__(self, compression: ExportCompression):
+        # Imported on first use: only the Parquet export needs pyarrow, and
+        # it is too heavy to load in every worker.
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        timestamp = pa.timestamp("us", tz="UTC")
+        self._schema = pa.schema(
+            [
+                ("subscription_id", pa.string()),
+                ("user_id", pa.string()),
+                ("plan_id", pa.string()),
+                ("plan_name", pa.string()),
+                ("status", pa.string()),
+                ("amount", pa.decimal128(20, 2)),
+                ("currency", pa.string()),
+                ("payment_id", pa.string()),
+                ("next_billing_at", timestamp),
+                ("expires_at", timestamp),
+                ("created_at", timestamp),
+                ("updated_at", timestamp),
+            ]
+        )
+        self._pa = pa
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(
+            self._sink, self._schema, compression=compression
+        )
+
+    def write(self, rows: Sequence[Row]) -> bytes:
+        # One row group per chunk.
+        columns = list(zip(*(_values(row) for row in rows)))
+        self._writer.write_batch(
+            self._pa.RecordBatch.from_arrays(
+                [
+                    self._pa.array(column, type=field.type)
+                    for column, field in zip(columns, self._schema)
+                ],
+                schema=self._schema,
+            )
+        )
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+ExportEncoder = _CsvEncoder | _ParquetEncoder
+
+
+def create_encoder(
+    format: ExportFormat,
+    compression: ExportCompression,
+) -> ExportEncoder:
+    if format not in COMPRESSIONS:
+        raise ValueError(f"Unknown export format {format!r}, expected csv or parquet")
+    if compression not in COMPRESSIONS[format]:
+        raise ValueError(
+            f"{format} export supports compression: {', '.join(COMPRESSIONS[format])}"
+        )
+    if format == "parquet":
+        return _ParquetEncoder(compression)
+    return _CsvEncoder(compression)
+
+
+def export_filename(format: ExportFormat, compression: ExportCompression) -> str:
+    suffix = ".gz" if format == "csv" and compression == "gzip" else ""
+    return f"subscriptions-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.{format}{suffix}"
+
+
+async def export_subscriptions(
+    encoder: ExportEncoder,
+    filters: ExportFilters,
+    *,
+    chunk_size: int,
+) -> AsyncIterator[bytes]:
+    exported = 0
+    async with admin_replica_engine.connect() as conn:
+        # The export is one long statement on a server-side cursor; the
+        # admin pool's statement_timeout is meant for list pages.
+        await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        result = await conn.stream(
+            _export_query(filters).execution_options(yield_per=chunk_size)
+        )
+        async for rows in result.partitions():
+            exported += len(rows)
+            data = encoder.write(rows)
+            if data:
+                yield data
+    yield encoder.close()
+    logger.info("Exported %s subscriptions", exported)
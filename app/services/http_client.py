@@ -0,0 +1,76 @@
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from app.logging_config import logger
+from app.settings import settings
+
+
+class HttpClient:
+    def __init__(
+        self,
+        *,
+        limit: int,
+        limit_per_host: int,
+        keepalive_timeout: float,
+        dns_cache_ttl: int,
+        connect_timeout: float,
+        total_timeout: float,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = ClientTimeout(
+            total=total_timeout,
+            connect=connect_timeout,
+        )
+        self._session: ClientSession | None = None
+
+    @property
+    def session(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    use_dns_cache=True,
+                ),
+                timeout=self.timeout,
+            )
+            logger.info(
+                "Opened HTTP connection pool (limit=%s, limit_per_host=%s)",
+                self.limit,
+                self.limit_per_host,
+            )
+        return self._session
+
+    async def start(self) -> None:
+        _ = self.session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("Closed HTTP connection pool")
+        self._session = None
+
+    def stats(self) -> dict:
+        # aiohttp does not expose pool occupancy; only the configured limits.
+        connector = self._session.connector if self._session is not None else None
+        return {
+            "open": self._session is not None and not self._session.closed,
+            "limit": connector.limit if connector is not None else self.limit,
+            "limit_per_host": (
+                connector.limit_per_host if connector is not None else self.limit_per_host
+            ),
+        }
+
+
+http_client = HttpClient(
+    limit=settings.http_pool_limit,
+    limit_per_host=settings.http_pool_limit_per_host,
+    keepalive_timeout=settings.http_keepalive_seconds,
+    dns_cache_ttl=settings.http_dns_cache_seconds,
+    connect_timeout=settings.http_connect_timeout_seconds,
+    total_timeout=settings.http_total_timeout_seconds,
+)
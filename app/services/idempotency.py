@@ -0,0 +1,227 @@
+import asyncio
+import time
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import Interval, and_, delete, func, literal, or_, select, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.db.engine import async_session_factory
+from app.db.listener import PgListener, pg_listener
+from app.logging_config import logger
+from app.models.idempotency_key import IdempotencyKey
+from app.settings import settings
+
+
+IDEMPOTENCY_CHANNEL = "idempotency_keys"
+
+
+@dataclass(frozen=True, slots=True)
+class StoredResponse:
+    status_code: int
+    body: Any
+
+
+def _token(user_id: UUID, key: str) -> str:
+    return f"{user_id}:{key}"
+
+
+def _interval(seconds: float):
+    return literal(timedelta(seconds=seconds), Interval)
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        lock_seconds: float,
+        wait_seconds: float,
+        poll_interval_seconds: float,
+        cleanup_batch_size: int,
+        cleanup_interval_seconds: float,
+        listener: PgListener,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.cleanup_batch_size = cleanup_batch_size
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self._waiters: dict[str, asyncio.Event] = {}
+        listener.subscribe(IDEMPOTENCY_CHANNEL, self._on_notification)
+
+    async def _claim(self, user_id: UUID, key: str, request_hash: str) -> bool:
+        stmt = insert(IdempotencyKey).values(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            locked_until=func.now() + _interval(self.lock_seconds),
+            expires_at=func.now() + _interval(self.ttl_seconds),
+        )
+        # An expired key, or one whose owner died mid-request, can be taken over.
+        claim = stmt.on_conflict_do_update(
+            index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+            set_={
+                "request_hash": stmt.excluded.request_hash,
+                "response_status": None,
+                "response_body": None,
+                "created_at": func.now(),
+                "locked_until": stmt.excluded.locked_until,
+                "expires_at": stmt.excluded.expires_at,
+            },
+            where=or_(
+                IdempotencyKey.expires_at <= func.now(),
+                and_(
+                    IdempotencyKey.response_status.is_(None),
+                    IdempotencyKey.locked_until <= func.now(),
+                ),
+            ),
+        ).returning(IdempotencyKey.key)
+
+        async with async_session_factory() as session, session.begin():
+            return (await session.execute(claim)).first() is not None
+
+    async def _load(self, user_id: UUID, key: str) -> IdempotencyKey | None:
+        async with async_session_factory() as session:
+            return await session.get(IdempotencyKey, (user_id, key))
+
+    async def _wait(self, user_id: UUID, key: str, timeout: float) -> None:
+        token = _token(user_id, key)
+        event = self._waiters.setdefault(token, asyncio.Event())
+        try:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(event.wait(), timeout)
+        finally:
+            # Without a NOTIFY nothing else removes it; other waiters on the
+            # same key fall back to polling until they register a new one.
+            if self._waiters.get(token) is event:
+                del self._waiters[token]
+
+    def _on_notification(self, payload: str | None) -> None:
+        if payload is None:
+            for event in self._waiters.values():
+                event.set()
+            self._waiters.clear()
+        elif payload in self._waiters:
+            self._waiters.pop(payload).set()
+
+    async def begin(
+        self, user_id: UUID, key: str, request_hash: str
+    ) -> StoredResponse | None:
+        # None means the caller now owns the key and must complete or release it.
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            if await self._claim(user_id, key, request_hash):
+                return None
+
+            stored = await self._load(user_id, key)
+            if stored is None:
+                continue
+            if stored.request_hash != request_hash:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key was used with a different request",
+                )
+            if stored.response_status is not None:
+                return StoredResponse(stored.response_status, stored.response_body)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is in progress",
+                )
+            await self._wait(user_id, key, min(remaining, self.poll_interval_seconds))
+
+    async def complete(
+        self,
+        user_id: UUID,
+        key: str,
+        status_code: int,
+        body: Any,
+        connection: AsyncSession | AsyncConnection | None = None,
+    ) -> None:
+        # With a connection the response is stored in the caller's transaction,
+        # so it becomes visible (and waiters wake up) together with its effects.
+        if connection is None:
+            async with async_session_factory() as session, session.begin():
+                await self.complete(user_id, key, status_code, body, session)
+            return
+
+        await connection.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(response_status=status_code, response_body=body)
+            .execution_options(synchronize_session=False)
+        )
+        await self._notify(connection, user_id, key)
+
+    async def release(self, user_id: UUID, key: str) -> None:
+        async with async_session_factory() as session, session.begin():
+            await session.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.response_status.is_(None),
+                )
+            )
+            await self._notify(session, user_id, key)
+
+    async def _notify(
+        self, connection: AsyncSession | AsyncConnection, user_id: UUID, key: str
+    ) -> None:
+        await connection.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": IDEMPOTENCY_CHANNEL, "payload": _token(user_id, key)},
+        )
+
+    async def purge_expired(self) -> int:
+        purged = 0
+        while True:
+            expired = (
+                select(IdempotencyKey.user_id, IdempotencyKey.key)
+                .where(IdempotencyKey.expires_at <= func.now())
+                .limit(self.cleanup_batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            async with async_session_factory() as session, session.begin():
+                result = await session.execute(
+                    delete(IdempotencyKey)
+                    .where(tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired))
+                    .execution_options(synchronize_session=False)
+                )
+            purged += result.rowcount
+            if result.rowcount < self.cleanup_batch_size:
+                break
+
+        if purged:
+            logger.info("Purged %s expired idempotency keys", purged)
+        return purged
+
+    async def run(self) -> None:
+        logger.info("Idempotency key cleanup started")
+        while True:
+            try:
+                await self.purge_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Idempotency key cleanup failed")
+            await asyncio.sleep(self.cleanup_interval_seconds)
+
+
+idempotency_store = IdempotencyStore(
+    ttl_seconds=settings.idempotency_ttl_seconds,
+    lock_seconds=settings.idempotency_lock_seconds,
+    wait_seconds=settings.idempotency_wait_seconds,
+    poll_interval_seconds=settings.idempotency_poll_interval_seconds,
+    cleanup_batch_size=settings.idempotency_cleanup_batch_size,
+    cleanup_interval_seconds=settings.idempotency_cleanup_interval_seconds,
+    listener=pg_listener,
+)
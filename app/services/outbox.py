@@ -0,0 +1,338 @@
+import asyncio
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from uuid import UUID, uuid4
+
+from aiohttp import ClientResponseError
+from sqlalchemy import Interval, case, func, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.engine import async_session_factory
+from app.logging_config import logger
+from app.metrics import OUTBOX_FAILED, record_transition
+from app.models.billing_outbox import BillingOutbox, OutboxCommand, OutboxStatus
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.services.billing_client import BillingClient, billing_client
+from app.services.rollups import SubscriptionRollups, moved, subscription_rollups
+from app.settings import settings
+
+
+def _to_payload(values: dict) -> dict:
+    return {
+        key: str(value) if isinstance(value, (UUID, Decimal, float)) else value
+        for key, value in values.items()
+    }
+
+
+def payment_command(
+    *,
+    user_id: UUID,
+    amount: Decimal | float,
+    currency: str,
+    return_url: str,
+    extra_data: dict | None = None,
+) -> dict:
+    return {
+        "id": uuid4(),
+        "command": OutboxCommand.CREATE_PAYMENT,
+        "status": OutboxStatus.PENDING,
+        "attempts": 0,
+        "payload": _to_payload(
+            {
+                "user_id": user_id,
+                "amount": amount,
+                "currency": currency,
+                "return_url": return_url,
+                "extra_data": extra_data,
+            }
+        ),
+    }
+
+
+def enqueue_payment(
+    session: AsyncSession,
+    *,
+    user_id: UUID,
+    amount: Decimal | float,
+    currency: str,
+    return_url: str,
+    extra_data: dict | None = None,
+) -> BillingOutbox:
+    command = BillingOutbox(
+        **payment_command(
+            user_id=user_id,
+            amount=amount,
+            currency=currency,
+            return_url=return_url,
+            extra_data=extra_data,
+        )
+    )
+    session.add(command)
+    return command
+
+
+def enqueue_refund(
+    session: AsyncSession,
+    *,
+    payment_id: UUID,
+    amount: Decimal | float,
+    currency: str,
+    handler_url: str | None = None,
+    extra_data: dict | None = None,
+) -> BillingOutbox:
+    command = BillingOutbox(
+        command=OutboxCommand.CREATE_REFUND,
+        payload=_to_payload(
+            {
+                "payment_id": payment_id,
+                "amount": amount,
+                "currency": currency,
+                "handler_url": handler_url,
+                "extra_data": extra_data,
+            }
+        ),
+    )
+    session.add(command)
+    return command
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, ClientResponseError):
+        return error.status >= 500 or error.status in (408, 429)
+    return True
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        billing: BillingClient,
+        *,
+        rollups: SubscriptionRollups,
+        batch_size: int,
+        concurrency: int,
+        max_attempts: int,
+        lease_seconds: float,
+        backoff_base_seconds: float,
+        backoff_max_seconds: float,
+        poll_interval_seconds: float,
+    ):
+        self.billing = billing
+        self.rollups = rollups
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        self.sent_total = 0
+        self.failed_total: Counter = Counter()
+        self.cancelled_total = 0
+
+    async def _claim(self) -> list:
+        claimable = (
+            select(BillingOutbox.id)
+            .where(
+                BillingOutbox.status == OutboxStatus.PENDING,
+                BillingOutbox.available_at <= func.now(),
+            )
+            .order_by(BillingOutbox.available_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with async_session_factory() as session, session.begin():
+            result = await session.execute(
+                update(BillingOutbox)
+                .where(BillingOutbox.id.in_(claimable))
+                .values(
+                    attempts=BillingOutbox.attempts + 1,
+                    available_at=func.now()
+                    + literal(timedelta(seconds=self.lease_seconds), Interval),
+                )
+                .returning(
+                    BillingOutbox.id,
+                    BillingOutbox.command,
+                    BillingOutbox.payload,
+                    BillingOutbox.attempts,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            return list(result.all())
+
+    async def _send(self, command: OutboxCommand, payload: dict, key: UUID) -> None:
+        async with self._semaphore:
+            if command == OutboxCommand.CREATE_PAYMENT:
+                await self.billing.create_payment(
+                    user_id=UUID(payload["user_id"]),
+                    amount=Decimal(payload["amount"]),
+                    currency=payload["currency"],
+                    return_url=payload["return_url"],
+                    extra_data=payload.get("extra_data"),
+                    idempotency_key=key,
+                )
+            else:
+                await self.billing.create_refund(
+                    payment_id=UUID(payload["payment_id"]),
+                    amount=Decimal(payload["amount"]),
+                    currency=payload["currency"],
+                    handler_url=payload.get("handler_url"),
+                    extra_data=payload.get("extra_data"),
+                    idempotency_key=key,
+                )
+
+    async def _cancel_unpaid(self, session: AsyncSession, rows: list) -> int:
+        # A first payment that could not be created leaves nothing to wait
+        # for. Renewals keep their subscription, which runs out at
+        # expires_at; failed refunds need someone to look at them.
+        subscription_ids = [
+            UUID(row.payload["extra_data"]["subscription_id"])
+            for row in rows
+            if row.command == OutboxCommand.CREATE_PAYMENT
+            and "subscription_id" in (row.payload.get("extra_data") or {})
+            and not row.payload["extra_data"].get("renewal")
+        ]
+        if not subscription_ids:
+            return 0
+
+        plan_ids = list(
+            await session.scalars(
+                update(Subscription)
+                .where(
+                    Subscription.id.in_(subscription_ids),
+                    Subscription.status == SubscriptionStatus.PENDING_PAYMENT,
+                )
+                .values(status=SubscriptionStatus.CANCELLED)
+                .returning(Subscription.plan_id)
+                .execution_options(synchronize_session=False)
+            )
+        )
+        changes: Counter = Counter()
+        for plan_id, count in Counter(plan_ids).items():
+            changes.update(
+                moved(
+                    plan_id,
+                    SubscriptionStatus.PENDING_PAYMENT,
+                    SubscriptionStatus.CANCELLED,
+                    count,
+                )
+            )
+        await self.rollups.record(session, changes)
+        return len(plan_ids)
+
+    async def run_once(self) -> int:
+        rows = await self._claim()
+        if not rows:
+            return 0
+
+        results = await asyncio.gather(
+            *(self._send(row.command, row.payload, row.id) for row in rows),
+            return_exceptions=True,
+        )
+
+        sent: list[UUID] = []
+        retry: dict[UUID, str] = {}
+        failed: dict[UUID, str] = {}
+        failed_rows = []
+        for row, result in zip(rows, results):
+            if not isinstance(result, Exception):
+                sent.append(row.id)
+            elif _is_retryable(result) and row.attempts < self.max_attempts:
+                retry[row.id] = repr(result)
+            else:
+                failed[row.id] = repr(result)
+                failed_rows.append(row)
+                logger.error(
+                    "Giving up on billing command %s (%s) after %s attempts: %r",
+                    row.id, row.command, row.attempts, result,
+                )
+
+        backoff = func.least(
+            self.backoff_base_seconds * func.power(2, BillingOutbox.attempts - 1),
+            self.backoff_max_seconds,
+        )
+        cancelled = 0
+        async with async_session_factory() as session, session.begin():
+            if sent:
+                await session.execute(
+                    update(BillingOutbox)
+                    .where(BillingOutbox.id.in_(sent))
+                    .values(status=OutboxStatus.SENT, sent_at=func.now(), last_error=None)
+                    .execution_options(synchronize_session=False)
+                )
+            if retry:
+                await session.execute(
+                    update(BillingOutbox)
+                    .where(BillingOutbox.id.in_(list(retry)))
+                    .values(
+                        available_at=func.now()
+                        + literal(timedelta(seconds=1), Interval) * backoff,
+                        last_error=case(retry, value=BillingOutbox.id),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            if failed:
+                await session.execute(
+                    update(BillingOutbox)
+                    .where(BillingOutbox.id.in_(list(failed)))
+                    .values(
+                        status=OutboxStatus.FAILED,
+                        last_error=case(failed, value=BillingOutbox.id),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                cancelled = await self._cancel_unpaid(session, failed_rows)
+
+        self.sent_total += len(sent)
+        for row in failed_rows:
+            self.failed_total[row.command.value] += 1
+            OUTBOX_FAILED.labels(command=row.command.value).inc()
+        if cancelled:
+            self.cancelled_total += cancelled
+            record_transition(SubscriptionStatus.CANCELLED, cancelled)
+            logger.warning(
+                "Cancelled %s unpaid subscriptions whose payment could not be created",
+                cancelled,
+            )
+
+        logger.info(
+            "Dispatched %s billing commands: %s sent, %s to retry, %s failed",
+            len(rows), len(sent), len(retry), len(failed),
+        )
+        return len(rows)
+
+    async def run(self) -> None:
+        logger.info("Billing outbox dispatcher started")
+        while True:
+            try:
+                claimed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Billing outbox dispatch failed")
+                claimed = 0
+
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "sent_total": self.sent_total,
+            "failed_total": dict(self.failed_total),
+            "cancelled_subscriptions_total": self.cancelled_total,
+        }
+
+
+outbox_dispatcher = OutboxDispatcher(
+    billing_client,
+    rollups=subscription_rollups,
+    batch_size=settings.billing_outbox_batch_size,
+    concurrency=settings.billing_outbox_concurrency,
+    max_attempts=settings.billing_outbox_max_attempts,
+    lease_seconds=settings.billing_outbox_lease_seconds,
+    backoff_base_seconds=settings.billing_outbox_backoff_base_seconds,
+    backoff_max_seconds=settings.billing_outbox_backoff_max_seconds,
+    poll_interval_seconds=settings.billing_outbox_poll_interval_seconds,
+)
@@ -0,0 +1,120 @@
+import time
+from dataclasses import dataclass
+from uuid import UUID
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.engine import async_engine
+from app.db.listener import PgListener, pg_listener
+from app.logging_config import logger
+from app.models.plan import Plan, PlanStatus
+from app.settings import settings
+
+
+PLAN_CHANGES_CHANNEL = "plan_changes"
+
+
+@dataclass(frozen=True, slots=True)
+class CachedPlan:
+    id: UUID
+    name: str
+    amount: float
+    currency: str
+    period_days: int
+    status: PlanStatus
+
+    @classmethod
+    def from_model(cls, plan: Plan) -> "CachedPlan":
+        return cls(
+            id=plan.id,
+            name=plan.name,
+            amount=plan.amount,
+            currency=plan.currency,
+            period_days=plan.period_days,
+            status=plan.status,
+        )
+
+
+class PlanCatalog:
+    def __init__(self, ttl_seconds: float, listener: PgListener):
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._plans: dict[UUID, tuple[float, CachedPlan]] = {}
+        self.listener = listener
+        listener.subscribe(PLAN_CHANGES_CHANNEL, self._on_notification)
+
+    async def get(self, session: AsyncSession, plan_id: UUID) -> CachedPlan | None:
+        entry = self._plans.get(plan_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        plan = await session.get(Plan, plan_id)
+        if plan is None:
+            self._plans.pop(plan_id, None)
+            return None
+
+        cached = CachedPlan.from_model(plan)
+        self._plans[plan_id] = (time.monotonic() + self.ttl_seconds, cached)
+        return cached
+
+    async def get_many(
+        self, session: AsyncSession, plan_ids: set[UUID]
+    ) -> dict[UUID, CachedPlan]:
+        now = time.monotonic()
+        found: dict[UUID, CachedPlan] = {}
+        missing: list[UUID] = []
+        for plan_id in plan_ids:
+            entry = self._plans.get(plan_id)
+            if entry is not None and entry[0] > now:
+                found[plan_id] = entry[1]
+            else:
+                missing.append(plan_id)
+
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            expires_at = now + self.ttl_seconds
+            for plan in await session.scalars(select(Plan).where(Plan.id.in_(missing))):
+                cached = CachedPlan.from_model(plan)
+                self._plans[plan.id] = (expires_at, cached)
+                found[plan.id] = cached
+        return found
+
+    def invalidate(self, plan_id: UUID | None = None) -> None:
+        if plan_id is None:
+            self._plans.clear()
+        else:
+            self._plans.pop(plan_id, None)
+
+    async def notify_changed(self, plan_id: UUID) -> None:
+        self.invalidate(plan_id)
+        async with async_engine.begin() as conn:
+            await conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": PLAN_CHANGES_CHANNEL, "payload": str(plan_id)},
+            )
+
+    def _on_notification(self, payload: str | None) -> None:
+        try:
+            self.invalidate(UUID(payload) if payload else None)
+        except ValueError:
+            self.invalidate()
+        logger.debug("Plan catalog invalidated by notification: %s", payload)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._plans),
+            "hits": self.hits,
+            "misses": self.misses,
+            "listening": self.listener.listening,
+        }
+
+
+plan_catalog = PlanCatalog(
+    ttl_seconds=settings.plan_cache_ttl_seconds,
+    listener=pg_listener,
+)
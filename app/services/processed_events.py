@@ -0,0 +1,136 @@
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.db.engine import async_engine
+from app.logging_config import logger
+from app.settings import settings
+
+
+PARTITION_PREFIX = "processed_events_p"
+DEFAULT_PARTITION = "processed_events_default"
+
+_LIST_PARTITIONS = text(
+    "SELECT child.relname FROM pg_inherits "
+    "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+    "WHERE parent.relname = 'processed_events'"
+)
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def _partition_day(name: str) -> date | None:
+    try:
+        return datetime.strptime(name.removeprefix(PARTITION_PREFIX), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+class ProcessedEventsRetention:
+    def __init__(
+        self,
+        *,
+        retention_days: int,
+        premake_days: int,
+        interval_seconds: float,
+    ):
+        self.retention_days = retention_days
+        self.premake_days = premake_days
+        self.interval_seconds = interval_seconds
+
+    async def _create_partition(self, conn: AsyncConnection, day: date) -> None:
+        start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+        end = start + timedelta(days=1)
+        name = partition_name(day)
+        # Rows of this day that already went to the default partition are
+        # moved into the new one before it is attached; a plain PARTITION OF
+        # would fail on them.
+        await conn.execute(
+            text(f"CREATE TABLE {name} (LIKE processed_events INCLUDING DEFAULTS)")
+        )
+        moved = await conn.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                "WHERE processed_at >= :start AND processed_at < :end "
+                "RETURNING id, processed_at) "
+                f"INSERT INTO {name} (id, processed_at) SELECT id, processed_at FROM moved"
+            ),
+            {"start": start, "end": end},
+        )
+        await conn.execute(
+            text(
+                f"ALTER TABLE processed_events ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        )
+        if moved.rowcount:
+            logger.warning(
+                "Moved %s processed_events rows from the default partition to %s",
+                moved.rowcount, name,
+            )
+
+    async def run_once(self) -> list[str]:
+        today = datetime.now(timezone.utc).date()
+        cutoff = today - timedelta(days=self.retention_days)
+
+        async with async_engine.begin() as conn:
+            # Every worker runs the job; one of them at a time is enough.
+            locked = await conn.scalar(
+                text("SELECT pg_try_advisory_xact_lock(hashtext('processed_events'))")
+            )
+            if not locked:
+                return []
+            await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+
+            await conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} "
+                    "PARTITION OF processed_events DEFAULT"
+                )
+            )
+            partitions = set((await conn.scalars(_LIST_PARTITIONS)).all())
+            for offset in range(self.premake_days + 1):
+                day = today + timedelta(days=offset)
+                if partition_name(day) not in partitions:
+                    await self._create_partition(conn, day)
+
+            # Rows of expired days can only be left in the default partition
+            # if the job did not run when their partition was due.
+            await conn.execute(
+                text(f"DELETE FROM {DEFAULT_PARTITION} WHERE processed_at < :cutoff"),
+                {"cutoff": datetime.combine(cutoff, time.min, tzinfo=timezone.utc)},
+            )
+
+            dropped = []
+            for name in sorted(partitions):
+                partition_day = _partition_day(name)
+                if partition_day is not None and partition_day < cutoff:
+                    await conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                    dropped.append(name)
+
+        if dropped:
+            logger.info("Dropped processed_events partitions: %s", ", ".join(dropped))
+        return dropped
+
+    async def run(self) -> None:
+        logger.info("processed_events retention job started")
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("processed_events retention run failed")
+            await asyncio.sleep(self.interval_seconds)
+
+
+processed_events_retention = ProcessedEventsRetention(
+    retention_days=settings.processed_events_retention_days,
+    premake_days=settings.processed_events_premake_days,
+    interval_seconds=settings.processed_events_retention_interval_seconds,
+)
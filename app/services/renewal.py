@@ -0,0 +1,177 @@
+import asyncio
+import time
+from uuid import uuid4
+
+from sqlalchemy import func, insert, select, update
+
+from app.db.engine import async_session_factory
+from app.logging_config import logger
+from app.metrics import (
+    RENEWAL_BACKLOG,
+    RENEWAL_CHUNK_SECONDS,
+    RENEWAL_OLDEST_DUE,
+    RENEWALS,
+)
+from app.models.billing_outbox import BillingOutbox, OutboxCommand, OutboxStatus
+from app.models.plan import Plan, PlanStatus
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.settings import settings
+
+
+class RenewalScheduler:
+    def __init__(
+        self,
+        *,
+        chunk_size: int,
+        poll_interval_seconds: float,
+        backlog_refresh_seconds: float,
+        return_url: str | None,
+    ):
+        self.chunk_size = chunk_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.backlog_refresh_seconds = backlog_refresh_seconds
+        self.return_url = return_url
+
+        self.renewed_total = 0
+        self.chunks_total = 0
+        self.last_chunk_seconds = 0.0
+        self.last_chunk_rate = 0.0
+        self.backlog = 0
+        self.oldest_due_seconds = 0.0
+        self._backlog_refreshed_at = 0.0
+
+    def _is_due(self):
+        # Subscriptions on a withdrawn plan are not charged again; they run
+        # out at expires_at.
+        active_plan = (
+            select(Plan.id)
+            .where(Plan.id == Subscription.plan_id, Plan.status == PlanStatus.ACTIVE)
+            .exists()
+        )
+        return (
+            Subscription.status == SubscriptionStatus.ACTIVE,
+            Subscription.next_billing_at <= func.now(),
+            active_plan,
+        )
+
+    async def run_once(self) -> int:
+        started = time.perf_counter()
+
+        due = (
+            select(Subscription.id)
+            .where(*self._is_due())
+            .order_by(Subscription.next_billing_at)
+            .limit(self.chunk_size)
+            .with_for_update(of=Subscription, skip_locked=True)
+            .scalar_subquery()
+        )
+
+        subscriptions = Subscription.__table__
+        async with async_session_factory() as session, session.begin():
+            # Core UPDATE ... FROM plans so RETURNING can carry plan columns.
+            result = await session.execute(
+                update(subscriptions)
+                .where(Subscription.id.in_(due), Subscription.plan_id == Plan.id)
+                .values(
+                    next_billing_at=Subscription.next_billing_at
+                    + func.make_interval(0, 0, 0, Plan.period_days),
+                )
+                .returning(
+                    Subscription.id,
+                    Subscription.user_id,
+                    Plan.id.label("plan_id"),
+                    Plan.amount,
+                    Plan.currency,
+                )
+            )
+            renewed = result.all()
+
+            if renewed:
+                await session.execute(
+                    insert(BillingOutbox),
+                    [
+                        {
+                            "id": uuid4(),
+                            "command": OutboxCommand.CREATE_PAYMENT,
+                            "status": OutboxStatus.PENDING,
+                            "attempts": 0,
+                            "payload": {
+                                "user_id": str(row.user_id),
+                                "amount": str(row.amount),
+                                "currency": row.currency,
+                                "return_url": self.return_url,
+                                "extra_data": {
+                                    "subscription_id": str(row.id),
+                                    "plan_id": str(row.plan_id),
+                                    "renewal": True,
+                                },
+                            },
+                        }
+                        for row in renewed
+                    ],
+                )
+
+        if renewed:
+            elapsed = time.perf_counter() - started
+            RENEWALS.inc(len(renewed))
+            RENEWAL_CHUNK_SECONDS.observe(elapsed)
+            self.renewed_total += len(renewed)
+            self.chunks_total += 1
+            self.last_chunk_seconds = elapsed
+            self.last_chunk_rate = len(renewed) / elapsed if elapsed else 0.0
+            logger.info(
+                "Renewed %s subscriptions in %.3fs", len(renewed), elapsed
+            )
+        return len(renewed)
+
+    async def refresh_backlog(self) -> None:
+        async with async_session_factory() as session:
+            count, oldest = (
+                await session.execute(
+                    select(func.count(), func.min(Subscription.next_billing_at)).where(
+                        *self._is_due()
+                    )
+                )
+            ).one()
+
+        self.backlog = count
+        self.oldest_due_seconds = (
+            max(0.0, time.time() - oldest.timestamp()) if oldest else 0.0
+        )
+        self._backlog_refreshed_at = time.monotonic()
+        RENEWAL_BACKLOG.set(self.backlog)
+        RENEWAL_OLDEST_DUE.set(self.oldest_due_seconds)
+
+    async def run(self) -> None:
+        logger.info("Renewal scheduler started")
+        while True:
+            try:
+                if time.monotonic() - self._backlog_refreshed_at >= self.backlog_refresh_seconds:
+                    await self.refresh_backlog()
+                renewed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Renewal run failed")
+                renewed = 0
+
+            if renewed < self.chunk_size:
+                await asyncio.sleep(self.poll_interval_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "renewed_total": self.renewed_total,
+            "chunks_total": self.chunks_total,
+            "last_chunk_seconds": self.last_chunk_seconds,
+            "last_chunk_per_second": self.last_chunk_rate,
+            "backlog": self.backlog,
+            "oldest_due_seconds": self.oldest_due_seconds,
+        }
+
+
+renewal_scheduler = RenewalScheduler(
+    chunk_size=settings.renewal_chunk_size,
+    poll_interval_seconds=settings.renewal_poll_interval_seconds,
+    backlog_refresh_seconds=settings.renewal_backlog_refresh_seconds,
+    return_url=settings.renewal_return_url,
+)
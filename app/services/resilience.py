@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import deque
+from enum import IntEnum
+
+from app.metrics import (
+    CIRCUIT_STATE,
+    CLIENT_CONCURRENCY_LIMIT,
+    CLIENT_IN_FLIGHT,
+    CLIENT_REJECTIONS,
+)
+
+
+class CircuitState(IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, *, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        CIRCUIT_STATE.labels(client=name).set(self.state)
+
+    def _set_state(self, state: CircuitState) -> None:
+        self.state = state
+        CIRCUIT_STATE.labels(client=self.name).set(state)
+
+    def before_call(self) -> None:
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._set_state(CircuitState.HALF_OPEN)
+        # While half-open a single probe decides whether the circuit closes.
+        if self.state == CircuitState.OPEN or (
+            self.state == CircuitState.HALF_OPEN and self._probing
+        ):
+            self.rejected += 1
+            CLIENT_REJECTIONS.labels(client=self.name, reason="circuit_open").inc()
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if self.state == CircuitState.HALF_OPEN:
+            self._probing = True
+
+    def on_success(self) -> None:
+        self._probing = False
+        self.failures = 0
+        if self.state != CircuitState.CLOSED:
+            self._set_state(CircuitState.CLOSED)
+
+    def on_failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.state == CircuitState.HALF_OPEN or (
+            self.state == CircuitState.CLOSED and self.failures >= self.failure_threshold
+        ):
+            self.opened += 1
+            self._opened_at = time.monotonic()
+            self._set_state(CircuitState.OPEN)
+
+    def on_ignored(self) -> None:
+        # The call was not a verdict on the remote's health (e.g. cancelled).
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state.name.lower(),
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        *,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float,
+        smoothing: float = 0.2,
+        baseline_window_seconds: float = 60,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_window_seconds = baseline_window_seconds
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.rejected = 0
+        self._latency: float | None = None
+        self._baseline: float | None = None
+        self._window_min: float | None = None
+        self._window_started = time.monotonic()
+        self._waiters: deque[asyncio.Future] = deque()
+        self._publish()
+
+    def _publish(self) -> None:
+        CLIENT_CONCURRENCY_LIMIT.labels(client=self.name).set(int(self.limit))
+        CLIENT_IN_FLIGHT.labels(client=self.name).set(self.in_flight)
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def acquire(self) -> float:
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                else:
+                    self.rejected += 1
+                    CLIENT_REJECTIONS.labels(client=self.name, reason="concurrency").inc()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        self._publish()
+        return time.perf_counter()
+
+    def release(self, started: float) -> None:
+        self._observe(time.perf_counter() - started)
+        self.in_flight -= 1
+        self._wake()
+        self._publish()
+
+    def _observe(self, latency: float) -> None:
+        # Gradient limiter: the limit follows the ratio of the best latency
+        # seen recently to the current one, plus some headroom to probe
+        # upwards. The baseline is re-taken every window so a permanent
+        # change in billing's latency is eventually accepted as normal.
+        now = time.monotonic()
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += (latency - self._latency) * self.smoothing
+        self._window_min = latency if self._window_min is None else min(self._window_min, latency)
+        if now - self._window_started >= self.baseline_window_seconds:
+            self._baseline = self._window_min
+            self._window_min = None
+            self._window_started = now
+        elif self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+
+        gradient = max(
+            0.5,
+            min(1.0, self.latency_tolerance * self._baseline / self._latency),
+        )
+        target = self.limit * gradient + self.limit**0.5
+        limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(float(self.min_limit), min(float(self.max_limit), limit))
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "rejected": self.rejected,
+            "latency_seconds": self._latency,
+            "baseline_latency_seconds": self._baseline,
+        }
@@ -0,0 +1,295 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from decimal import Decimal
+from uuid import UUID
+
+from sqlalchemy import Numeric, Row, cast, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.db.engine import async_engine
+from app.logging_config import logger
+from app.metrics import ROLLUP_DRIFT
+from app.models.plan import Plan
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.subscription_rollup import SubscriptionRollup
+from app.services.plan_catalog import PlanCatalog, plan_catalog
+from app.settings import settings
+
+
+RollupKey = tuple[UUID, SubscriptionStatus]
+
+_LOCK_KEY = "hashtext('subscription_rollups')"
+
+
+def moved(
+    plan_id: UUID,
+    old: SubscriptionStatus | None,
+    new: SubscriptionStatus,
+    count: int = 1,
+) -> Counter[RollupKey]:
+    changes: Counter[RollupKey] = Counter({(plan_id, new): count})
+    if old is not None:
+        changes[(plan_id, old)] -= count
+    return changes
+
+
+@dataclass(frozen=True, slots=True)
+class RollupDrift:
+    plan_id: UUID
+    status: SubscriptionStatus
+    currency: str
+    count: int
+    stored_count: int
+    amount: Decimal
+    stored_amount: Decimal
+
+
+async def _upsert(connection: AsyncSession | AsyncConnection, rows: list[dict]) -> None:
+    stmt = insert(SubscriptionRollup)
+    await connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[
+                SubscriptionRollup.plan_id,
+                SubscriptionRollup.status,
+                SubscriptionRollup.shard,
+            ],
+            set_={
+                "currency": stmt.excluded.currency,
+                "count": SubscriptionRollup.count + stmt.excluded.count,
+                "amount": SubscriptionRollup.amount + stmt.excluded.amount,
+                "updated_at": func.now(),
+            },
+        ),
+        rows,
+    )
+
+
+async def _reprice(connection: AsyncConnection, plan_ids: Iterable[UUID]) -> None:
+    await connection.execute(
+        update(SubscriptionRollup)
+        .where(
+            SubscriptionRollup.plan_id.in_(sorted(plan_ids)),
+            SubscriptionRollup.plan_id == Plan.id,
+        )
+        .values(
+            currency=Plan.currency,
+            amount=SubscriptionRollup.count * cast(Plan.amount, Numeric(20, 2)),
+            updated_at=func.now(),
+        )
+    )
+
+
+class SubscriptionRollups:
+    def __init__(
+        self,
+        *,
+        shards: int,
+        reconcile_interval_seconds: float,
+        plans: PlanCatalog,
+    ):
+        self.shards = shards
+        self.reconcile_interval_seconds = reconcile_interval_seconds
+        self.plans = plans
+
+        self.reconciled_at: float | None = None
+        self.drift = 0
+        self.corrected_total = 0
+
+    async def record(
+        self,
+        session: AsyncSession,
+        changes: Mapping[RollupKey, int],
+    ) -> None:
+        # Call right before commit: the rollup rows stay locked until then.
+        changes = {key: count for key, count in changes.items() if count}
+        if not changes:
+            return
+
+        plans = await self.plans.get_many(session, {plan_id for plan_id, _ in changes})
+        shard = random.randrange(self.shards)
+        # Keys are written in a fixed order so two transactions that hit
+        # the same shard cannot deadlock on each other's rows.
+        rows = []
+        for (plan_id, status), count in sorted(changes.items()):
+            plan = plans[plan_id]
+            rows.append(
+                {
+                    "plan_id": plan_id,
+                    "status": status,
+                    "shard": shard,
+                    "currency": plan.currency,
+                    "count": count,
+                    "amount": count * Decimal(str(plan.amount)),
+                }
+            )
+        await _upsert(session, rows)
+
+    async def reprice(self, plan_id: UUID) -> None:
+        async with async_engine.begin() as conn:
+            await _reprice(conn, [plan_id])
+
+    async def summary(
+        self,
+        session: AsyncSession,
+        status: SubscriptionStatus | None = None,
+    ) -> list[Row]:
+        query = (
+            select(
+                SubscriptionRollup.plan_id,
+                SubscriptionRollup.status,
+                SubscriptionRollup.currency,
+                func.sum(SubscriptionRollup.count),
+                func.sum(SubscriptionRollup.amount),
+            )
+            .group_by(
+                SubscriptionRollup.plan_id,
+                SubscriptionRollup.status,
+                SubscriptionRollup.currency,
+            )
+            .having(func.sum(SubscriptionRollup.count) != 0)
+            .order_by(SubscriptionRollup.plan_id, SubscriptionRollup.status)
+        )
+        if status is not None:
+            query = query.where(SubscriptionRollup.status == status)
+        return list((await session.execute(query)).all())
+
+    async def _compare(self) -> list[RollupDrift]:
+        async with async_engine.connect() as conn:
+            await conn.execution_options(isolation_level="REPEATABLE READ")
+            # Both sides come from one snapshot: a transition is either
+            # visible in subscriptions and the rollup, or in neither.
+            async with conn.begin():
+                actual = (
+                    await conn.execute(
+                        select(
+                            Subscription.plan_id,
+                            Subscription.status,
+                            Plan.currency,
+                            func.count(),
+                            func.count() * cast(Plan.amount, Numeric(20, 2)),
+                        )
+                        .join(Plan, Plan.id == Subscription.plan_id)
+                        .group_by(
+                            Subscription.plan_id,
+                            Subscription.status,
+                            Plan.currency,
+                            Plan.amount,
+                        )
+                    )
+                ).all()
+                stored = (
+                    await conn.execute(
+                        select(
+                            SubscriptionRollup.plan_id,
+                            SubscriptionRollup.status,
+                            func.max(SubscriptionRollup.currency),
+                            func.sum(SubscriptionRollup.count),
+                            func.sum(SubscriptionRollup.amount),
+                        ).group_by(SubscriptionRollup.plan_id, SubscriptionRollup.status)
+                    )
+                ).all()
+
+        expected = {(row[0], row[1]): row[2:] for row in actual}
+        recorded = {(row[0], row[1]): row[2:] for row in stored}
+        drift = []
+        for key in sorted(expected.keys() | recorded.keys()):
+            stored_currency, stored_count, stored_amount = recorded.get(
+                key, (None, 0, Decimal(0))
+            )
+            currency, count, amount = expected.get(key, (stored_currency, 0, Decimal(0)))
+            if (
+                count != stored_count
+                or amount != stored_amount
+                or currency != stored_currency
+            ):
+                drift.append(
+                    RollupDrift(
+                        plan_id=key[0],
+                        status=key[1],
+                        currency=currency,
+                        count=count,
+                        stored_count=int(stored_count),
+                        amount=amount,
+                        stored_amount=stored_amount,
+                    )
+                )
+        return drift
+
+    async def reconcile(self, *, fix: bool = True) -> list[RollupDrift] | None:
+        async with async_engine.connect() as conn:
+            # Every worker runs the job; corrections must be applied once.
+            locked = await conn.scalar(text(f"SELECT pg_try_advisory_lock({_LOCK_KEY})"))
+            await conn.commit()
+            if not locked:
+                return None
+
+            try:
+                drift = await self._compare()
+                if drift and fix:
+                    # Corrections are deltas against the snapshot, so
+                    # transitions committed since then are kept. Amounts
+                    # follow from the corrected counts and current prices.
+                    await _upsert(
+                        conn,
+                        [
+                            {
+                                "plan_id": item.plan_id,
+                                "status": item.status,
+                                "shard": 0,
+                                "currency": item.currency,
+                                "count": item.count - item.stored_count,
+                                "amount": Decimal(0),
+                            }
+                            for item in drift
+                        ],
+                    )
+                    await _reprice(conn, {item.plan_id for item in drift})
+                    await conn.commit()
+            finally:
+                await conn.execute(text(f"SELECT pg_advisory_unlock({_LOCK_KEY})"))
+                await conn.commit()
+
+        self.reconciled_at = time.time()
+        self.drift = len(drift)
+        ROLLUP_DRIFT.set(len(drift))
+        for item in drift:
+            logger.warning(
+                "Rollup drift for plan %s, status %s: count %s (stored %s), amount %s (stored %s)",
+                item.plan_id, item.status.value, item.count, item.stored_count,
+                item.amount, item.stored_amount,
+            )
+        if drift and fix:
+            self.corrected_total += len(drift)
+            logger.info("Corrected %s subscription rollup rows", len(drift))
+        return drift
+
+    async def run(self) -> None:
+        logger.info("Subscription rollup reconciliation started")
+        while True:
+            await asyncio.sleep(self.reconcile_interval_seconds)
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Subscription rollup reconciliation failed")
+
+    def stats(self) -> dict:
+        return {
+            "shards": self.shards,
+            "reconciled_at": self.reconciled_at,
+            "drift": self.drift,
+            "corrected_total": self.corrected_total,
+        }
+
+
+subscription_rollups = SubscriptionRollups(
+    shards=settings.rollup_shards,
+    reconcile_interval_seconds=settings.rollup_reconcile_interval_seconds,
+    plans=plan_catalog,
+)
@@ -1,24 +1,69 @@
-from uuid import UUID
+import asyncio
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Literal
+from uuid import UUID, uuid4
 from fastapi import HTTPException
+from sqlalchemy import insert, select, update
 
 from app.logging_config import logger
+from app.metrics import SERVICE_LATENCY, record_transition, timed
+from app.models.billing_outbox import BillingOutbox
 from app.models.subscription import Subscription, SubscriptionStatus
 from app.services.billing_client import BillingClient
-from app.models.plan import Plan, PlanStatus
+from app.services.entitlements import EntitlementCache, entitlement_cache
+from app.models.plan import PlanStatus
+from app.services import outbox
+from app.services.plan_catalog import PlanCatalog, plan_catalog
+from app.services.rollups import SubscriptionRollups, moved, subscription_rollups
+from app.settings import settings
+
+
+@dataclass(frozen=True, slots=True)
+class NewSubscription:
+    user_id: UUID
+    plan_id: UUID
+    return_url: str
+
+
+@dataclass(frozen=True, slots=True)
+class BulkItemResult:
+    index: int
+    subscription_id: UUID | None
+    status: Literal["created", "cancelled", "failed"]
+    error: str | None = None
 
 
 class SubscriptionService:
-    def __init__(self, session, billing_client: BillingClient):
+    def __init__(
+        self,
+        session,
+        billing_client: BillingClient,
+        plans: PlanCatalog = plan_catalog,
+        use_outbox: bool = settings.billing_outbox_enabled,
+        billing_concurrency: int = settings.bulk_billing_concurrency,
+        entitlements: EntitlementCache = entitlement_cache,
+        rollups: SubscriptionRollups = subscription_rollups,
+    ):
         self.session = session
         self.billing = billing_client
+        self.plans = plans
+        self.use_outbox = use_outbox
+        self.billing_concurrency = billing_concurrency
+        self.entitlements = entitlements
+        self.rollups = rollups
 
+    @timed(SERVICE_LATENCY, method="create_subscription")
     async def create_subscription(
         self,
         user_id: UUID,
         plan_id: UUID,
         return_url: str,
+        before_commit: Callable[[Subscription], Awaitable[None]] | None = None,
     ) -> Subscription:
-        plan = await self.session.get(Plan, plan_id)
+        plan = await self.plans.get(self.session, plan_id)
         if not plan or plan.status != PlanStatus.ACTIVE:
             logger.warning(
                 "Attempted to subscribe to unavailable plan_id=%s by user_id=%s",
@@ -35,17 +80,43 @@ class SubscriptionService:
         self.session.add(subscription)
         await self.session.flush()
 
+        payment: dict[str, Any] = {
+            "user_id": user_id,
+            "amount": plan.amount,
+            "currency": plan.currency,
+            "return_url": return_url,
+            "extra_data": {
+                "subscription_id": str(subscription.id),
+                "plan_id": str(plan.id),
+            },
+        }
+
+        if self.use_outbox:
+            outbox.enqueue_payment(self.session, **payment)
+            await self.rollups.record(
+                self.session, moved(plan.id, None, SubscriptionStatus.PENDING_PAYMENT)
+            )
+            if before_commit is not None:
+                await before_commit(subscription)
+            await self.session.commit()
+            record_transition(SubscriptionStatus.PENDING_PAYMENT)
+            logger.info(
+                "Created subscription %s for user_id=%s, plan_id=%s, payment queued",
+                subscription.id,
+                user_id,
+                plan.id,
+            )
+            return subscription
+
         try:
-            await self.billing.create_payment(
-                user_id=user_id,
-                amount=plan.amount,
-                currency=plan.currency,
-                return_url=return_url,
-                extra_data={
-                    "subscription_id": str(subscription.id),
-                    "plan_id": str(plan.id),
-                },
+            await self.billing.create_payment(**payment)
+            await self.rollups.record(
+                self.session, moved(plan.id, None, SubscriptionStatus.PENDING_PAYMENT)
             )
+            if before_commit is not None:
+                await before_commit(subscription)
+            await self.session.commit()
+            record_transition(SubscriptionStatus.PENDING_PAYMENT)
             logger.info(
                 "Created subscription %s for user_id=%s, plan_id=%s, amount=%s %s",
                 subscription.id,
@@ -66,17 +137,121 @@ class SubscriptionService:
 
         return subscription
 
+    @timed(SERVICE_LATENCY, method="create_subscriptions")
+    async def create_subscriptions(
+        self,
+        items: list[NewSubscription],
+    ) -> list[BulkItemResult]:
+        plans = await self.plans.get_many(self.session, {item.plan_id for item in items})
+
+        results: dict[int, BulkItemResult] = {}
+        rows: dict[int, dict[str, Any]] = {}
+        payments: dict[int, dict[str, Any]] = {}
+        for index, item in enumerate(items):
+            plan = plans.get(item.plan_id)
+            if plan is None or plan.status != PlanStatus.ACTIVE:
+                results[index] = BulkItemResult(index, None, "failed", "Plan not available")
+                continue
+
+            subscription_id = uuid4()
+            rows[index] = {
+                "id": subscription_id,
+                "user_id": item.user_id,
+                "plan_id": plan.id,
+                "status": SubscriptionStatus.PENDING_PAYMENT,
+            }
+            payments[index] = {
+                "user_id": item.user_id,
+                "amount": plan.amount,
+                "currency": plan.currency,
+                "return_url": item.return_url,
+                "extra_data": {
+                    "subscription_id": str(subscription_id),
+                    "plan_id": str(plan.id),
+                },
+            }
+
+        if not self.use_outbox and payments:
+            # Ids are generated up front, so only subscriptions whose payment
+            # was accepted get inserted.
+            for index, error in await self._create_payments(payments):
+                del rows[index]
+                results[index] = BulkItemResult(index, None, "failed", error)
+
+        if rows:
+            await self.session.execute(insert(Subscription), list(rows.values()))
+            if self.use_outbox:
+                await self.session.execute(
+                    insert(BillingOutbox),
+                    [outbox.payment_command(**payments[index]) for index in rows],
+                )
+            await self.rollups.record(
+                self.session,
+                Counter(
+                    (row["plan_id"], SubscriptionStatus.PENDING_PAYMENT)
+                    for row in rows.values()
+                ),
+            )
+        await self.session.commit()
+        record_transition(SubscriptionStatus.PENDING_PAYMENT, len(rows))
+
+        for index, row in rows.items():
+            results[index] = BulkItemResult(index, row["id"], "created")
+        logger.info(
+            "Bulk created %s of %s subscriptions", len(rows), len(items)
+        )
+        return [results[index] for index in range(len(items))]
+
+    async def _create_payments(
+        self,
+        payments: dict[int, dict[str, Any]],
+    ) -> list[tuple[int, str]]:
+        semaphore = asyncio.Semaphore(self.billing_concurrency)
+
+        async def create(payment: dict[str, Any]) -> None:
+            async with semaphore:
+                await self.billing.create_payment(**payment)
+
+        outcomes = await asyncio.gather(
+            *(create(payment) for payment in payments.values()),
+            return_exceptions=True,
+        )
+        return [
+            (index, "Payment failed")
+            for index, outcome in zip(payments, outcomes)
+            if isinstance(outcome, Exception)
+        ]
+
+    @timed(SERVICE_LATENCY, method="activate_from_payment")
     async def activate_from_payment(
         self,
         subscription_id: UUID,
         payment_id: UUID,
+        renewal: bool = False,
     ) -> None:
         subscription = await self.session.get(Subscription, subscription_id)
         if not subscription:
             logger.warning("Subscription %s not found for activation", subscription_id)
             return
 
-        if subscription.status != SubscriptionStatus.PENDING_PAYMENT:
+        if renewal and subscription.status == SubscriptionStatus.ACTIVE:
+            # A renewal charge went through: the paid period grows by one.
+            plan = await self.plans.get(self.session, subscription.plan_id)
+            if plan is not None:
+                subscription.expires_at = (
+                    subscription.expires_at or datetime.now(timezone.utc)
+                ) + timedelta(days=plan.period_days)
+            subscription.payment_id = payment_id
+            logger.info(
+                "Extended subscription %s to %s from payment %s",
+                subscription_id, subscription.expires_at, payment_id,
+            )
+            return
+
+        # A renewal charge that lands after the expiry processor ran brings
+        # the subscription back with a new period, like a first payment.
+        reactivated = renewal and subscription.status == SubscriptionStatus.EXPIRED
+        if subscription.status != SubscriptionStatus.PENDING_PAYMENT and not reactivated:
             logger.info(
                 "Subscription %s activation skipped (status=%s)",
                 subscription_id,
@@ -84,12 +259,30 @@ class SubscriptionService:
             )
             return
 
+        previous_status = subscription.status
         subscription.status = SubscriptionStatus.ACTIVE
         subscription.payment_id = payment_id
+
+        plan = await self.plans.get(self.session, subscription.plan_id)
+        if plan is not None:
+            subscription.next_billing_at = datetime.now(timezone.utc) + timedelta(
+                days=plan.period_days
+            )
+            subscription.expires_at = subscription.next_billing_at
+        await self.entitlements.notify_changed(self.session, [subscription.user_id])
+        await self.rollups.record(
+            self.session,
+            moved(subscription.plan_id, previous_status, SubscriptionStatus.ACTIVE),
+        )
+        record_transition(SubscriptionStatus.ACTIVE)
         logger.info(
-            "Activated subscription %s from payment %s", subscription_id, payment_id
+            "%s subscription %s from payment %s",
+            "Reactivated" if reactivated else "Activated",
+            subscription_id,
+            payment_id,
         )
 
+    @timed(SERVICE_LATENCY, method="cancel")
     async def cancel(self, subscription_id: UUID, user_id: UUID) -> None:
         subscription = await self.session.get(Subscription, subscription_id)
         if not subscription or subscription.user_id != user_id:
@@ -109,8 +302,82 @@ class SubscriptionService:
             raise HTTPException(status_code=409, detail="Cannot cancel")
 
         subscription.status = SubscriptionStatus.CANCELLED
+        await self.entitlements.notify_changed(self.session, [user_id])
+        await self.rollups.record(
+            self.session,
+            moved(
+                subscription.plan_id,
+                SubscriptionStatus.ACTIVE,
+                SubscriptionStatus.CANCELLED,
+            ),
+        )
+        await self.session.commit()
+        record_transition(SubscriptionStatus.CANCELLED)
         logger.info("Cancelled subscription %s for user_id=%s", subscription_id, user_id)
 
+    @timed(SERVICE_LATENCY, method="cancel_subscriptions")
+    async def cancel_subscriptions(
+        self,
+        subscription_ids: list[UUID],
+    ) -> list[BulkItemResult]:
+        unique_ids = list(dict.fromkeys(subscription_ids))
+        result = await self.session.execute(
+            update(Subscription)
+            .where(
+                Subscription.id.in_(unique_ids),
+                Subscription.status == SubscriptionStatus.ACTIVE,
+            )
+            .values(status=SubscriptionStatus.CANCELLED)
+            .returning(Subscription.id, Subscription.user_id, Subscription.plan_id)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+        owners = {row.id: row.user_id for row in rows}
+        cancelled = set(owners)
+
+        statuses: dict[UUID, SubscriptionStatus] = {}
+        rejected = [id_ for id_ in unique_ids if id_ not in cancelled]
+        if rejected:
+            statuses = dict(
+                (
+                    await self.session.execute(
+                        select(Subscription.id, Subscription.status).where(
+                            Subscription.id.in_(rejected)
+                        )
+                    )
+                ).tuples().all()
+            )
+        await self.entitlements.notify_changed(self.session, set(owners.values()))
+        changes: Counter = Counter()
+        for row in rows:
+            changes.update(
+                moved(row.plan_id, SubscriptionStatus.ACTIVE, SubscriptionStatus.CANCELLED)
+            )
+        await self.rollups.record(self.session, changes)
+        await self.session.commit()
+        record_transition(SubscriptionStatus.CANCELLED, len(cancelled))
+        logger.info(
+            "Bulk cancelled %s of %s subscriptions", len(cancelled), len(unique_ids)
+        )
+
+        results = []
+        for index, subscription_id in enumerate(subscription_ids):
+            if subscription_id in cancelled:
+                results.append(BulkItemResult(index, subscription_id, "cancelled"))
+            elif subscription_id in statuses:
+                results.append(
+                    BulkItemResult(
+                        index,
+                        subscription_id,
+                        "failed",
+                        f"Cannot cancel (status={statuses[subscription_id].value})",
+                    )
+                )
+            else:
+                results.append(BulkItemResult(index, subscription_id, "failed", "Not found"))
+        return results
+
+    @timed(SERVICE_LATENCY, method="request_refund")
     async def request_refund(
         self,
         subscription_id: UUID,
@@ -144,7 +411,7 @@ class SubscriptionService:
             )
             raise HTTPException(status_code=409, detail="Payment not completed")
 
-        plan = await self.session.get(Plan, subscription.plan_id)
+        plan = await self.plans.get(self.session, subscription.plan_id)
         if not plan:
             logger.error(
                 "Refund failed: plan %s not found for subscription %s",
@@ -153,15 +420,33 @@ class SubscriptionService:
             )
             raise HTTPException(status_code=404, detail="Plan not found")
 
+        refund: dict[str, Any] = {
+            "payment_id": subscription.payment_id,
+            "amount": plan.amount,
+            "currency": plan.currency,
+            "handler_url": handler_url,
+            "extra_data": {"subscription_id": str(subscription.id)},
+        }
+
+        if self.use_outbox:
+            outbox.enqueue_refund(self.session, **refund)
+            await self._mark_refund_requested(subscription)
+            await self.session.commit()
+            record_transition(SubscriptionStatus.REFUND_REQUESTED)
+            logger.info(
+                "Refund queued for subscription %s (payment_id=%s, amount=%s %s)",
+                subscription_id,
+                subscription.payment_id,
+                plan.amount,
+                plan.currency,
+            )
+            return
+
         try:
-            await self.billing.create_refund(
-                payment_id=subscription.payment_id,
-                amount=plan.amount,
-                currency=plan.currency,
-                handler_url=handler_url,
-                extra_data={"subscription_id": str(subscription.id)},
-            )
-            subscription.status = SubscriptionStatus.REFUND_REQUESTED
+            await self.billing.create_refund(**refund)
+            await self._mark_refund_requested(subscription)
+            await self.session.commit()
+            record_transition(SubscriptionStatus.REFUND_REQUESTED)
             logger.info(
                 "Refund requested for subscription %s (payment_id=%s, amount=%s %s)",
                 subscription_id,
@@ -177,3 +462,15 @@ class SubscriptionService:
                 e,
             )
             raise
+
+    async def _mark_refund_requested(self, subscription: Subscription) -> None:
+        await self.rollups.record(
+            self.session,
+            moved(
+                subscription.plan_id,
+                subscription.status,
+                SubscriptionStatus.REFUND_REQUESTED,
+            ),
+        )
+        subscription.status = SubscriptionStatus.REFUND_REQUESTED
+        await self.entitlements.notify_changed(self.session, [subscription.user_id])
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 
@@ -12,6 +14,71 @@ class Settings(BaseSettings):
     auth_api_access_token_check_url: str = Field(
         default="http://auth-api-nginx:8000/api/v1/auth/check_access_token"
     )
+    auth_verify_mode: Literal["remote", "local"] = Field(default="remote")
+    auth_jwks_url: str = Field(
+        default="http://auth-api-nginx:8000/api/v1/auth/jwks"
+    )
+    auth_jwks_refresh_seconds: int = Field(default=300)
+    auth_jwks_min_refresh_seconds: int = Field(default=30)
+    auth_jwt_algorithms: list[str] = Field(default=["RS256"])
+    auth_token_cache_size: int = Field(default=10_000)
+    auth_token_cache_ttl_seconds: int = Field(default=60)
+    auth_remote_cache_ttl_seconds: float = Field(default=5)
+    http_pool_limit: int = Field(default=100)
+    http_pool_limit_per_host: int = Field(default=50)
+    http_keepalive_seconds: float = Field(default=30)
+    http_dns_cache_seconds: int = Field(default=300)
+    http_connect_timeout_seconds: float = Field(default=2)
+    http_total_timeout_seconds: float = Field(default=10)
+    plan_cache_ttl_seconds: float = Field(default=300)
+    bulk_max_items: int = Field(default=1000)
+    bulk_billing_concurrency: int = Field(default=20)
+    billing_timeout_seconds: float = Field(default=5)
+    billing_breaker_failure_threshold: int = Field(default=5)
+    billing_breaker_reset_seconds: float = Field(default=30)
+    billing_concurrency_min: int = Field(default=2)
+    billing_concurrency_max: int = Field(default=50)
+    billing_latency_tolerance: float = Field(default=2.0)
+    entitlement_cache_size: int = Field(default=100_000)
+    entitlement_cache_ttl_seconds: float = Field(default=300)
+    entitlement_warmup_enabled: bool = Field(default=True)
+    entitlement_warmup_chunk_size: int = Field(default=5000)
+    processed_events_retention_enabled: bool = Field(default=True)
+    processed_events_retention_days: int = Field(default=7)
+    processed_events_premake_days: int = Field(default=3)
+    processed_events_retention_interval_seconds: float = Field(default=3600)
+    idempotency_ttl_seconds: float = Field(default=86400)
+    idempotency_lock_seconds: float = Field(default=60)
+    idempotency_wait_seconds: float = Field(default=10)
+    idempotency_poll_interval_seconds: float = Field(default=0.5)
+    idempotency_cleanup_enabled: bool = Field(default=True)
+    idempotency_cleanup_interval_seconds: float = Field(default=300)
+    idempotency_cleanup_batch_size: int = Field(default=5000)
+    rollup_shards: int = Field(default=8)
+    rollup_reconcile_enabled: bool = Field(default=True)
+    rollup_reconcile_interval_seconds: float = Field(default=3600)
+    billing_outbox_enabled: bool = Field(default=True)
+    billing_outbox_dispatcher_enabled: bool = Field(default=True)
+    billing_outbox_batch_size: int = Field(default=100)
+    billing_outbox_concurrency: int = Field(default=10)
+    billing_outbox_max_attempts: int = Field(default=10)
+    billing_outbox_lease_seconds: float = Field(default=60)
+    billing_outbox_backoff_base_seconds: float = Field(default=2)
+    billing_outbox_backoff_max_seconds: float = Field(default=300)
+    billing_outbox_poll_interval_seconds: float = Field(default=1)
+    renewal_enabled: bool = Field(default=False)
+    renewal_chunk_size: int = Field(default=500)
+    renewal_poll_interval_seconds: float = Field(default=30)
+    renewal_backlog_refresh_seconds: float = Field(default=60)
+    renewal_return_url: str | None = Field(default=None)
+    expiry_enabled: bool = Field(default=True)
+    expiry_chunk_size: int = Field(default=1000)
+    expiry_grace_seconds: float = Field(default=3 * 24 * 3600)
+    expiry_poll_interval_seconds: float = Field(default=30)
+    expiry_backlog_refresh_seconds: float = Field(default=60)
+    admin_exact_count_limit: int = Field(default=10_000)
+    export_chunk_size: int = Field(default=10_000)
+    import_batch_size: int = Field(default=10_000)
     secret_key: str = Field(default="secretkey123")
     db_echo: bool = Field(default=False)
 
@@ -26,11 +93,30 @@ class PostgresSettings(BaseSettings):
     user: str
     password: str
     db: str
+    replica_host: str | None = Field(default=None)
+    replica_port: int | None = Field(default=None)
+
+    pool_size: int = Field(default=5)
+    max_overflow: int = Field(default=10)
+    pool_timeout_seconds: float = Field(default=30)
+    pool_pre_ping: bool = Field(default=False)
+    statement_cache_size: int = Field(default=100)
+    statement_timeout_ms: int | None = Field(default=None)
+    admin_pool_size: int = Field(default=2)
+    admin_max_overflow: int = Field(default=3)
+    admin_statement_timeout_ms: int | None = Field(default=30_000)
 
     def get_url(self, driver: str | None = None, db: str | None = None) -> str:
         scheme = f'postgresql{f"+{driver}" if driver else ""}'
         return f"{scheme}://{self.user}:{self.password}@{self.host}:{self.port}/{db or self.db}"
 
+    def get_replica_url(self, driver: str | None = None) -> str | None:
+        if not self.replica_host:
+            return None
+        scheme = f'postgresql{f"+{driver}" if driver else ""}'
+        port = self.replica_port or self.port
+        return f"{scheme}://{self.user}:{self.password}@{self.replica_host}:{port}/{self.db}"
+
 
 class KafkaSettings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -38,6 +124,21 @@ class KafkaSettings(BaseSettings):
     )
 
     bootstrap_servers: str = Field(default='localhost:19092')
+    payment_topic: str = Field(default='payments')
+    refund_topic: str = Field(default='refunds')
+    group_id: str = Field(default='subscription-service')
+    processing_mode: Literal['single', 'batch', 'concurrent'] = Field(default='batch')
+    workers: int | None = Field(default=None)
+    batch_size: int = Field(default=500)
+    batch_max_wait_ms: int = Field(default=500)
+    dedup_cache_size: int = Field(default=100_000)
+    retry_topic_prefix: str = Field(default='subscription-service.retry')
+    retry_delays_seconds: list[int] = Field(default=[10, 60, 600])
+    dead_letter_topic: str = Field(default='subscription-service.dlq')
+    consumer_processes: int = Field(default=1)
+    consumer_health_port: int | None = Field(default=8090)
+    consumer_shutdown_timeout_seconds: float = Field(default=30)
+    consumer_heartbeat_timeout_seconds: float = Field(default=30)
 
 
 settings = Settings()       # type: ignore
@@ -0,0 +1,268 @@
+"""Load benchmark for the /api/v1/subscriptions routes.
+
+Runs the app in-process against fake auth and billing servers (with
+configurable latency) and a local Postgres taken from SUBSCRIPTION_PG_*:
+
+    python -m benchmarks.bench_api --concurrency 32 --requests 2000
+    python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import UUID, uuid4
+
+from benchmarks.fakes import FakeAuth, FakeBilling, issue_token
+
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def _percentile(sorted_values: list[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *args) -> None:
+        self.count += 1
+
+
+async def run_phase(
+    name: str,
+    send: Callable[[int], Awaitable],
+    *,
+    total: int,
+    concurrency: int,
+    queries: QueryCounter,
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    indexes = iter(range(total))
+
+    async def worker() -> None:
+        nonlocal errors
+        for index in indexes:
+            started = time.perf_counter()
+            response = await send(index)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries_before = queries.count
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "queries_per_request": round((queries.count - queries_before) / total, 2),
+    }
+    print(
+        f"{name:8s} {result['rps']:9.1f} rps  p50 {result['p50_ms']:7.2f} ms  "
+        f"p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+        f"{result['queries_per_request']:5.2f} q/req  {errors} errors"
+    )
+    return result
+
+
+async def main(args: argparse.Namespace) -> dict:
+    auth = FakeAuth(args.auth_latency_ms)
+    billing = FakeBilling(args.billing_latency_ms)
+    auth_url = await auth.start()
+    billing_url = await billing.start()
+
+    os.environ.update(
+        {
+            "SUBSCRIPTION_API_AUTH_API_ACCESS_TOKEN_CHECK_URL": f"{auth_url}/check",
+            "SUBSCRIPTION_API_AUTH_JWKS_URL": f"{auth_url}/jwks",
+            "SUBSCRIPTION_API_AUTH_JWT_ALGORITHMS": '["HS256"]',
+            "SUBSCRIPTION_API_AUTH_VERIFY_MODE": args.auth_mode,
+            "SUBSCRIPTION_API_BILL_API_BASE_URL": billing_url,
+            "SUBSCRIPTION_API_BILLING_OUTBOX_ENABLED": str(args.outbox).lower(),
+            "SUBSCRIPTION_API_BILLING_OUTBOX_DISPATCHER_ENABLED": "false",
+            "SUBSCRIPTION_API_RENEWAL_ENABLED": "false",
+        }
+    )
+
+    # The app reads its settings at import time, so import only after the
+    # environment points at the fakes.
+    import httpx
+    from asgi_lifespan import LifespanManager
+    from sqlalchemy import event, update
+
+    import app.models  # noqa: F401
+    from app.db.engine import async_engine
+    from app.main import app
+    from app.models.base import Base
+    from app.models.plan import Plan, PlanStatus
+    from app.models.subscription import Subscription, SubscriptionStatus
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    plan_id = uuid4()
+    async with async_engine.begin() as conn:
+        await conn.execute(
+            Plan.__table__.insert().values(
+                id=plan_id,
+                name=f"bench-{plan_id}",
+                amount=9.99,
+                currency="USD",
+                period_days=30,
+                status=PlanStatus.ACTIVE,
+                created_at=datetime.now(timezone.utc),
+                updated_at=datetime.now(timezone.utc),
+            )
+        )
+
+    users = [uuid4() for _ in range(args.users)]
+    cookies = {user: {"access-token": issue_token(user)} for user in users}
+    created: list[tuple[UUID, UUID]] = []
+
+    queries = QueryCounter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", queries)
+
+    results: dict = {}
+    async with LifespanManager(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+
+            async def create(index: int):
+                user = users[index % len(users)]
+                client_cookies = cookies[user]
+                response = await client.post(
+                    "/api/v1/subscriptions",
+                    json={"plan_id": str(plan_id), "return_url": "http://bench/return"},
+                    cookies=client_cookies,
+                )
+                if response.status_code == 200:
+                    created.append((user, UUID(response.json()["id"])))
+                return response
+
+            async def list_(index: int):
+                user = users[index % len(users)]
+                return await client.get(
+                    "/api/v1/subscriptions",
+                    params={"limit": args.page_size},
+                    cookies=cookies[user],
+                )
+
+            results["create"] = await run_phase(
+                "create", create,
+                total=args.requests, concurrency=args.concurrency, queries=queries,
+            )
+
+            async with async_engine.begin() as conn:
+                await conn.execute(
+                    update(Subscription.__table__)
+                    .where(Subscription.id.in_([sub for _, sub in created]))
+                    .values(status=SubscriptionStatus.ACTIVE, payment_id=uuid4())
+                )
+
+            results["list"] = await run_phase(
+                "list", list_,
+                total=args.requests, concurrency=args.concurrency, queries=queries,
+            )
+
+            half = len(created) // 2
+            to_cancel, to_refund = created[:half], created[half:]
+
+            async def cancel(index: int):
+                user, subscription_id = to_cancel[index]
+                return await client.post(
+                    f"/api/v1/subscriptions/{subscription_id}/cancel",
+                    cookies=cookies[user],
+                )
+
+            async def refund(index: int):
+                user, subscription_id = to_refund[index]
+                return await client.post(
+                    f"/api/v1/subscriptions/{subscription_id}/refund",
+                    json={"handler_url": "http://bench/refund"},
+                    cookies=cookies[user],
+                )
+
+            results["cancel"] = await run_phase(
+                "cancel", cancel,
+                total=len(to_cancel), concurrency=args.concurrency, queries=queries,
+            )
+            results["refund"] = await run_phase(
+                "refund", refund,
+                total=len(to_refund), concurrency=args.concurrency, queries=queries,
+            )
+
+    await auth.stop()
+    await billing.stop()
+
+    return {
+        "revision": _git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "params": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "users": args.users,
+            "auth_mode": args.auth_mode,
+            "auth_latency_ms": args.auth_latency_ms,
+            "billing_latency_ms": args.billing_latency_ms,
+            "outbox": args.outbox,
+            "page_size": args.page_size,
+        },
+        "auth_calls": auth.calls,
+        "billing_calls": billing.calls,
+        "phases": results,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--auth-mode", choices=["remote", "local"], default="remote")
+    parser.add_argument("--auth-latency-ms", type=float, default=5)
+    parser.add_argument("--billing-latency-ms", type=float, default=50)
+    parser.add_argument("--outbox", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--output", type=Path, default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = asyncio.run(main(arguments))
+
+    output = arguments.output or RESULTS_DIR / (
+        f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}_{report['revision']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Saved results to {output}")
@@ -0,0 +1,55 @@
+"""Per-event CPU cost of decoding Kafka payment events.
+
+    python -m benchmarks.bench_event_decoding
+"""
+import json
+import timeit
+import uuid
+
+import orjson
+
+from app.kafka.schemas import PaymentEventSchema
+
+
+PAYLOAD = orjson.dumps(
+    {
+        "id": str(uuid.uuid4()),
+        "status": "succeeded",
+        "external_cancellation_reason": None,
+        "extra_data": {
+            "subscription_id": str(uuid.uuid4()),
+            "plan_id": str(uuid.uuid4()),
+        },
+    }
+)
+
+_validator = PaymentEventSchema.__pydantic_validator__
+
+
+def json_then_validate() -> PaymentEventSchema:
+    return PaymentEventSchema.model_validate(json.loads(PAYLOAD.decode("utf-8")))
+
+
+def orjson_then_validate() -> PaymentEventSchema:
+    return PaymentEventSchema.model_validate(orjson.loads(PAYLOAD))
+
+
+def validate_json() -> PaymentEventSchema:
+    return _validator.validate_json(PAYLOAD)
+
+
+CASES = {
+    "json.loads + model_validate (before)": json_then_validate,
+    "orjson.loads + model_validate": orjson_then_validate,
+    "validate_json on raw bytes (after)": validate_json,
+}
+
+
+def main(number: int = 100_000, repeat: int = 5) -> None:
+    for name, func in CASES.items():
+        best = min(timeit.repeat(func, number=number, repeat=repeat))
+        print(f"{name:40s} {best / number * 1e6:8.2f} us/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare two bench_api result files and flag regressions.
+
+    python -m benchmarks.compare OLD.json NEW.json [--threshold 10]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+# metric -> True when higher is better
+METRICS = {
+    "rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "queries_per_request": False,
+}
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    regressions = []
+    print(f"{'phase':8s} {'metric':20s} {old['revision']:>10s} {new['revision']:>10s} {'change':>9s}")
+    for phase, new_result in new["phases"].items():
+        old_result = old["phases"].get(phase)
+        if old_result is None:
+            continue
+
+        for metric, higher_is_better in METRICS.items():
+            before, after = old_result[metric], new_result[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > threshold else ""
+            print(f"{phase:8s} {metric:20s} {before:10.2f} {after:10.2f} {change:+8.1f}%{flag}")
+            if flag:
+                regressions.append(f"{phase}.{metric}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent")
+    args = parser.parse_args()
+
+    old = json.loads(args.old.read_text())
+    new = json.loads(args.new.read_text())
+    if old["params"] != new["params"]:
+        print("warning: runs used different parameters", file=sys.stderr)
+
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
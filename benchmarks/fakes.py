@@ -0,0 +1,83 @@
+import asyncio
+import base64
+import time
+from uuid import UUID
+
+from aiohttp import web
+from jose import jwt
+
+
+SIGNING_SECRET = b"benchmark-signing-secret-0123456789"
+SIGNING_KID = "bench"
+
+
+def issue_token(user_id: UUID, role: str = "user") -> str:
+    return jwt.encode(
+        {"sub": str(user_id), "role": role, "exp": int(time.time()) + 3600},
+        SIGNING_SECRET,
+        algorithm="HS256",
+        headers={"kid": SIGNING_KID},
+    )
+
+
+class FakeService:
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.app = web.Application()
+        self._runner: web.AppRunner | None = None
+        self.port = 0
+
+    async def _delay(self) -> None:
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+    async def start(self) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeAuth(FakeService):
+    def __init__(self, latency_ms: float):
+        super().__init__(latency_ms)
+        self.app.router.add_post("/check", self.check)
+        self.app.router.add_get("/jwks", self.jwks)
+
+    async def check(self, request: web.Request) -> web.Response:
+        await self._delay()
+        if "access-token" not in request.cookies:
+            return web.Response(status=401)
+        return web.json_response({"ok": True})
+
+    async def jwks(self, request: web.Request) -> web.Response:
+        await self._delay()
+        key = base64.urlsafe_b64encode(SIGNING_SECRET).rstrip(b"=").decode()
+        return web.json_response(
+            {"keys": [{"kty": "oct", "kid": SIGNING_KID, "alg": "HS256", "k": key}]}
+        )
+
+
+class FakeBilling(FakeService):
+    def __init__(self, latency_ms: float):
+        super().__init__(latency_ms)
+        self.app.router.add_post("/api/v1/payment", self.payment)
+        self.app.router.add_post("/api/v1/payment/{payment_id}/refund", self.refund)
+
+    async def payment(self, request: web.Request) -> web.Response:
+        await self._delay()
+        await request.read()
+        return web.json_response({"ok": True}, status=201)
+
+    async def refund(self, request: web.Request) -> web.Response:
+        await self._delay()
+        await request.read()
+        return web.json_response({"ok": True}, status=201)
@@ -0,0 +1,28 @@
+from uuid import UUID, uuid4
+
+import pytest
+
+from app.kafka.batch import _subscription_id
+from app.kafka.schemas import PaymentEventSchema
+
+
+def payment(extra_data: dict | None) -> PaymentEventSchema:
+    return PaymentEventSchema(id=uuid4(), status="succeeded", extra_data=extra_data)
+
+
+def test_subscription_id_is_parsed():
+    subscription_id = uuid4()
+    assert _subscription_id(payment({"subscription_id": str(subscription_id)})) == subscription_id
+
+
+@pytest.mark.parametrize(
+    "extra_data",
+    [None, {}, {"subscription_id": "not-a-uuid"}, {"subscription_id": 42}],
+)
+def test_missing_or_invalid_subscription_id_is_skipped(extra_data):
+    assert _subscription_id(payment(extra_data)) is None
+
+
+def test_subscription_id_accepts_uuid_forms():
+    subscription_id = UUID("5083fd1d-c420-44da-9fdd-b707af251b37")
+    assert _subscription_id(payment({"subscription_id": subscription_id.hex})) == subscription_id
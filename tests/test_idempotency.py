@@ -0,0 +1,190 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.api.v1 import subscriptions
+from app.api.v1.subscriptions import CreateSubscriptionRequest
+from app.db.listener import PgListener
+from app.models.subscription import SubscriptionStatus
+from app.services.idempotency import IDEMPOTENCY_CHANNEL, IdempotencyStore, _token
+
+
+class FakeIdempotencyStore(IdempotencyStore):
+    # Keeps keys in memory and delivers NOTIFY through the listener, so
+    # begin() runs against the same claim/load/notify contract as in Postgres.
+    def __init__(self, **kwargs):
+        self.listener = PgListener("postgresql://unused")
+        options = {
+            "ttl_seconds": 60,
+            "lock_seconds": 60,
+            "wait_seconds": 5,
+            "poll_interval_seconds": 5,
+            "cleanup_batch_size": 100,
+            "cleanup_interval_seconds": 60,
+        }
+        super().__init__(listener=self.listener, **{**options, **kwargs})
+        self.keys: dict[tuple, dict] = {}
+        self.claims = 0
+
+    async def _claim(self, user_id, key, request_hash):
+        self.claims += 1
+        if (user_id, key) in self.keys:
+            return False
+        self.keys[(user_id, key)] = {
+            "request_hash": request_hash,
+            "response_status": None,
+            "response_body": None,
+        }
+        return True
+
+    async def _load(self, user_id, key):
+        row = self.keys.get((user_id, key))
+        return type("Row", (), row) if row is not None else None
+
+    async def complete(self, user_id, key, status_code, body, connection=None):
+        self.keys[(user_id, key)].update(response_status=status_code, response_body=body)
+        self.notify(user_id, key)
+
+    async def release(self, user_id, key):
+        self.keys.pop((user_id, key), None)
+        self.notify(user_id, key)
+
+    def notify(self, user_id, key):
+        self.listener._dispatch(None, 0, IDEMPOTENCY_CHANNEL, _token(user_id, key))
+
+
+@pytest.mark.asyncio
+async def test_timed_out_wait_leaves_no_waiter_behind():
+    store = FakeIdempotencyStore()
+    user_id = uuid4()
+
+    await store._wait(user_id, "key", 0.01)
+
+    assert store._waiters == {}
+
+
+class FakeSubscriptionService:
+    def __init__(self, *, block: bool = False):
+        self.calls = 0
+        self.release = asyncio.Event()
+        if not block:
+            self.release.set()
+
+    async def create_subscription(self, user_id, plan_id, return_url, before_commit=None):
+        self.calls += 1
+        await self.release.wait()
+        subscription = SimpleNamespace(
+            id=uuid4(), plan_id=plan_id, status=SubscriptionStatus.PENDING_PAYMENT
+        )
+        if before_commit is not None:
+            await before_commit(subscription)
+        return subscription
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeIdempotencyStore()
+    monkeypatch.setattr(subscriptions, "idempotency_store", store)
+    return store
+
+
+async def create(service, user_id, body, key="key"):
+    return await subscriptions.create_subscription(
+        body=body, idempotency_key=key, user_id=user_id, session=None, service=service
+    )
+
+
+def request(plan_id=None):
+    return CreateSubscriptionRequest(plan_id=plan_id or uuid4(), return_url="http://x/done")
+
+
+@pytest.mark.asyncio
+async def test_repeated_request_replays_the_stored_response(store):
+    service = FakeSubscriptionService()
+    user_id, body = uuid4(), request()
+
+    first = await create(service, user_id, body)
+    replayed = await create(service, user_id, body)
+
+    assert service.calls == 1
+    assert isinstance(replayed, JSONResponse)
+    assert replayed.status_code == 200
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert json.loads(replayed.body) == first.model_dump(mode="json")
+
+
+@pytest.mark.asyncio
+async def test_same_key_for_another_user_is_independent(store):
+    service = FakeSubscriptionService()
+    body = request()
+
+    await create(service, uuid4(), body)
+    await create(service, uuid4(), body)
+
+    assert service.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_key_reused_with_a_different_body_is_rejected(store):
+    service = FakeSubscriptionService()
+    user_id = uuid4()
+    await create(service, user_id, request())
+
+    with pytest.raises(HTTPException) as error:
+        await create(service, user_id, request())
+
+    assert error.value.status_code == 422
+    assert service.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_request_waits_for_the_first_and_replays_it(store):
+    service = FakeSubscriptionService(block=True)
+    user_id, body = uuid4(), request()
+
+    first = asyncio.create_task(create(service, user_id, body))
+    second = asyncio.create_task(create(service, user_id, body))
+    while _token(user_id, "key") not in store._waiters:
+        await asyncio.sleep(0)
+    assert not second.done()
+
+    service.release.set()
+    # Woken by the NOTIFY, well before the 5 s poll interval.
+    response, replayed = await asyncio.wait_for(asyncio.gather(first, second), 1)
+
+    assert service.calls == 1
+    assert json.loads(replayed.body) == response.model_dump(mode="json")
+    assert store._waiters == {}
+
+
+@pytest.mark.asyncio
+async def test_request_still_in_progress_after_the_wait_is_a_conflict():
+    store = FakeIdempotencyStore(wait_seconds=0.05, poll_interval_seconds=0.01)
+    user_id = uuid4()
+    assert await store.begin(user_id, "key", "hash") is None
+
+    with pytest.raises(HTTPException) as error:
+        await store.begin(user_id, "key", "hash")
+
+    assert error.value.status_code == 409
+    assert store._waiters == {}
+
+
+@pytest.mark.asyncio
+async def test_released_key_is_claimed_by_the_waiting_request():
+    store = FakeIdempotencyStore()
+    user_id = uuid4()
+    assert await store.begin(user_id, "key", "hash") is None
+
+    waiter = asyncio.create_task(store.begin(user_id, "key", "hash"))
+    while _token(user_id, "key") not in store._waiters:
+        await asyncio.sleep(0)
+    await store.release(user_id, "key")
+
+    assert await asyncio.wait_for(waiter, 1) is None
+    assert store.keys[(user_id, "key")]["response_status"] is None
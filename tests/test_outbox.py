@@ -0,0 +1,262 @@
+from collections import Counter
+from uuid import uuid4
+
+import pytest
+from aiohttp import ClientResponseError
+from prometheus_client import REGISTRY
+from sqlalchemy import func, select
+
+from app.models.billing_outbox import BillingOutbox, OutboxCommand, OutboxStatus
+from app.models.plan import Plan
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.services import outbox
+from app.services.outbox import OutboxDispatcher, _is_retryable, enqueue_payment
+from app.services.rollups import moved
+
+
+def http_error(status: int) -> ClientResponseError:
+    return ClientResponseError(None, (), status=status, message="billing")
+
+
+class FakeBillingClient:
+    def __init__(self):
+        self.errors: dict = {}
+        self.calls: list = []
+
+    async def create_payment(self, *, idempotency_key, **kwargs):
+        self.calls.append(idempotency_key)
+        if idempotency_key in self.errors:
+            raise self.errors[idempotency_key]
+
+    create_refund = create_payment
+
+
+class FakeRollups:
+    def __init__(self):
+        self.changes: Counter = Counter()
+
+    async def record(self, session, changes):
+        self.changes.update(changes)
+
+
+@pytest.fixture
+def billing():
+    return FakeBillingClient()
+
+
+@pytest.fixture
+def rollups():
+    return FakeRollups()
+
+
+@pytest.fixture
+def dispatcher(monkeypatch, pg_session_factory, billing, rollups):
+    monkeypatch.setattr(outbox, "async_session_factory", pg_session_factory)
+    return OutboxDispatcher(
+        billing,
+        rollups=rollups,
+        batch_size=100,
+        concurrency=10,
+        max_attempts=3,
+        lease_seconds=60,
+        backoff_base_seconds=1,
+        backoff_max_seconds=10,
+        poll_interval_seconds=1,
+    )
+
+
+async def add_subscription(session, status: SubscriptionStatus) -> Subscription:
+    plan = Plan(name=f"plan-{uuid4()}", amount=10, currency="USD", period_days=30)
+    session.add(plan)
+    await session.flush()
+    subscription = Subscription(user_id=uuid4(), plan_id=plan.id, status=status)
+    session.add(subscription)
+    await session.flush()
+    return subscription
+
+
+async def add_payment(session, *, attempts: int = 0, extra_data: dict | None = None) -> BillingOutbox:
+    command = enqueue_payment(
+        session,
+        user_id=uuid4(),
+        amount=10,
+        currency="USD",
+        return_url="http://x/done",
+        extra_data=extra_data,
+    )
+    command.attempts = attempts
+    await session.flush()
+    return command
+
+
+async def delay_seconds(session, command: BillingOutbox) -> float:
+    delay = await session.scalar(
+        select(BillingOutbox.available_at - func.now()).where(BillingOutbox.id == command.id)
+    )
+    return delay.total_seconds()
+
+
+def failed_metric(command: OutboxCommand) -> float:
+    return REGISTRY.get_sample_value(
+        "billing_outbox_failed_total", {"command": command.value}
+    ) or 0
+
+
+@pytest.mark.parametrize(
+    ("error", "retryable"),
+    [
+        (ConnectionError("reset"), True),
+        (http_error(500), True),
+        (http_error(503), True),
+        (http_error(408), True),
+        (http_error(429), True),
+        (http_error(400), False),
+        (http_error(404), False),
+        (http_error(409), False),
+    ],
+)
+def test_only_transient_errors_are_retried(error, retryable):
+    assert _is_retryable(error) is retryable
+
+
+@pytest.mark.asyncio
+async def test_sent_command_is_marked_sent(pg_session, dispatcher, billing):
+    command = await add_payment(pg_session)
+
+    await dispatcher.run_once()
+    await pg_session.refresh(command)
+
+    assert command.id in billing.calls
+    assert command.status == OutboxStatus.SENT
+    assert command.attempts == 1
+    assert command.sent_at is not None
+    assert dispatcher.sent_total >= 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(("attempts", "delay"), [(0, 1), (1, 2), (2, 4)])
+async def test_transient_failure_is_retried_with_backoff(
+    pg_session, dispatcher, billing, attempts, delay
+):
+    dispatcher.max_attempts = 10
+    command = await add_payment(pg_session, attempts=attempts)
+    billing.errors[command.id] = http_error(503)
+
+    await dispatcher.run_once()
+    await pg_session.refresh(command)
+
+    assert command.status == OutboxStatus.PENDING
+    assert command.attempts == attempts + 1
+    assert "503" in command.last_error
+    # now() is frozen for the test transaction, so the delay is exact.
+    assert await delay_seconds(pg_session, command) == delay
+
+
+@pytest.mark.asyncio
+async def test_backoff_is_capped(pg_session, dispatcher, billing):
+    dispatcher.max_attempts = 10
+    command = await add_payment(pg_session, attempts=6)
+    billing.errors[command.id] = ConnectionError("reset")
+
+    await dispatcher.run_once()
+
+    assert await delay_seconds(pg_session, command) == dispatcher.backoff_max_seconds
+
+
+@pytest.mark.asyncio
+async def test_retried_command_is_not_claimed_before_its_backoff(pg_session, dispatcher, billing):
+    command = await add_payment(pg_session)
+    billing.errors[command.id] = http_error(503)
+
+    await dispatcher.run_once()
+    await dispatcher.run_once()
+
+    assert billing.calls.count(command.id) == 1
+
+
+@pytest.mark.asyncio
+async def test_command_fails_after_the_last_attempt(pg_session, dispatcher, billing):
+    before = failed_metric(OutboxCommand.CREATE_PAYMENT)
+    command = await add_payment(pg_session, attempts=dispatcher.max_attempts - 1)
+    billing.errors[command.id] = http_error(503)
+
+    await dispatcher.run_once()
+    await pg_session.refresh(command)
+
+    assert command.status == OutboxStatus.FAILED
+    assert command.attempts == dispatcher.max_attempts
+    assert "503" in command.last_error
+    assert dispatcher.stats()["failed_total"] == {"CREATE_PAYMENT": 1}
+    assert failed_metric(OutboxCommand.CREATE_PAYMENT) == before + 1
+
+
+@pytest.mark.asyncio
+async def test_client_error_fails_on_the_first_attempt(pg_session, dispatcher, billing):
+    command = await add_payment(pg_session)
+    billing.errors[command.id] = http_error(400)
+
+    await dispatcher.run_once()
+    await pg_session.refresh(command)
+
+    assert command.status == OutboxStatus.FAILED
+    assert command.attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_first_payment_cancels_the_unpaid_subscription(
+    pg_session, dispatcher, billing, rollups
+):
+    subscription = await add_subscription(pg_session, SubscriptionStatus.PENDING_PAYMENT)
+    command = await add_payment(
+        pg_session, extra_data={"subscription_id": str(subscription.id)}
+    )
+    billing.errors[command.id] = http_error(400)
+
+    await dispatcher.run_once()
+    await pg_session.refresh(subscription)
+
+    assert subscription.status == SubscriptionStatus.CANCELLED
+    assert rollups.changes == moved(
+        subscription.plan_id,
+        SubscriptionStatus.PENDING_PAYMENT,
+        SubscriptionStatus.CANCELLED,
+    )
+    assert dispatcher.stats()["cancelled_subscriptions_total"] == 1
+
+
+@pytest.mark.asyncio
+async def test_retried_payment_keeps_the_subscription_pending(
+    pg_session, dispatcher, billing, rollups
+):
+    subscription = await add_subscription(pg_session, SubscriptionStatus.PENDING_PAYMENT)
+    command = await add_payment(
+        pg_session, extra_data={"subscription_id": str(subscription.id)}
+    )
+    billing.errors[command.id] = http_error(503)
+
+    await dispatcher.run_once()
+    await pg_session.refresh(subscription)
+
+    assert subscription.status == SubscriptionStatus.PENDING_PAYMENT
+    assert not rollups.changes
+
+
+@pytest.mark.asyncio
+async def test_failed_renewal_leaves_the_subscription_alone(
+    pg_session, dispatcher, billing, rollups
+):
+    subscription = await add_subscription(pg_session, SubscriptionStatus.ACTIVE)
+    command = await add_payment(
+        pg_session,
+        extra_data={"subscription_id": str(subscription.id), "renewal": True},
+    )
+    billing.errors[command.id] = http_error(400)
+
+    await dispatcher.run_once()
+    await pg_session.refresh(subscription)
+    await pg_session.refresh(command)
+
+    assert command.status == OutboxStatus.FAILED
+    assert subscription.status == SubscriptionStatus.ACTIVE
+    assert not rollups.changes
+    assert dispatcher.stats()["cancelled_subscriptions_total"] == 0
@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.billing_client import BillingClient
+from app.services.http_client import http_client
+from app.services.resilience import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+)
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    options = {"failure_threshold": 2, "reset_seconds": 0}
+    return CircuitBreaker("test", **{**options, **kwargs})
+
+
+def make_limiter(limit: int) -> AdaptiveLimiter:
+    return AdaptiveLimiter("test", min_limit=limit, max_limit=limit, latency_tolerance=2)
+
+
+async def queued(limiter: AdaptiveLimiter, count: int = 1) -> None:
+    while len(limiter._waiters) < count:
+        await asyncio.sleep(0)
+
+
+def test_breaker_opens_after_threshold():
+    breaker = make_breaker(reset_seconds=60)
+    breaker.before_call()
+    breaker.on_failure()
+    assert breaker.state == CircuitState.CLOSED
+    breaker.before_call()
+    breaker.on_failure()
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = make_breaker(failure_threshold=1)
+    breaker.on_failure()
+    breaker.before_call()
+    assert breaker.state == CircuitState.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.on_success()
+    assert breaker.state == CircuitState.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = make_breaker(failure_threshold=1, reset_seconds=60)
+    breaker.on_failure()
+    breaker._opened_at -= 60
+    breaker.before_call()
+    breaker.on_failure()
+    assert breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_ignored_probe_frees_the_slot():
+    breaker = make_breaker(failure_threshold=1)
+    breaker.on_failure()
+    breaker.before_call()
+    breaker.on_ignored()
+    breaker.before_call()
+    assert breaker.state == CircuitState.HALF_OPEN
+
+
+@pytest.mark.asyncio
+async def test_limiter_hands_released_slot_to_waiter():
+    limiter = make_limiter(1)
+    started = await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await queued(limiter)
+    limiter.release(started)
+    await asyncio.wait_for(waiter, 1)
+    assert limiter.in_flight == 1
+    assert not limiter._waiters
+
+
+@pytest.mark.asyncio
+async def test_limiter_cancelled_waiter_leaves_no_trace():
+    limiter = make_limiter(1)
+    started = await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await queued(limiter)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.rejected == 1
+    assert not limiter._waiters
+    limiter.release(started)
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_cancelled_after_wakeup_passes_slot_on():
+    limiter = make_limiter(1)
+    started = await limiter.acquire()
+    first = asyncio.create_task(limiter.acquire())
+    second = asyncio.create_task(limiter.acquire())
+    await queued(limiter, 2)
+    # The slot goes to the first waiter, which is cancelled before it runs.
+    limiter.release(started)
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    await asyncio.wait_for(second, 1)
+    assert limiter.in_flight == 1
+
+
+def make_billing(breaker: CircuitBreaker, limiter: AdaptiveLimiter) -> BillingClient:
+    return BillingClient(
+        "http://billing",
+        http_client,
+        timeout_seconds=5,
+        breaker=breaker,
+        limiter=limiter,
+    )
+
+
+@pytest.mark.asyncio
+async def test_probe_cancelled_while_queued_does_not_wedge_the_circuit():
+    breaker = make_breaker(failure_threshold=1)
+    breaker.on_failure()
+    limiter = make_limiter(1)
+    started = await limiter.acquire()
+    billing = make_billing(breaker, limiter)
+
+    probe = asyncio.create_task(billing._post("/api/v1/payment", {}, None))
+    await queued(limiter)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert breaker.state == CircuitState.HALF_OPEN
+    breaker.before_call()
+    limiter.release(started)
+
+
+@pytest.mark.asyncio
+async def test_probe_timed_out_while_queued_is_overloaded_not_failed():
+    breaker = make_breaker(failure_threshold=1)
+    breaker.on_failure()
+    limiter = make_limiter(1)
+    started = await limiter.acquire()
+    billing = make_billing(breaker, limiter)
+    billing.timeout_seconds = 0.01
+
+    with pytest.raises(HTTPException) as error:
+        await billing._post("/api/v1/payment", {}, None)
+
+    assert error.value.status_code == 503
+    assert breaker.state == CircuitState.HALF_OPEN
+    breaker.before_call()
+    limiter.release(started)
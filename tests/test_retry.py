@@ -0,0 +1,231 @@
+import asyncio
+import json
+import time
+from uuid import uuid4
+
+import pytest
+from aiokafka import ConsumerRecord, TopicPartition
+
+from app.kafka import consumer as kafka_consumer
+from app.kafka import retry
+from app.kafka.decoding import decode_event
+from app.kafka.retry import (
+    ATTEMPT_HEADER,
+    ERROR_HEADER,
+    ORIGINAL_TOPIC_HEADER,
+    RETRY_AT_HEADER,
+    RetryRouter,
+    original_topic,
+)
+
+
+PAYMENTS = "payments"
+
+
+class FakeProducer:
+    def __init__(self, log: list, *, fail: bool = False):
+        self.log = log
+        self.fail = fail
+
+    async def send_and_wait(self, topic, value, *, key=None, headers=None):
+        if self.fail:
+            raise ConnectionError("Kafka is down")
+        self.log.append(("send", topic, value, dict(headers or ())))
+
+
+class FakeConsumer:
+    def __init__(self, log: list, batches: dict, stop: asyncio.Event):
+        self.log = log
+        self.batches = batches
+        self.stop = stop
+        self.paused: set[TopicPartition] = set()
+
+    async def getmany(self, *partitions, timeout_ms=0, max_records=None):
+        self.stop.set()
+        batches, self.batches = self.batches, {}
+        return batches
+
+    def highwater(self, tp):
+        return None
+
+    async def commit(self, offsets):
+        self.log.append(("commit", offsets))
+
+    def seek(self, tp, offset):
+        self.log.append(("seek", tp, offset))
+
+    def pause(self, *partitions):
+        self.paused.update(partitions)
+
+    def assignment(self):
+        return set()
+
+
+def make_router(log: list, **kwargs) -> RetryRouter:
+    router = RetryRouter(
+        "kafka:9092",
+        retry_topic_prefix="retry",
+        delays_seconds=[10, 60],
+        dead_letter_topic="dlq",
+    )
+    router._producer = FakeProducer(log, **kwargs)
+    return router
+
+
+def message(
+    value: bytes | None,
+    *,
+    topic: str = PAYMENTS,
+    offset: int = 0,
+    headers: dict[str, str] | None = None,
+) -> ConsumerRecord:
+    return ConsumerRecord(
+        topic=topic,
+        partition=0,
+        offset=offset,
+        timestamp=0,
+        timestamp_type=0,
+        key=None,
+        value=value,
+        checksum=None,
+        serialized_key_size=0,
+        serialized_value_size=len(value or b""),
+        headers=[(key, item.encode()) for key, item in (headers or {}).items()],
+    )
+
+
+def payment() -> bytes:
+    return json.dumps({"id": str(uuid4()), "status": "succeeded"}).encode()
+
+
+@pytest.mark.asyncio
+async def test_first_failure_goes_to_the_first_retry_topic():
+    log: list = []
+    await make_router(log).reroute(message(b"{}"), "boom")
+
+    [(_, topic, value, headers)] = log
+    assert topic == "retry.10s"
+    assert value == b"{}"
+    assert headers[ORIGINAL_TOPIC_HEADER] == PAYMENTS.encode()
+    assert headers[ATTEMPT_HEADER] == b"1"
+    assert headers[ERROR_HEADER] == b"boom"
+    assert float(headers[RETRY_AT_HEADER]) > time.time() + 9
+
+
+@pytest.mark.asyncio
+async def test_retried_message_keeps_its_original_topic():
+    log: list = []
+    msg = message(
+        b"{}",
+        topic="retry.10s",
+        headers={ORIGINAL_TOPIC_HEADER: PAYMENTS, ATTEMPT_HEADER: "1"},
+    )
+    await make_router(log).reroute(msg, "boom")
+
+    [(_, topic, _, headers)] = log
+    assert topic == "retry.60s"
+    assert headers[ORIGINAL_TOPIC_HEADER] == PAYMENTS.encode()
+    assert headers[ATTEMPT_HEADER] == b"2"
+
+
+@pytest.mark.asyncio
+async def test_dead_letters_after_the_last_delay():
+    log: list = []
+    msg = message(
+        b"{}",
+        topic="retry.60s",
+        headers={ORIGINAL_TOPIC_HEADER: PAYMENTS, ATTEMPT_HEADER: "2"},
+    )
+    await make_router(log).reroute(msg, "boom")
+
+    [(_, topic, _, headers)] = log
+    assert topic == "dlq"
+    assert headers[ATTEMPT_HEADER] == b"3"
+    assert RETRY_AT_HEADER not in headers
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("value", [b"not json", b'{"status": "succeeded"}', None])
+async def test_undecodable_message_goes_straight_to_the_dead_letter_topic(value):
+    log: list = []
+    msg = message(value)
+    await make_router(log).handle(msg, decode_event(msg.topic, msg.value))
+
+    [(_, topic, _, headers)] = log
+    assert topic == "dlq"
+    assert headers[ATTEMPT_HEADER] == b"1"
+
+
+@pytest.mark.asyncio
+async def test_due_retry_is_handled_against_its_original_topic(monkeypatch):
+    handled = []
+
+    async def handle_event(event):
+        handled.append(event.id)
+
+    monkeypatch.setattr(retry, "handle_event", handle_event)
+    log: list = []
+    tp = TopicPartition("retry.10s", 0)
+    due = message(
+        payment(),
+        topic=tp.topic,
+        offset=5,
+        headers={ORIGINAL_TOPIC_HEADER: PAYMENTS, RETRY_AT_HEADER: str(time.time() - 1)},
+    )
+    waiting = message(
+        payment(),
+        topic=tp.topic,
+        offset=6,
+        headers={ORIGINAL_TOPIC_HEADER: PAYMENTS, RETRY_AT_HEADER: str(time.time() + 60)},
+    )
+    consumer = FakeConsumer(log, {}, asyncio.Event())
+
+    await make_router(log).process_retries(consumer, tp, [due, waiting])
+
+    assert original_topic(due) == PAYMENTS
+    assert len(handled) == 1
+    assert log == [("seek", tp, 6), ("commit", {tp: 6})]
+    assert consumer.paused == {tp}
+
+
+async def consume_failed_batch(monkeypatch, log: list, router: RetryRouter, messages):
+    async def process_batch(events):
+        raise RuntimeError("Batch failed")
+
+    failing = {json.loads(msg.value)["id"] for msg in messages[:1]}
+
+    async def handle_event(event):
+        if str(event.id) in failing:
+            raise RuntimeError("Event failed")
+
+    monkeypatch.setattr(kafka_consumer, "process_batch", process_batch)
+    monkeypatch.setattr(kafka_consumer, "REROUTE_FAILURE_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(retry, "handle_event", handle_event)
+    stop = asyncio.Event()
+    tp = TopicPartition(PAYMENTS, 0)
+    consumer = FakeConsumer(log, {tp: messages}, stop)
+    await kafka_consumer._consume_batches(consumer, router, stop)
+    return tp
+
+
+@pytest.mark.asyncio
+async def test_per_event_fallback_commits_after_rerouting(monkeypatch):
+    log: list = []
+    messages = [message(payment(), offset=offset) for offset in (10, 11)]
+
+    tp = await consume_failed_batch(monkeypatch, log, make_router(log), messages)
+
+    assert [entry[0] for entry in log] == ["send", "commit"]
+    assert log[0][1] == "retry.10s"
+    assert log[0][2] == messages[0].value
+    assert log[1] == ("commit", {tp: 12})
+
+
+@pytest.mark.asyncio
+async def test_per_event_fallback_does_not_commit_when_rerouting_fails(monkeypatch):
+    log: list = []
+    messages = [message(payment(), offset=offset) for offset in (10, 11)]
+
+    tp = await consume_failed_batch(monkeypatch, log, make_router(log, fail=True), messages)
+
+    assert log == [("seek", tp, 10)]
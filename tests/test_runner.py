@@ -0,0 +1,58 @@
+import time
+
+from app.kafka.runner import ConsumerSupervisor
+
+
+class FakeProcess:
+    pid = 4242
+
+    def __init__(self):
+        self.signals: list[str] = []
+
+    def is_alive(self):
+        return True
+
+    def terminate(self):
+        self.signals.append("terminate")
+
+    def kill(self):
+        self.signals.append("kill")
+
+
+def make_supervisor() -> tuple[ConsumerSupervisor, FakeProcess]:
+    supervisor = ConsumerSupervisor(
+        1, shutdown_timeout_seconds=10, heartbeat_timeout_seconds=30
+    )
+    child = FakeProcess()
+    supervisor._children[0] = child
+    return supervisor, child
+
+
+def test_process_with_a_fresh_heartbeat_is_left_alone():
+    supervisor, child = make_supervisor()
+    supervisor._heartbeats[0] = time.time() - 5
+
+    supervisor._stop_if_hung(0, child)
+
+    assert child.signals == []
+
+
+def test_process_without_heartbeats_is_terminated_once():
+    supervisor, child = make_supervisor()
+    supervisor._heartbeats[0] = time.time() - 60
+
+    supervisor._stop_if_hung(0, child)
+    supervisor._stop_if_hung(0, child)
+
+    assert child.signals == ["terminate"]
+
+
+def test_process_ignoring_terminate_is_killed_after_the_shutdown_timeout():
+    supervisor, child = make_supervisor()
+    supervisor._heartbeats[0] = time.time() - 60
+    supervisor._stop_if_hung(0, child)
+
+    supervisor._stopping_since[0] = time.monotonic() - 11
+    supervisor._stop_if_hung(0, child)
+
+    assert child.signals == ["terminate", "kill"]
@@ -0,0 +1,116 @@
+import base64
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.subscriptions import _decode_cursor, _encode_cursor, list_subscriptions
+from app.models.plan import Plan
+from app.models.subscription import Subscription, SubscriptionStatus
+
+
+def encode(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def test_cursor_round_trip():
+    subscription = Subscription(
+        id=uuid4(),
+        created_at=datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    )
+
+    assert _decode_cursor(_encode_cursor(subscription)) == (
+        subscription.created_at,
+        subscription.id,
+    )
+
+
+def test_cursor_is_normalised_to_utc():
+    subscription_id = uuid4()
+    created_at, decoded_id = _decode_cursor(
+        encode(f"2025-03-01T15:30:00+03:00|{subscription_id}")
+    )
+
+    assert created_at == datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc)
+    assert created_at.utcoffset() == timedelta(0)
+    assert decoded_id == subscription_id
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "not base64!",
+        encode("2025-03-01T12:00:00+00:00"),
+        encode(f"2025-03-01T12:00:00+00:00|{uuid4()}|extra"),
+        encode(f"yesterday|{uuid4()}"),
+        encode("2025-03-01T12:00:00+00:00|not-a-uuid"),
+        encode(f"2025-03-01T12:00:00|{uuid4()}"),
+        encode(f"0001-01-01T00:00:00+14:00|{uuid4()}"),
+        base64.urlsafe_b64encode(b"\xff\xfe|\x00").decode(),
+    ],
+)
+def test_tampered_cursor_is_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor)
+
+    assert error.value.status_code == 400
+
+
+async def add_subscriptions(session, user_id: UUID, created: list[datetime]) -> list[UUID]:
+    plan = Plan(name=f"plan-{uuid4()}", amount=10, currency="USD", period_days=30)
+    session.add(plan)
+    await session.flush()
+    subscriptions = [
+        Subscription(
+            id=uuid4(),
+            user_id=user_id,
+            plan_id=plan.id,
+            status=SubscriptionStatus.ACTIVE,
+            created_at=created_at,
+        )
+        for created_at in created
+    ]
+    session.add_all(subscriptions)
+    await session.flush()
+    ordered = sorted(subscriptions, key=lambda sub: (sub.created_at, sub.id), reverse=True)
+    return [sub.id for sub in ordered]
+
+
+@pytest.mark.asyncio
+async def test_pages_follow_the_keyset_order_across_boundaries(pg_session):
+    user_id = uuid4()
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    # Several rows share a created_at, so the id has to break ties at a page edge.
+    created = [start, start, start, start + timedelta(seconds=1), start - timedelta(days=1)]
+    expected = await add_subscriptions(pg_session, user_id, created)
+    await add_subscriptions(pg_session, uuid4(), [start])
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = await list_subscriptions(
+            status=None, cursor=cursor, limit=2, user_id=user_id, session=pg_session
+        )
+        seen += [item.id for item in page.items]
+        pages += 1
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == 3
+
+
+@pytest.mark.asyncio
+async def test_last_full_page_has_no_cursor(pg_session):
+    user_id = uuid4()
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    await add_subscriptions(pg_session, user_id, [start, start + timedelta(hours=1)])
+
+    page = await list_subscriptions(
+        status=None, cursor=None, limit=2, user_id=user_id, session=pg_session
+    )
+
+    assert len(page.items) == 2
+    assert page.next_cursor is None